@@ -0,0 +1,312 @@
+"""
+Module du pool de connexions MySQL partagé
+
+Un seul pool par processus : les connexions sont réutilisées d'une requête à
+l'autre au lieu d'un `pymysql.connect` (connexion TCP + authentification) par
+fonction. Le nombre de connexions est borné, une connexion inactive depuis un
+moment est vérifiée (ping) avant d'être prêtée, et une connexion trop ancienne
+est remplacée. La durée de chaque requête est mesurée (par verbe et table).
+
+    with db_connection() as conn:
+        df = pd.read_sql(query, conn)
+
+La transaction en cours est annulée au retour de la connexion dans le pool :
+les écritures doivent être validées par `conn.commit()`. `connect` permet de
+remplacer pymysql (par exemple par sqlite3 pour un essai local).
+
+Les écritures en masse passent par `bulk_upsert` : des INSERT multi-lignes
+(... ON DUPLICATE KEY UPDATE) par tranches de MYSQL_BULK_CHUNK_SIZE lignes.
+"""
+import logging
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pymysql
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+logger = logging.getLogger(__name__)
+
+_QUERY_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?)\s+`?(\w+)', re.IGNORECASE)
+
+
+class PoolTimeoutError(RuntimeError):
+    """Aucune connexion libérée dans le délai imparti"""
+
+
+def _quote(name):
+    return f"`{name}`"
+
+
+def query_name(sql):
+    """Nom de métrique d'une requête : verbe et première table ('SELECT utilisateurs')"""
+    words = sql.split(None, 1)
+    if not words:
+        return "?"
+    match = _QUERY_TABLE.search(sql)
+    return f"{words[0].upper()} {match.group(1)}" if match else words[0].upper()
+
+
+class _TimedCursor:
+    """Curseur dont les requêtes sont chronométrées par le pool"""
+
+    def __init__(self, cursor, pool):
+        self._cursor = cursor
+        self._pool = pool
+
+    def _timed(self, method, sql, *args):
+        start = time.perf_counter()
+        try:
+            result = method(sql, *args)
+        except Exception:
+            self._pool._record_query(query_name(sql), time.perf_counter() - start, error=True)
+            raise
+        self._pool._record_query(query_name(sql), time.perf_counter() - start)
+        return result
+
+    def execute(self, sql, *args):
+        return self._timed(self._cursor.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._timed(self._cursor.executemany, sql, *args)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _PooledConnection:
+    """Connexion prêtée par le pool (les curseurs sont chronométrés)"""
+
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self._conn.cursor(*args, **kwargs), self._pool)
+
+    def close(self):
+        # La connexion est rendue au pool à la sortie du bloc `with`
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class MySQLPool:
+    """Pool borné de connexions MySQL : vérification, recyclage et métriques"""
+
+    def __init__(self, connect_kwargs, max_size=5, recycle=3600, ping_interval=30, timeout=10, connect=None):
+        self.connect_kwargs = dict(connect_kwargs)
+        self.max_size = max_size
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self._connect = connect or pymysql.connect
+
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = deque()  # (connexion, créée à, rendue à)
+        self._lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'discarded': 0,
+            'wait_time_total': 0.0,
+        }
+        self._queries = {}  # nom -> {calls, errors, time_total, time_max}
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def _record_query(self, name, duration, error=False):
+        with self._lock:
+            metrics = self._queries.setdefault(name, {'calls': 0, 'errors': 0, 'time_total': 0.0, 'time_max': 0.0})
+            metrics['calls'] += 1
+            metrics['time_total'] += duration
+            metrics['time_max'] = max(metrics['time_max'], duration)
+            if error:
+                metrics['errors'] += 1
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _alive(self, conn):
+        try:
+            if hasattr(conn, "ping"):
+                conn.ping(reconnect=False)
+            else:
+                conn.cursor().execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def _checkout(self):
+        """(connexion, date de création) : connexion inactive vérifiée, sinon nouvelle"""
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, created, released = self._idle.pop()
+            if now - created > self.recycle:
+                self._count('recycled')
+                self._close_quietly(conn)
+                continue
+            if now - released > self.ping_interval and not self._alive(conn):
+                self._count('ping_failures')
+                self._close_quietly(conn)
+                continue
+            self._count('reused')
+            return conn, created
+
+        self._count('created')
+        return self._connect(**self.connect_kwargs), time.monotonic()
+
+    @contextmanager
+    def connection(self):
+        """Prête une connexion pour la durée du bloc `with`"""
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeoutError(f"Aucune connexion MySQL disponible après {self.timeout}s "
+                                   f"({self.max_size} connexions utilisées)")
+        conn = None
+        try:
+            self._count('checkouts')
+            self._count('wait_time_total', time.monotonic() - start)
+            conn, created = self._checkout()
+            try:
+                yield _PooledConnection(conn, self)
+            finally:
+                # Fin de la transaction en cours ; une connexion en erreur n'est pas réutilisée
+                try:
+                    conn.rollback()
+                except Exception:
+                    self._count('discarded')
+                    self._close_quietly(conn)
+                else:
+                    with self._lock:
+                        self._idle.append((conn, created, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Ferme les connexions inactives"""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+
+    def get_stats(self):
+        """Compteurs du pool et durées par requête"""
+        with self._lock:
+            stats = dict(self._stats)
+            queries = {name: dict(metrics) for name, metrics in self._queries.items()}
+            stats['idle'] = len(self._idle)
+        for metrics in queries.values():
+            metrics['time_avg'] = metrics['time_total'] / metrics['calls'] if metrics['calls'] else 0.0
+        stats['queries'] = queries
+        stats['max_size'] = self.max_size
+        stats['hit_rate'] = stats['reused'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+
+def bulk_upsert(conn, table, columns, rows, key_columns=(), update_columns=(), constants=None,
+                touch_column=None, chunk_size=None):
+    """Écrit `rows` par INSERT multi-lignes ; retourne {"inserted", "updated", "unchanged"}
+
+    `key_columns` : clé unique de la table (lignes en double : la dernière est
+    gardée) ; `update_columns` : colonnes mises à jour si la clé existe déjà
+    (ON DUPLICATE KEY UPDATE) ; `constants` : {colonne: expression SQL} ajoutées
+    à l'insertion seulement ; `touch_column` : date passée à NOW() uniquement si
+    une colonne de `update_columns` a changé. Rien n'est validé : l'appelant fait
+    `conn.commit()`, toutes les tranches sont dans la même transaction.
+    """
+    constants = constants or {}
+    chunk_size = max(1, chunk_size or getattr(config, 'MYSQL_BULK_CHUNK_SIZE', 1000))
+    rows = [tuple(row) for row in rows]
+    key_indexes = [columns.index(column) for column in key_columns]
+    if key_indexes:
+        rows = list({tuple(row[i] for i in key_indexes): row for row in rows}.values())
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    if not rows:
+        return counts
+
+    row_sql = "(" + ", ".join(["%s"] * len(columns) + list(constants.values())) + ")"
+    insert_sql = (f"INSERT INTO {_quote(table)} ({', '.join(_quote(c) for c in list(columns) + list(constants))}) "
+                  "VALUES ")
+    assignments = []
+    if touch_column and update_columns:
+        # En premier : MySQL applique les affectations dans l'ordre
+        same = " AND ".join(f"{_quote(c)} <=> VALUES({_quote(c)})" for c in update_columns)
+        assignments.append(f"{_quote(touch_column)} = IF({same}, {_quote(touch_column)}, NOW())")
+    assignments += [f"{_quote(c)} = VALUES({_quote(c)})" for c in update_columns]
+    update_sql = f" ON DUPLICATE KEY UPDATE {', '.join(assignments)}" if assignments else ""
+
+    cursor = conn.cursor()
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        existing = 0
+        if assignments and key_indexes:
+            # Lignes de la tranche déjà présentes : distingue insertions et mises à jour
+            key_sql = "(" + ", ".join(_quote(c) for c in key_columns) + ")"
+            key_row = "(" + ", ".join(["%s"] * len(key_columns)) + ")"
+            cursor.execute(f"SELECT COUNT(*) FROM {_quote(table)} WHERE {key_sql} IN ({', '.join([key_row] * len(chunk))})",
+                           [row[i] for row in chunk for i in key_indexes])
+            existing = cursor.fetchone()[0]
+        cursor.execute(insert_sql + ", ".join([row_sql] * len(chunk)) + update_sql,
+                       [value for row in chunk for value in row])
+        # Lignes affectées par MySQL : 1 par insertion, 2 par mise à jour, 0 si inchangée
+        inserted = len(chunk) - existing
+        updated = max(0, cursor.rowcount - inserted) // 2
+        counts["inserted"] += inserted
+        counts["updated"] += updated
+        counts["unchanged"] += existing - updated
+    cursor.close()
+    return counts
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    """Retourne le pool MySQL partagé par tout le processus"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = MySQLPool(
+                config.MYSQL_CONFIG,
+                max_size=getattr(config, 'MYSQL_POOL_SIZE', 5),
+                recycle=getattr(config, 'MYSQL_POOL_RECYCLE', 3600),
+                ping_interval=getattr(config, 'MYSQL_POOL_PING_INTERVAL', 30),
+                timeout=getattr(config, 'MYSQL_POOL_TIMEOUT', 10),
+            )
+        return _pool
+
+
+def db_connection():
+    """Connexion du pool partagé (context manager)"""
+    return get_db_pool().connection()
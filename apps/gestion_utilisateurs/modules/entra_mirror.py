@@ -0,0 +1,241 @@
+"""
+Module du miroir local des groupes (et utilisateurs) Entra ID
+
+Les groupes sont copiés dans une base SQLite locale et tenus à jour par les
+requêtes delta de Microsoft Graph (`/groups/delta`, `/users/delta`) : seul le
+premier chargement transfère la liste complète, les suivants ne rapportent que
+les objets modifiés ou supprimés depuis le dernier jeton delta. Les pages du
+portail lisent ensuite la base locale.
+"""
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+from .graph_client import get_graph_client, GraphError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIRROR_DB_PATH = "/home/streamlit/data/entra_mirror.db"
+
+RESOURCES = {
+    "groups": {
+        "table": "entra_groups",
+        "path": "/groups/delta",
+        "select": "id,displayName,description,groupTypes,membershipRule,securityEnabled,mailEnabled",
+    },
+    "users": {
+        "table": "entra_users",
+        "path": "/users/delta",
+        "select": "id,userPrincipalName,displayName,givenName,surname,mail,accountEnabled",
+    },
+}
+
+# Codes d'erreur Graph signalant un jeton delta expiré (HTTP 410) : resynchronisation complète
+RESYNC_ERROR_CODES = ("syncStateNotFound", "resyncRequired", "syncStateInvalid")
+
+_sync_lock = threading.Lock()
+
+
+def _db_path():
+    return getattr(config, 'ENTRA_MIRROR_DB_PATH', DEFAULT_MIRROR_DB_PATH)
+
+
+def _connect():
+    path = _db_path()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode = WAL")
+    for resource in RESOURCES.values():
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {resource['table']} (
+            id TEXT PRIMARY KEY,
+            display_name TEXT,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS delta_state (
+        resource TEXT PRIMARY KEY,
+        delta_link TEXT,
+        last_sync REAL,
+        last_full_sync REAL,
+        last_changes INTEGER DEFAULT 0
+    )
+    """)
+    return conn
+
+
+def _is_resync_error(error):
+    if error.status_code == 410:
+        return True
+    code = ((error.payload or {}).get("error") or {}).get("code", "")
+    return code in RESYNC_ERROR_CODES
+
+
+def _fetch_delta(client, url, params=None):
+    """Parcourt les pages delta ; retourne (objets modifiés, lien delta final)"""
+    items = []
+    while True:
+        data = client.get(url, params=params)
+        items.extend(data.get("value", []))
+        if data.get("@odata.nextLink"):
+            url, params = data["@odata.nextLink"], None
+            continue
+        return items, data.get("@odata.deltaLink")
+
+
+def sync_resource(resource="groups", client=None, full=False):
+    """Applique les changements delta d'une ressource au miroir local
+
+    Retourne un dictionnaire {changes, removed, full}. Sans jeton delta enregistré
+    (ou si Graph l'a expiré), la ressource est entièrement rechargée.
+    """
+    spec = RESOURCES[resource]
+    client = client or get_graph_client()
+
+    with _sync_lock:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT delta_link FROM delta_state WHERE resource = ?", (resource,)).fetchone()
+            delta_link = None if full or not row else row[0]
+
+            try:
+                if delta_link:
+                    items, new_delta_link = _fetch_delta(client, delta_link)
+                else:
+                    items, new_delta_link = _fetch_delta(client, spec["path"], {"$select": spec["select"]})
+            except GraphError as e:
+                if not delta_link or not _is_resync_error(e):
+                    raise
+                logger.warning(f"Miroir Entra {resource}: jeton delta expiré, resynchronisation complète")
+                delta_link = None
+                items, new_delta_link = _fetch_delta(client, spec["path"], {"$select": spec["select"]})
+
+            full_sync = delta_link is None
+            now = time.time()
+            removed = 0
+            with conn:
+                if full_sync:
+                    conn.execute(f"DELETE FROM {spec['table']}")
+                existing = {}
+                if not full_sync:
+                    ids = [item["id"] for item in items if item.get("id")]
+                    for start in range(0, len(ids), 500):
+                        chunk = ids[start:start + 500]
+                        existing.update(conn.execute(
+                            f"SELECT id, data FROM {spec['table']} WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                        ).fetchall())
+
+                merged = {}
+                for item in items:
+                    item_id = item.get("id")
+                    if not item_id:
+                        continue
+                    if "@removed" in item:
+                        conn.execute(f"DELETE FROM {spec['table']} WHERE id = ?", (item_id,))
+                        merged.pop(item_id, None)
+                        existing.pop(item_id, None)
+                        removed += 1
+                        continue
+                    # Une réponse delta peut ne contenir que les propriétés modifiées
+                    data = merged.get(item_id) or (json.loads(existing[item_id]) if item_id in existing else {})
+                    data.update({key: value for key, value in item.items() if not key.startswith("@")})
+                    merged[item_id] = data
+
+                upserts = [(item_id, data.get("displayName"), json.dumps(data, ensure_ascii=False), now)
+                           for item_id, data in merged.items()]
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {spec['table']} (id, display_name, data, updated_at) VALUES (?, ?, ?, ?)",
+                    upserts
+                )
+                conn.execute("""
+                INSERT INTO delta_state (resource, delta_link, last_sync, last_full_sync, last_changes)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(resource) DO UPDATE SET
+                    delta_link = excluded.delta_link,
+                    last_sync = excluded.last_sync,
+                    last_full_sync = COALESCE(excluded.last_full_sync, delta_state.last_full_sync),
+                    last_changes = excluded.last_changes
+                """, (resource, new_delta_link, now, now if full_sync else None, len(items)))
+        finally:
+            conn.close()
+
+    logger.info(f"Miroir Entra {resource}: {len(items)} changement(s) appliqué(s)"
+                f"{' (chargement complet)' if full_sync else ''}")
+    return {"changes": len(items), "removed": removed, "full": full_sync}
+
+
+def ensure_fresh(resource="groups", max_age=None):
+    """Synchronise la ressource si le miroir date de plus de `max_age` secondes
+
+    En cas d'échec Graph, les données locales existantes restent utilisées ;
+    l'erreur n'est propagée que si le miroir est encore vide.
+    """
+    if max_age is None:
+        max_age = getattr(config, 'ENTRA_MIRROR_MAX_AGE', 300)
+    status = get_mirror_status().get(resource, {})
+    if status.get("last_sync") and time.time() - status["last_sync"] < max_age:
+        return None
+    try:
+        return sync_resource(resource)
+    except GraphError as e:
+        if not status.get("last_sync"):
+            raise
+        logger.error(f"Miroir Entra {resource}: synchronisation impossible, données locales conservées: {e}")
+        return None
+
+
+def _read_all(resource):
+    conn = _connect()
+    try:
+        rows = conn.execute(f"SELECT data FROM {RESOURCES[resource]['table']} ORDER BY display_name").fetchall()
+    finally:
+        conn.close()
+    return [json.loads(row[0]) for row in rows]
+
+
+def get_groups():
+    """Groupes Entra ID du miroir local (triés par nom)"""
+    return _read_all("groups")
+
+
+def get_users():
+    """Utilisateurs Entra ID du miroir local (si ENTRA_MIRROR_USERS est activé)"""
+    return _read_all("users")
+
+
+def get_mirror_status():
+    """État du miroir par ressource : last_sync, last_full_sync, last_changes, count"""
+    conn = _connect()
+    try:
+        status = {}
+        for resource, spec in RESOURCES.items():
+            row = conn.execute(
+                "SELECT last_sync, last_full_sync, last_changes FROM delta_state WHERE resource = ?", (resource,)
+            ).fetchone()
+            count = conn.execute(f"SELECT COUNT(*) FROM {spec['table']}").fetchone()[0]
+            status[resource] = {
+                "last_sync": row[0] if row else None,
+                "last_full_sync": row[1] if row else None,
+                "last_changes": row[2] if row else 0,
+                "count": count,
+            }
+    finally:
+        conn.close()
+    return status
+
+
+def mirrored_resources():
+    """Ressources tenues à jour : les groupes, et les utilisateurs si ENTRA_MIRROR_USERS"""
+    return ["groups", "users"] if getattr(config, 'ENTRA_MIRROR_USERS', False) else ["groups"]
@@ -0,0 +1,170 @@
+"""
+Module des vérifications Entra ID groupées via Microsoft Graph `/$batch`
+
+Recherche de groupes par nom ou par identifiant, nombre de membres, licences
+attribuées et existence de comptes : chaque vérification est une sous-requête,
+et 20 sous-requêtes partent dans un seul appel HTTP au lieu d'un appel par
+élément ou d'un chargement de la liste complète des groupes.
+"""
+import base64
+import logging
+from urllib.parse import quote
+
+from .graph_client import get_graph_client
+
+logger = logging.getLogger(__name__)
+
+GROUP_SELECT = "id,displayName,description,groupTypes,securityEnabled,mailEnabled,assignedLicenses"
+
+
+def group_type(group):
+    """Type lisible d'un groupe Entra ID (Microsoft 365, Sécurité, Distribution...)"""
+    group_types = group.get("groupTypes") or []
+    security_enabled = bool(group.get("securityEnabled", False))
+    mail_enabled = bool(group.get("mailEnabled", False))
+    if "Unified" in group_types:
+        return "Microsoft 365"
+    if security_enabled and not mail_enabled:
+        return "Sécurité"
+    if mail_enabled and not security_enabled:
+        return "Distribution"
+    if security_enabled and mail_enabled:
+        return "Sécurité avec messagerie"
+    return "Autre"
+
+
+def _odata_string(value):
+    """Littéral chaîne OData (apostrophes doublées)"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _body_json(result):
+    if result and 200 <= result["status"] < 300 and isinstance(result["body"], dict):
+        return result["body"]
+    return None
+
+
+def _body_int(result):
+    """Valeur numérique d'une réponse texte ($count), éventuellement encodée en base64"""
+    if not result or not 200 <= result["status"] < 300 or result["body"] is None:
+        return None
+    body = result["body"]
+    try:
+        return int(body)
+    except (TypeError, ValueError):
+        try:
+            return int(base64.b64decode(body).decode("ascii"))
+        except Exception:
+            return None
+
+
+def _group_by_name_request(name):
+    expression = quote(f"displayName eq {_odata_string(name)}", safe="")
+    return {"method": "GET", "url": f"/groups?$filter={expression}&$select={GROUP_SELECT}"}
+
+
+def _group_by_id_request(group_id):
+    return {"method": "GET", "url": f"/groups/{quote(str(group_id), safe='')}?$select={GROUP_SELECT}"}
+
+
+def _member_count_request(group_id):
+    return {"method": "GET", "url": f"/groups/{quote(str(group_id), safe='')}/members/$count",
+            "headers": {"ConsistencyLevel": "eventual"}}
+
+
+def find_groups_by_name(names, client=None):
+    """Recherche des groupes par nom exact : {nom: groupe ou None}"""
+    client = client or get_graph_client()
+    names = list(dict.fromkeys(names))
+    results = client.batch([_group_by_name_request(name) for name in names])
+    found = {}
+    for name, result in zip(names, results):
+        body = _body_json(result)
+        matches = body.get("value", []) if body else []
+        found[name] = matches[0] if matches else None
+    return found
+
+
+def get_groups_by_id(group_ids, client=None):
+    """Lecture de groupes par identifiant : {id: groupe ou None (introuvable)}"""
+    client = client or get_graph_client()
+    group_ids = list(dict.fromkeys(group_ids))
+    results = client.batch([_group_by_id_request(group_id) for group_id in group_ids])
+    return {group_id: _body_json(result) for group_id, result in zip(group_ids, results)}
+
+
+def group_member_counts(group_ids, client=None):
+    """Nombre de membres de chaque groupe : {id: nombre ou None}"""
+    client = client or get_graph_client()
+    group_ids = list(dict.fromkeys(group_ids))
+    results = client.batch([_member_count_request(group_id) for group_id in group_ids])
+    return {group_id: _body_int(result) for group_id, result in zip(group_ids, results)}
+
+
+def users_exist(user_principal_names, client=None):
+    """Existence de comptes Entra ID : {UPN: True / False, ou None si la vérification a échoué}"""
+    client = client or get_graph_client()
+    upns = list(dict.fromkeys(upn.strip() for upn in user_principal_names if upn and upn.strip()))
+    results = client.batch([
+        {"method": "GET", "url": f"/users/{quote(upn, safe='@')}?$select=id"} for upn in upns
+    ])
+    existence = {}
+    for upn, result in zip(upns, results):
+        if result and 200 <= result["status"] < 300:
+            existence[upn] = True
+        elif result and result["status"] == 404:
+            existence[upn] = False
+        else:
+            existence[upn] = None
+    return existence
+
+
+def check_configured_groups(configured_groups, client=None):
+    """Vérifie les groupes de licences configurés en deux appels `/$batch`
+
+    `configured_groups` : {nom: identifiant attendu ou None}. Le premier lot
+    recherche chaque groupe par nom (et par identifiant s'il est connu), le
+    second compte les membres des groupes trouvés. Retourne une liste de
+    dictionnaires : name, found, id, expected_id, id_match, groupType, members,
+    sku_ids.
+    """
+    client = client or get_graph_client()
+    names = list(configured_groups)
+    expected_ids = [group_id for group_id in configured_groups.values() if group_id]
+
+    lookups = [_group_by_name_request(name) for name in names] + \
+              [_group_by_id_request(group_id) for group_id in expected_ids]
+    results = client.batch(lookups)
+
+    by_name = {}
+    for name, result in zip(names, results[:len(names)]):
+        body = _body_json(result)
+        matches = body.get("value", []) if body else []
+        by_name[name] = matches[0] if matches else None
+    by_id = {group_id: _body_json(result) for group_id, result in zip(expected_ids, results[len(names):])}
+
+    groups = {}
+    for name in names:
+        expected_id = configured_groups[name]
+        # Le groupe référencé par son identifiant fait foi s'il existe (il a pu être renommé)
+        groups[name] = by_id.get(expected_id) if expected_id and by_id.get(expected_id) else by_name[name]
+
+    counts = group_member_counts([group["id"] for group in groups.values() if group], client=client)
+
+    report = []
+    for name in names:
+        group = groups[name]
+        expected_id = configured_groups[name]
+        report.append({
+            "name": name,
+            "found": group is not None,
+            "id": group["id"] if group else None,
+            "displayName": group.get("displayName") if group else None,
+            "expected_id": expected_id,
+            "id_match": (group["id"] == expected_id) if group and expected_id else None,
+            "groupType": group_type(group) if group else None,
+            "members": counts.get(group["id"]) if group else None,
+            "sku_ids": [lic.get("skuId") for lic in (group.get("assignedLicenses") or [])] if group else [],
+        })
+    logger.info(f"Vérification de {len(names)} groupes configurés via $batch")
+    return report
@@ -0,0 +1,332 @@
+"""
+Module du client Microsoft Graph partagé
+
+Un seul client par processus : le jeton MSAL est conservé jusqu'à son expiration,
+les requêtes passent par une `requests.Session` (connexions HTTP maintenues),
+la pagination `@odata.nextLink` est suivie automatiquement et les réponses 429/503
+sont rejouées après le délai `Retry-After`. Des métriques de latence sont tenues
+par point d'accès. Les vérifications portant sur de nombreux objets passent par
+`/$batch` (20 sous-requêtes par appel HTTP).
+"""
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from msal import ConfidentialClientApplication
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
+DEFAULT_AUTHORITY_HOST = "https://login.microsoftonline.com"
+GRAPH_SCOPES = ["https://graph.microsoft.com/.default"]
+
+# Renouveler le jeton un peu avant son expiration
+TOKEN_REFRESH_MARGIN = 300
+RETRY_STATUSES = (429, 502, 503, 504)
+# Limite imposée par Microsoft Graph pour une requête /$batch
+MAX_BATCH_SIZE = 20
+
+_ID_SEGMENT = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$|^\d+$")
+
+
+class GraphError(requests.RequestException):
+    """Erreur renvoyée par Microsoft Graph (ou jeton impossible à obtenir)"""
+
+    def __init__(self, message, status_code=None, payload=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.payload = payload
+
+
+def endpoint_name(method, url):
+    """Nom de métrique d'une requête : 'GET /groups/{id}/members' (identifiants masqués)"""
+    path = urlsplit(url).path
+    segments = ["{id}" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/") if segment]
+    # Retirer le préfixe de version (v1.0 / beta)
+    if segments and segments[0] in ("v1.0", "beta"):
+        segments = segments[1:]
+    return f"{method.upper()} /{'/'.join(segments)}"
+
+
+def _batch_item(index, sub_request):
+    """Sous-requête au format attendu par /$batch"""
+    item = {
+        "id": str(index),
+        "method": sub_request.get("method", "GET").upper(),
+        "url": sub_request["url"],
+    }
+    headers = dict(sub_request.get("headers") or {})
+    if "body" in sub_request:
+        item["body"] = sub_request["body"]
+        headers.setdefault("Content-Type", "application/json")
+    if headers:
+        item["headers"] = headers
+    return item
+
+
+class GraphClient:
+    """Client Microsoft Graph : jeton en cache, session HTTP, pagination et throttling
+
+    `token_provider` permet de remplacer MSAL (par exemple face à un faux serveur
+    Graph local) : fonction sans argument retournant (jeton, durée de validité en s).
+    """
+
+    def __init__(self, tenant_id, client_id, client_secret, base_url=DEFAULT_GRAPH_BASE_URL,
+                 authority_host=DEFAULT_AUTHORITY_HOST, timeout=30, max_retries=5,
+                 max_retry_wait=60, pool_size=10, token_provider=None):
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.base_url = base_url.rstrip("/")
+        self.authority_host = authority_host.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self.token_provider = token_provider
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._app = None
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'token_requests': 0,
+            'token_cache_hits': 0,
+            'throttled': 0,
+            'retries': 0,
+            'batch_subrequests': 0,
+        }
+        self._endpoints = {}  # nom -> {calls, errors, time_total, time_max}
+
+    # ------------------------------------------------------------------ jeton
+
+    def _acquire_token(self):
+        if self.token_provider is not None:
+            return self.token_provider()
+        if self._app is None:
+            self._app = ConfidentialClientApplication(
+                self.client_id,
+                authority=f"{self.authority_host}/{self.tenant_id}",
+                client_credential=self.client_secret
+            )
+        token_response = self._app.acquire_token_for_client(scopes=GRAPH_SCOPES)
+        access_token = token_response.get("access_token")
+        if not access_token:
+            error = token_response.get("error_description") or token_response.get("error") or "réponse vide"
+            raise GraphError(f"Impossible d'obtenir le token Microsoft: {error}")
+        return access_token, int(token_response.get("expires_in", 3600))
+
+    def get_token(self, force_refresh=False):
+        """Retourne un jeton d'accès valide, réutilisé jusqu'à son expiration"""
+        with self._token_lock:
+            if not force_refresh and self._token and time.monotonic() < self._token_expires_at:
+                self._count('token_cache_hits')
+                return self._token
+            self._count('token_requests')
+            token, expires_in = self._acquire_token()
+            self._token = token
+            self._token_expires_at = time.monotonic() + max(0, expires_in - TOKEN_REFRESH_MARGIN)
+            return token
+
+    # ------------------------------------------------------------------ requêtes
+
+    def _url(self, path):
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _record(self, name, elapsed, error):
+        with self._stats_lock:
+            metrics = self._endpoints.setdefault(name, {'calls': 0, 'errors': 0, 'time_total': 0.0, 'time_max': 0.0})
+            metrics['calls'] += 1
+            metrics['errors'] += 1 if error else 0
+            metrics['time_total'] += elapsed
+            metrics['time_max'] = max(metrics['time_max'], elapsed)
+
+    def _retry_delay(self, response, attempt):
+        """Délai avant nouvelle tentative : Retry-After s'il est fourni, sinon backoff exponentiel"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_retry_wait)
+            except ValueError:
+                pass
+        return min(2 ** attempt, self.max_retry_wait) * random.uniform(0.5, 1.0)
+
+    def request(self, method, path, params=None, json=None, headers=None):
+        """Exécute une requête Graph et retourne la `requests.Response` (lève GraphError si échec)"""
+        url = self._url(path)
+        name = endpoint_name(method, url)
+        auth_retried = False
+        attempt = 0
+
+        while True:
+            request_headers = {'Authorization': f'Bearer {self.get_token()}'}
+            if headers:
+                request_headers.update(headers)
+
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, params=params, json=json,
+                                                headers=request_headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                self._record(name, time.monotonic() - start, True)
+                if attempt >= self.max_retries:
+                    raise GraphError(f"{name}: {e}") from e
+                attempt += 1
+                self._count('retries')
+                time.sleep(self._retry_delay(None, attempt))
+                continue
+
+            ok = response.status_code < 400
+            self._record(name, time.monotonic() - start, not ok)
+            if ok:
+                return response
+
+            if response.status_code == 401 and not auth_retried:
+                # Jeton révoqué ou expiré plus tôt que prévu : en redemander un
+                auth_retried = True
+                self.get_token(force_refresh=True)
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                attempt += 1
+                delay = self._retry_delay(response, attempt)
+                if response.status_code == 429:
+                    self._count('throttled')
+                self._count('retries')
+                logger.warning(f"Graph {name}: HTTP {response.status_code}, nouvelle tentative dans {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            try:
+                payload = response.json()
+                message = payload.get("error", {}).get("message") or response.text
+            except ValueError:
+                payload, message = None, response.text
+            raise GraphError(f"{name}: HTTP {response.status_code} - {message[:300]}",
+                             status_code=response.status_code, payload=payload)
+
+    def get(self, path, params=None):
+        """Requête GET retournant le JSON décodé"""
+        return self.request("GET", path, params=params).json()
+
+    def iter_pages(self, path, params=None):
+        """Produit chaque page `value` en suivant les liens @odata.nextLink"""
+        url, page_params = path, params
+        while url:
+            data = self.get(url, params=page_params)
+            yield data.get("value", [])
+            # nextLink contient déjà tous les paramètres de la requête
+            url, page_params = data.get("@odata.nextLink"), None
+
+    def get_all(self, path, params=None):
+        """Retourne tous les éléments d'une collection, toutes pages confondues"""
+        items = []
+        for page in self.iter_pages(path, params):
+            items.extend(page)
+        return items
+
+    def batch(self, sub_requests):
+        """Exécute des sous-requêtes via `/$batch`, 20 par appel HTTP au plus
+
+        `sub_requests` : liste de dictionnaires {method, url[, headers, body]} avec
+        une URL relative à la version (ex. '/groups/{id}'). Retourne, dans le même
+        ordre, des dictionnaires {status, headers, body}. Les sous-requêtes
+        limitées (429) sont rejouées après le plus long Retry-After reçu.
+        """
+        results = [None] * len(sub_requests)
+        pending = list(range(len(sub_requests)))
+        attempt = 0
+
+        while pending:
+            throttled = []
+            retry_after = 0.0
+            for start in range(0, len(pending), MAX_BATCH_SIZE):
+                chunk = pending[start:start + MAX_BATCH_SIZE]
+                payload = {"requests": [_batch_item(index, sub_requests[index]) for index in chunk]}
+                responses = self.request("POST", "/$batch", json=payload).json().get("responses", [])
+                for response in responses:
+                    index = int(response["id"])
+                    status = int(response.get("status", 0))
+                    headers = response.get("headers") or {}
+                    if status == 429 and attempt < self.max_retries:
+                        throttled.append(index)
+                        try:
+                            retry_after = max(retry_after, float(headers.get("Retry-After", 0)))
+                        except ValueError:
+                            pass
+                        continue
+                    results[index] = {"status": status, "headers": headers, "body": response.get("body")}
+                self._count('batch_subrequests', len(chunk))
+
+            for index in pending:
+                if results[index] is None and index not in throttled:
+                    # Sous-requête absente de la réponse
+                    results[index] = {"status": 0, "headers": {}, "body": None}
+            pending = sorted(throttled)
+            if pending:
+                attempt += 1
+                self._count('throttled', len(pending))
+                self._count('retries')
+                delay = min(retry_after, self.max_retry_wait) if retry_after else self._retry_delay(None, attempt)
+                logger.warning(f"Graph $batch: {len(pending)} sous-requête(s) limitée(s), nouvelle tentative dans {delay:.1f}s")
+                time.sleep(delay)
+        return results
+
+    # ------------------------------------------------------------------ métriques
+
+    def get_stats(self):
+        """Compteurs du client (jetons, throttling) et latences par point d'accès"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            endpoints = {name: dict(metrics) for name, metrics in self._endpoints.items()}
+        for metrics in endpoints.values():
+            metrics['time_avg'] = metrics['time_total'] / metrics['calls'] if metrics['calls'] else 0.0
+        stats['endpoints'] = endpoints
+        stats['requests'] = sum(metrics['calls'] for metrics in endpoints.values())
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_graph_client():
+    """Retourne le client Graph partagé par tout le processus"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GraphClient(
+                config.TENANT_ID,
+                config.CLIENT_ID,
+                config.CLIENT_SECRET,
+                base_url=getattr(config, 'GRAPH_BASE_URL', DEFAULT_GRAPH_BASE_URL),
+                authority_host=getattr(config, 'GRAPH_AUTHORITY_HOST', DEFAULT_AUTHORITY_HOST),
+                timeout=getattr(config, 'GRAPH_TIMEOUT', 30),
+                max_retries=getattr(config, 'GRAPH_MAX_RETRIES', 5),
+                max_retry_wait=getattr(config, 'GRAPH_MAX_RETRY_WAIT', 60),
+            )
+        return _client
@@ -13,6 +13,7 @@ import config
 
 # Import des utilitaires locaux
 from .utils import logger
+from .reconciliation import reconcile_students
 
 
 def get_imfr_students(config_dict=None):
@@ -90,46 +91,8 @@ def get_imfr_students(config_dict=None):
 
 def compare_imfr_samba(df_imfr, df_samba):
     """Compare les données IMFR et SAMBA et retourne les différences"""
-    missing_in_samba = []
-    extra_in_samba = []
-    
-    # Trouver les élèves manquants dans SAMBA
-    for _, imfr_student in df_imfr.iterrows():
-        imfr_nom = str(imfr_student['Nom']).strip().upper()
-        imfr_prenom = str(imfr_student['Prénom']).strip().title()
-        
-        # Chercher dans SAMBA
-        found = False
-        for _, samba_student in df_samba.iterrows():
-            samba_nom = str(samba_student.get('Nom', '')).strip().upper()
-            samba_prenom = str(samba_student.get('Prénom', '')).strip().title()
-            
-            if imfr_nom == samba_nom and imfr_prenom == samba_prenom:
-                found = True
-                break
-        
-        if not found:
-            missing_in_samba.append(imfr_student)
-    
-    # Trouver les élèves en plus dans SAMBA
-    for _, samba_student in df_samba.iterrows():
-        samba_nom = str(samba_student.get('Nom', '')).strip().upper()
-        samba_prenom = str(samba_student.get('Prénom', '')).strip().title()
-        
-        # Chercher dans IMFR
-        found = False
-        for _, imfr_student in df_imfr.iterrows():
-            imfr_nom = str(imfr_student['Nom']).strip().upper()
-            imfr_prenom = str(imfr_student['Prénom']).strip().title()
-            
-            if samba_nom == imfr_nom and samba_prenom == imfr_prenom:
-                found = True
-                break
-        
-        if not found:
-            extra_in_samba.append(samba_student)
-    
-    return missing_in_samba, extra_in_samba
+    result = reconcile_students(df_imfr, df_samba, fuzzy=False)
+    return result['missing'].to_dict('records'), result['extra'].to_dict('records')
 
 
 def validate_imfr_data(df_imfr):
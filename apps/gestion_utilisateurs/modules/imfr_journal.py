@@ -0,0 +1,406 @@
+"""
+Module du journal des changements IMFR
+
+Chaque élève importé depuis IMFR reçoit une empreinte (nom, prénom et classe
+normalisés). À l'import suivant, seules les lignes dont l'empreinte a changé
+produisent une opération : création, mise à jour, changement de classe ou
+désactivation. Ces opérations sont conservées dans la table `eleves_imfr_journal`.
+
+La table `eleves_imfr` elle-même est remplacée d'un bloc : l'import est chargé
+dans `eleves_imfr_new`, puis un seul `RENAME TABLE` (atomique) la met en place
+et garde l'instantané précédent dans `eleves_imfr_prev`. Les lecteurs ne voient
+jamais une table vide ou à moitié remplie, et un import en échec laisse la
+table intacte.
+"""
+import hashlib
+import logging
+import unicodedata
+from contextlib import contextmanager
+
+import pandas as pd
+import pymysql
+
+from .db_pool import bulk_upsert, db_connection
+
+logger = logging.getLogger(__name__)
+
+CHANGE_CREATE = "create"
+CHANGE_UPDATE = "update"
+CHANGE_MOVE_CLASS = "move_class"
+CHANGE_DISABLE = "disable"
+
+ELEVES_TABLE = "eleves_imfr"
+ELEVES_STAGING_TABLE = "eleves_imfr_new"
+ELEVES_PREVIOUS_TABLE = "eleves_imfr_prev"
+# Instantané écarté par la rotation, supprimé juste après
+ELEVES_OLD_TABLE = "eleves_imfr_old"
+# Un seul import à la fois, de la détection au journal (verrou nommé MySQL, attente max en secondes)
+IMPORT_LOCK_NAME = "eleves_imfr_import"
+IMPORT_LOCK_TIMEOUT = 60
+
+CHANGE_LABELS = {
+    CHANGE_CREATE: "➕ Nouvel élève",
+    CHANGE_UPDATE: "✏️ Nom modifié",
+    CHANGE_MOVE_CLASS: "🔀 Changement de classe",
+    CHANGE_DISABLE: "⛔ Élève sorti",
+}
+
+
+def _fold(text):
+    """Normalise un texte : sans accents, majuscules, espaces simples"""
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode('ascii')
+    return " ".join(text.upper().split())
+
+
+def student_key(nom, prenom):
+    """Clé stable d'un élève, insensible à la casse et aux accents"""
+    return f"{_fold(nom)}|{_fold(prenom)}"
+
+
+def fingerprint(nom, prenom, classe):
+    """Empreinte SHA-256 du nom, du prénom et de la classe d'un élève"""
+    payload = "|".join(" ".join(str(value or '').split()) for value in (nom, prenom, classe))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _key_occurrence(key):
+    """Numéro d'homonyme d'une clé : 1 pour la clé de base, n pour `base#n`"""
+    _, _, occurrence = key.partition('#')
+    return int(occurrence) if occurrence.isdigit() else 1
+
+
+def build_fingerprints(eleves, previous=None):
+    """Construit {clé: élève} à partir d'une liste de dictionnaires nom/prenom/classe
+
+    Les homonymes reçoivent une clé suffixée (#2, #3...). Pour que la clé d'un
+    élève ne dépende pas de l'ordre des classes, les homonymes reprennent les
+    clés de `previous` (état {clé: élève} du dernier import) : d'abord celle
+    d'un homonyme resté dans la même classe, puis les clés restantes (changement
+    de classe), et seuls les homonymes en surnombre reçoivent une nouvelle clé.
+    """
+    previous = previous or {}
+    groups = {}
+    for eleve in eleves:
+        nom = " ".join(str(eleve['nom'] or '').split())
+        prenom = " ".join(str(eleve['prenom'] or '').split())
+        classe = " ".join(str(eleve.get('classe') or '').split())
+        groups.setdefault(student_key(nom, prenom), []).append({
+            'nom': nom,
+            'prenom': prenom,
+            'classe': classe,
+            'empreinte': fingerprint(nom, prenom, classe),
+        })
+
+    previous_keys = {}
+    for key in previous:
+        previous_keys.setdefault(key.partition('#')[0], []).append(key)
+
+    current = {}
+    for base_key, homonyms in groups.items():
+        homonyms.sort(key=lambda e: (_fold(e['classe']), e['empreinte']))
+        free_keys = sorted(previous_keys.get(base_key, []), key=_key_occurrence)
+        unmatched = []
+        for eleve in homonyms:
+            key = next((key for key in free_keys if _fold(previous[key]['classe']) == _fold(eleve['classe'])), None)
+            if key is None:
+                unmatched.append(eleve)
+            else:
+                free_keys.remove(key)
+                current[key] = eleve
+        used = {_key_occurrence(key) for key in previous_keys.get(base_key, [])}
+        occurrence = 0
+        for eleve in unmatched:
+            if free_keys:
+                current[free_keys.pop(0)] = eleve
+                continue
+            occurrence += 1
+            while occurrence in used:
+                occurrence += 1
+            current[base_key if occurrence == 1 else f"{base_key}#{occurrence}"] = eleve
+    return current
+
+
+def diff_fingerprints(previous, current):
+    """Compare deux états {clé: élève} et retourne la liste des changements"""
+    changes = []
+    for key, eleve in current.items():
+        old = previous.get(key)
+        if old is None:
+            change_type, old_classe = CHANGE_CREATE, None
+        elif old['empreinte'] == eleve['empreinte']:
+            continue
+        elif _fold(old['classe']) != _fold(eleve['classe']):
+            change_type, old_classe = CHANGE_MOVE_CLASS, old['classe']
+        else:
+            change_type, old_classe = CHANGE_UPDATE, old['classe']
+        changes.append({
+            'type': change_type,
+            'cle': key,
+            'nom': eleve['nom'],
+            'prenom': eleve['prenom'],
+            'ancienne_classe': old_classe,
+            'nouvelle_classe': eleve['classe'],
+        })
+
+    for key in previous.keys() - current.keys():
+        old = previous[key]
+        changes.append({
+            'type': CHANGE_DISABLE,
+            'cle': key,
+            'nom': old['nom'],
+            'prenom': old['prenom'],
+            'ancienne_classe': old['classe'],
+            'nouvelle_classe': None,
+        })
+    return changes
+
+
+def ensure_journal_tables(cursor):
+    """Crée les tables d'empreintes et de journal si elles n'existent pas"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS eleves_imfr_empreintes (
+        cle VARCHAR(255) NOT NULL PRIMARY KEY,
+        nom VARCHAR(100) NOT NULL,
+        prenom VARCHAR(100) NOT NULL,
+        classe VARCHAR(50),
+        empreinte CHAR(64) NOT NULL,
+        actif TINYINT(1) NOT NULL DEFAULT 1,
+        date_maj TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        INDEX idx_actif (actif)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS eleves_imfr_journal (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        date_changement TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        type_changement VARCHAR(20) NOT NULL,
+        cle VARCHAR(255) NOT NULL,
+        nom VARCHAR(100) NOT NULL,
+        prenom VARCHAR(100) NOT NULL,
+        ancienne_classe VARCHAR(50),
+        nouvelle_classe VARCHAR(50),
+        INDEX idx_date (date_changement),
+        INDEX idx_type (type_changement)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+
+def detect_changes(eleves):
+    """Calcule les changements d'un import IMFR sans rien écrire
+
+    Retourne un dictionnaire : `changes` (liste), `current` (empreintes du nouvel
+    import), `baseline` (True s'il n'existait encore aucune empreinte) et
+    `table_rows` (nombre de lignes actuellement dans eleves_imfr).
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        ensure_journal_tables(cursor)
+        cursor.execute("SELECT cle, nom, prenom, classe, empreinte FROM eleves_imfr_empreintes WHERE actif = 1")
+        previous = {
+            row[0]: {'nom': row[1], 'prenom': row[2], 'classe': row[3] or '', 'empreinte': row[4]}
+            for row in cursor.fetchall()
+        }
+        try:
+            cursor.execute("SELECT COUNT(*) FROM eleves_imfr")
+            table_rows = cursor.fetchone()[0]
+        except pymysql.Error:
+            table_rows = 0
+        conn.commit()
+        cursor.close()
+
+    current = build_fingerprints(eleves, previous)
+    return {
+        'changes': diff_fingerprints(previous, current),
+        'current': current,
+        'baseline': not previous,
+        'table_rows': table_rows,
+    }
+
+
+def is_unchanged(plan):
+    """Indique si l'import est identique au précédent et que eleves_imfr est à jour"""
+    return not plan['baseline'] and not plan['changes'] and plan['table_rows'] == len(plan['current'])
+
+
+def save_changes(plan):
+    """Enregistre les empreintes et le journal d'un import (un premier import ne journalise rien)"""
+    changes = plan['changes']
+    if not changes:
+        return 0
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        ensure_journal_tables(cursor)
+
+        upserts = [
+            (change['cle'], change['nom'], change['prenom'], change['nouvelle_classe'],
+             plan['current'][change['cle']]['empreinte'])
+            for change in changes if change['type'] != CHANGE_DISABLE
+        ]
+        if upserts:
+            cursor.executemany("""
+            INSERT INTO eleves_imfr_empreintes (cle, nom, prenom, classe, empreinte, actif)
+            VALUES (%s, %s, %s, %s, %s, 1)
+            ON DUPLICATE KEY UPDATE
+                nom = VALUES(nom),
+                prenom = VALUES(prenom),
+                classe = VALUES(classe),
+                empreinte = VALUES(empreinte),
+                actif = 1
+            """, upserts)
+
+        disabled = [(change['cle'],) for change in changes if change['type'] == CHANGE_DISABLE]
+        if disabled:
+            cursor.executemany("UPDATE eleves_imfr_empreintes SET actif = 0 WHERE cle = %s", disabled)
+
+        if not plan['baseline']:
+            cursor.executemany("""
+            INSERT INTO eleves_imfr_journal (type_changement, cle, nom, prenom, ancienne_classe, nouvelle_classe)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """, [
+                (change['type'], change['cle'], change['nom'], change['prenom'],
+                 change['ancienne_classe'], change['nouvelle_classe'])
+                for change in changes
+            ])
+
+        conn.commit()
+        cursor.close()
+
+    logger.info(f"Journal IMFR: {len(changes)} changement(s) enregistré(s)")
+    return len(changes)
+
+
+def get_recent_changes(hours=24):
+    """Retourne les changements des dernières heures (DataFrame, le plus récent en premier)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        ensure_journal_tables(cursor)
+        conn.commit()
+        cursor.close()
+        query = """
+        SELECT
+            date_changement as 'Date',
+            type_changement as 'Type',
+            nom as 'Nom',
+            prenom as 'Prénom',
+            ancienne_classe as 'Ancienne classe',
+            nouvelle_classe as 'Nouvelle classe'
+        FROM eleves_imfr_journal
+        WHERE date_changement >= NOW() - INTERVAL %s HOUR
+        ORDER BY id DESC
+        """
+        df = pd.read_sql(query, conn, params=(int(hours),))
+
+    if not df.empty:
+        df['Type'] = df['Type'].map(lambda t: CHANGE_LABELS.get(t, t))
+    return df
+
+
+def summarize_changes(changes):
+    """Compte les changements par type : {'create': 3, 'move_class': 1, ...}"""
+    summary = {}
+    for change in changes:
+        summary[change['type']] = summary.get(change['type'], 0) + 1
+    return summary
+
+
+def ensure_eleves_table(cursor, table=ELEVES_TABLE):
+    """Crée la table des élèves IMFR si elle n'existe pas"""
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        nom VARCHAR(100) NOT NULL,
+        prenom VARCHAR(100) NOT NULL,
+        classe VARCHAR(50),
+        date_import TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_nom_prenom (nom, prenom),
+        INDEX idx_classe (classe)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+
+def _table_exists(cursor, table):
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.TABLES
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return cursor.fetchone()[0] > 0
+
+
+@contextmanager
+def import_lock():
+    """Sérialise les imports IMFR : detect_changes, replace_eleves et save_changes s'exécutent dessous
+
+    Sans verrou autour des trois étapes, deux imports simultanés calculeraient
+    leurs changements sur les mêmes empreintes et les journaliseraient deux fois.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (IMPORT_LOCK_NAME, IMPORT_LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Un autre import IMFR est en cours")
+        try:
+            yield
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (IMPORT_LOCK_NAME,))
+            cursor.fetchone()
+            cursor.close()
+
+
+def replace_eleves(eleves):
+    """Remplace le contenu de eleves_imfr par un import, sans état intermédiaire visible
+
+    À appeler sous import_lock(). Retourne le nombre d'élèves enregistrés ;
+    l'instantané remplacé reste dans eleves_imfr_prev. En cas d'erreur,
+    eleves_imfr n'est pas modifiée.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        ensure_eleves_table(cursor)
+        cursor.execute(f"DROP TABLE IF EXISTS {ELEVES_STAGING_TABLE}")
+        cursor.execute(f"CREATE TABLE {ELEVES_STAGING_TABLE} LIKE {ELEVES_TABLE}")
+        try:
+            counts = bulk_upsert(conn, ELEVES_STAGING_TABLE, ["nom", "prenom", "classe"],
+                                 [(eleve['nom'], eleve['prenom'], eleve['classe']) for eleve in eleves])
+            conn.commit()
+            cursor.execute(f"DROP TABLE IF EXISTS {ELEVES_OLD_TABLE}")
+            # Rotation en un seul RENAME TABLE : eleves_imfr_prev n'est jamais absente
+            # entre deux instructions
+            rotation = [f"{ELEVES_TABLE} TO {ELEVES_PREVIOUS_TABLE}", f"{ELEVES_STAGING_TABLE} TO {ELEVES_TABLE}"]
+            if _table_exists(cursor, ELEVES_PREVIOUS_TABLE):
+                rotation.insert(0, f"{ELEVES_PREVIOUS_TABLE} TO {ELEVES_OLD_TABLE}")
+            cursor.execute(f"RENAME TABLE {', '.join(rotation)}")
+        except Exception:
+            cursor.execute(f"DROP TABLE IF EXISTS {ELEVES_STAGING_TABLE}")
+            raise
+        cursor.execute(f"DROP TABLE IF EXISTS {ELEVES_OLD_TABLE}")
+        cursor.close()
+
+    logger.info(f"Import IMFR: {counts['inserted']} élèves en place dans {ELEVES_TABLE}")
+    return counts['inserted']
+
+
+def compare_with_previous():
+    """Lignes ajoutées / retirées par le dernier import par rapport à l'instantané précédent
+
+    Retourne {"added", "removed"} ou None s'il n'y a pas d'instantané précédent.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        counts = {}
+        try:
+            for key, table, other in (("added", ELEVES_TABLE, ELEVES_PREVIOUS_TABLE),
+                                      ("removed", ELEVES_PREVIOUS_TABLE, ELEVES_TABLE)):
+                cursor.execute(f"""
+                SELECT COUNT(*) FROM {table} t
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {other} o
+                    WHERE o.nom = t.nom AND o.prenom = t.prenom AND o.classe <=> t.classe
+                )
+                """)
+                counts[key] = cursor.fetchone()[0]
+        except pymysql.Error:
+            return None
+        finally:
+            cursor.close()
+    return counts
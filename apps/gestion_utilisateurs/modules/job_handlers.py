@@ -0,0 +1,348 @@
+"""
+Module des tâches longues exécutées par la file de tâches
+
+Chaque gestionnaire reçoit un contexte (logs, progression, annulation) et les
+paramètres préparés par l'interface. Les tâches par lots enregistrent chaque
+élément traité : une tâche interrompue ou annulée peut être reprise sans refaire
+les comptes déjà créés ou supprimés.
+"""
+import logging
+import subprocess
+import sys
+import time
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+from .db_pool import bulk_upsert, db_connection
+from .job_queue import job_handler, get_job_manager
+from .samba_batch import op_create_user, op_add_group, op_add_members, op_delete_user, run_samba_batch
+from .samba_inventory import fetch_samba_inventory, save_inventory_to_db
+from .sync_logs import LogStream, new_spool_path, purge_spools
+from .sync_registry import wait_until_idle
+from .sync_summary import SUMMARY_ENV_VAR, new_summary_file, load_summary
+from .sync_plan import plan_args
+from .username_allocator import get_username_allocator
+from .kerberos import KerberosError, describe_ticket, get_kerberos_credentials
+
+logger = logging.getLogger(__name__)
+
+JOB_CSV_IMPORT = "csv_import"
+JOB_RAZ_ELEVES = "raz_eleves"
+JOB_SAMBA_INVENTORY = "samba_inventory"
+JOB_AZURE_SYNC = "azure_sync"
+
+SYNC_SUMMARY_MARKER = "📊 RÉSUMÉ DE LA SYNCHRONISATION AZURE AD"
+
+
+def _chunk_size():
+    return max(1, getattr(config, 'JOBS_CHUNK_SIZE', 50))
+
+
+def _save_users_to_db(users, groupe):
+    """Enregistre les comptes créés dans la table utilisateurs (UPSERT)"""
+    if not users:
+        return
+    with db_connection() as conn:
+        bulk_upsert(conn, "utilisateurs", ["Login", "Nom", "Prénom", "Classe", "Groupe", "Mot_de_passe"],
+                    [(u['username'], u['nom'], u['prenom'], u.get('classe', ''), groupe, u['password']) for u in users],
+                    key_columns=["Login"], update_columns=["Nom", "Prénom", "Classe", "Groupe", "Mot_de_passe"],
+                    constants={"Dernière_modification": "NOW()"}, touch_column="Dernière_modification")
+        conn.commit()
+
+
+def _delete_users_from_db(logins):
+    """Retire de la table utilisateurs les comptes supprimés de SAMBA"""
+    if not logins:
+        return
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("DELETE FROM utilisateurs WHERE Login = %s", [(login,) for login in logins])
+        conn.commit()
+        cursor.close()
+
+
+# ========================= Import CSV =========================
+
+@job_handler(JOB_CSV_IMPORT, "📂 Import CSV - création des comptes", resumable=True)
+def csv_import_job(ctx, params):
+    """Crée les comptes préparés par l'onglet Import CSV, par tranches"""
+    users = params['users']
+    groupe = params['groupe']
+    license_groups = params.get('license_groups') or []
+
+    done = ctx.completed_items()
+    remaining = [u for u in users if u['username'] not in done]
+    if done:
+        ctx.log(f"Reprise : {len(done)} compte(s) déjà traité(s), {len(remaining)} restant(s)")
+    ctx.progress(len(done), len(users), f"{len(done)}/{len(users)} comptes traités")
+
+    if remaining and license_groups:
+        # Créer les groupes de licences une seule fois, avant les lots parallèles
+        run_samba_batch([op_add_group(license_group) for license_group in license_groups])
+
+    counts = {"ok": 0, "warning": 0, "error": 0, "unreachable": 0}
+    for status, _ in done.values():
+        counts[status] = counts.get(status, 0) + 1
+
+    processed = len(done)
+    chunk_size = _chunk_size()
+    for start in range(0, len(remaining), chunk_size):
+        ctx.check_cancelled()
+        chunk = remaining[start:start + chunk_size]
+
+        operations = []
+        indexes = []
+        for user in chunk:
+            create_index = len(operations)
+            operations.append(op_create_user(user['username'], user['password'], description=user.get('classe', '')))
+            group_indexes = []
+            for group_name in [groupe] + list(license_groups):
+                group_indexes.append(len(operations))
+                operations.append(op_add_members(group_name, user['username'], requires=create_index))
+            indexes.append((create_index, group_indexes))
+
+        batch_results = run_samba_batch(operations)
+
+        items = []
+        to_save = []
+        failed = []
+        for user, (create_index, group_indexes) in zip(chunk, indexes):
+            username = user['username']
+            create_result = batch_results[create_index]
+            created = create_result["status"] == "ok" or (
+                create_result["status"] == "exists" and create_result.get("retried"))
+
+            if create_result["status"] == "unreachable":
+                # Non marqué comme traité : sera retenté à la reprise de la tâche
+                ctx.log(f"❌ {user['prenom']} {user['nom']} ({username}) : connexion impossible", "ERROR")
+                to_save.append(user)
+                counts["unreachable"] += 1
+                continue
+            if not created:
+                ctx.log(f"❌ {user['prenom']} {user['nom']} ({username}) : {create_result['error'][:200]}", "ERROR")
+                items.append((username, "error", {"error": create_result["error"][:500]}))
+                failed.append(username)
+                counts["error"] += 1
+                continue
+
+            group_errors = [batch_results[i]["error"][:50] for i in group_indexes
+                            if batch_results[i]["status"] not in ("ok", "already_member")]
+            if group_errors:
+                ctx.log(f"⚠️ {user['prenom']} {user['nom']} ({username}) : créé mais erreur groupes : "
+                        f"{'; '.join(group_errors)}", "WARNING")
+                items.append((username, "warning", {"error": "; ".join(group_errors)}))
+                counts["warning"] += 1
+            else:
+                ctx.log(f"✅ {user['prenom']} {user['nom']} ({username})")
+                items.append((username, "ok", None))
+                counts["ok"] += 1
+            to_save.append(user)
+
+        _save_users_to_db(to_save, groupe)
+        # Logins réservés à l'import dont le compte n'a pas été créé : de nouveau disponibles
+        get_username_allocator("mysql").release(*failed)
+        ctx.mark_items(items)
+        processed += len(items)
+        ctx.progress(processed, len(users), f"{processed}/{len(users)} comptes traités")
+
+    if counts["unreachable"] == 0:
+        # Plus rien à reprendre : ne pas conserver les mots de passe dans la file
+        ctx.replace_params({**params, 'users': [{**u, 'password': '****'} for u in users]})
+
+    message = (f"{counts['ok']} créé(s), {counts['warning']} avertissement(s), "
+               f"{counts['error'] + counts['unreachable']} erreur(s) sur {len(users)}")
+    if counts["unreachable"]:
+        raise RuntimeError(f"{counts['unreachable']} compte(s) non traité(s) (serveur SAMBA injoignable) - "
+                           f"reprenez la tâche pour les retenter. {message}")
+    return {"message": message, **counts, "total": len(users)}
+
+
+def enqueue_csv_import(users, groupe, license_groups=None):
+    """Ajoute la création des comptes d'un import CSV à la file de tâches
+
+    `users` : liste de dictionnaires username, password, prenom, nom, classe.
+    """
+    params = {'users': users, 'groupe': groupe, 'license_groups': list(license_groups or [])}
+    return get_job_manager().enqueue(JOB_CSV_IMPORT, params,
+                                     label=f"📂 Import CSV - {len(users)} compte(s) ({groupe})")
+
+
+# ========================= RAZ du groupe Eleves =========================
+
+@job_handler(JOB_RAZ_ELEVES, "🧹 RAZ du groupe Eleves", exclusive=True, resumable=True)
+def raz_eleves_job(ctx, params):
+    """Supprime de SAMBA les comptes listés, par tranches, puis de la table utilisateurs"""
+    usernames = params['usernames']
+
+    done = ctx.completed_items()
+    remaining = [u for u in usernames if u not in done]
+    if done:
+        ctx.log(f"Reprise : {len(done)} compte(s) déjà traité(s), {len(remaining)} restant(s)")
+
+    deleted = sum(1 for status, _ in done.values() if status == "ok")
+    errors = len(done) - deleted
+    processed = len(done)
+    ctx.progress(processed, len(usernames), f"{processed}/{len(usernames)} comptes traités")
+
+    chunk_size = _chunk_size()
+    for start in range(0, len(remaining), chunk_size):
+        ctx.check_cancelled()
+        chunk = remaining[start:start + chunk_size]
+        batch_results = run_samba_batch([op_delete_user(username) for username in chunk])
+
+        items = []
+        deleted_logins = []
+        for username, result in zip(chunk, batch_results):
+            if result["status"] == "unreachable":
+                ctx.log(f"❌ {username} : connexion impossible", "ERROR")
+                continue
+            if result["status"] == "ok":
+                items.append((username, "ok", None))
+                deleted_logins.append(username)
+                deleted += 1
+                ctx.log(f"✅ {username} supprimé de Samba")
+            else:
+                items.append((username, "error", {"error": result["error"][:500]}))
+                errors += 1
+                ctx.log(f"❌ {username} : {result['error'][:200]}", "ERROR")
+
+        _delete_users_from_db(deleted_logins)
+        ctx.mark_items(items)
+        processed += len(items)
+        ctx.progress(processed, len(usernames), f"{processed}/{len(usernames)} comptes traités")
+
+    unreachable = len(usernames) - processed
+    message = f"{deleted}/{len(usernames)} compte(s) supprimé(s), {errors} erreur(s)"
+    if unreachable:
+        raise RuntimeError(f"{unreachable} compte(s) non traité(s) (serveur SAMBA injoignable) - "
+                           f"reprenez la tâche pour les retenter. {message}")
+    return {"message": message, "deleted": deleted, "errors": errors, "total": len(usernames)}
+
+
+def enqueue_raz_eleves(usernames):
+    """Ajoute la suppression des comptes du groupe Eleves à la file de tâches"""
+    return get_job_manager().enqueue(JOB_RAZ_ELEVES, {'usernames': list(usernames)},
+                                     label=f"🧹 RAZ Eleves - {len(usernames)} compte(s)")
+
+
+# ========================= Inventaire SAMBA =========================
+
+@job_handler(JOB_SAMBA_INVENTORY, "🔐 Mise à jour depuis SAMBA", exclusive=True)
+def samba_inventory_job(ctx, params):
+    """Relit l'inventaire SAMBA et met à jour la table utilisateurs"""
+    def update_progress(count):
+        if count % 50 == 0:
+            ctx.progress(count, 0, f"{count} utilisateurs lus")
+
+    users_details, error = fetch_samba_inventory(progress_callback=update_progress)
+    if error:
+        raise RuntimeError(f"Erreur lors de la récupération de l'inventaire SAMBA: {error}")
+    ctx.log(f"{len(users_details)} utilisateurs récupérés depuis SAMBA")
+    ctx.check_cancelled()
+
+    counts = save_inventory_to_db(users_details)
+    count_updated = sum(counts.values())
+    ctx.progress(count_updated, count_updated)
+    return {"message": f"{count_updated} utilisateurs synchronisés dans la table 'utilisateurs' "
+                       f"({counts['inserted']} nouveau(x), {counts['updated']} mis à jour, "
+                       f"{counts['unchanged']} inchangé(s))",
+            "count": count_updated, "counts": counts}
+
+
+def enqueue_samba_inventory():
+    return get_job_manager().enqueue(JOB_SAMBA_INVENTORY)
+
+
+# ========================= Synchronisation Azure AD =========================
+
+def _stop_process(process):
+    """Arrête le script : SIGTERM, puis SIGKILL s'il ne s'est pas terminé après 10 secondes"""
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+@job_handler(JOB_AZURE_SYNC, "🔄 Synchronisation Azure AD", exclusive=True)
+def azure_sync_job(ctx, params):
+    """Exécute le script de synchronisation Azure AD ; sa sortie va dans un journal complet sur disque"""
+    env = config.get_kerberos_env()
+    timeout_seconds = params.get('timeout_seconds', 120)
+
+    # Synchronisation déjà en cours (mode service, autre session) : attendre sa fin sans l'interrompre
+    if not wait_until_idle(cancelled=lambda: ctx.cancelled,
+                           on_wait=lambda run: ctx.log(f"⏳ Synchronisation en cours (PID {run.get('pid')}) : "
+                                                       "démarrage à la fin de celle-ci", "WARNING")):
+        ctx.check_cancelled()
+
+    # Ticket Kerberos du cache, renouvelé seulement s'il expire bientôt
+    try:
+        ticket = get_kerberos_credentials().ensure_ticket()
+    except KerberosError as e:
+        raise RuntimeError(f"Échec de l'authentification Kerberos: {e}")
+    ctx.log(f"✅ {describe_ticket(ticket)}")
+
+    script_to_use = config.SYNC_SCRIPT_WITH_SUMMARY if params.get('use_summary', True) else config.SYNC_SCRIPT
+    cmd = [f"{config.VENV_PATH}/bin/python", script_to_use]
+    if params.get('dryrun', True):
+        cmd.append("--dryrun")
+    # Dry run : plan écrit pour être appliqué ensuite ; application : exactement les actions du plan
+    cmd += plan_args(plan_out=params.get('plan_out'), apply_plan=params.get('apply_plan'))
+
+    summary_path = new_summary_file()
+    purge_spools()
+    log_path = new_spool_path()
+    # L'onglet Tâches lit la sortie du script dans ce journal, pendant et après l'exécution
+    ctx.replace_params({**params, 'log_file': log_path})
+    process = subprocess.Popen(
+        cmd,
+        cwd="/home/samba-sync-ad",
+        env={**env, SUMMARY_ENV_VAR: summary_path, "AADSYNC_LOG_FILE": log_path},
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+    )
+
+    # Chaque ligne va dans le journal complet sur disque (pas d'écriture SQLite par ligne dans le thread de lecture)
+    log_stream = LogStream(process.stdout, spool_path=log_path)
+    start_time = time.time()
+    max_duration = getattr(config, 'SYNC_MAX_DURATION', 3600)
+    try:
+        while process.poll() is None:
+            if ctx.cancelled:
+                _stop_process(process)
+                ctx.check_cancelled()
+            # timeout_seconds : délai d'inactivité, une synchronisation longue qui progresse continue
+            if log_stream.idle_for() > timeout_seconds:
+                _stop_process(process)
+                raise RuntimeError(f"Aucune sortie du script depuis {timeout_seconds} secondes")
+            if max_duration and time.time() - start_time > max_duration:
+                _stop_process(process)
+                raise RuntimeError(f"Durée maximale de {max_duration} secondes dépassée")
+            time.sleep(0.5)
+        log_stream.join(timeout=10)
+    finally:
+        if process.poll() is None:
+            process.kill()
+        summary = load_summary(summary_path)
+
+    if process.returncode != 0:
+        raise RuntimeError(f"Le script de synchronisation s'est terminé avec le code {process.returncode}")
+    return {"message": f"Synchronisation terminée ({log_stream.total} lignes de log)",
+            "returncode": process.returncode, "use_summary": params.get('use_summary', True),
+            "summary": summary, "log_file": log_stream.spool_path, "plan_file": params.get('plan_out')}
+
+
+def enqueue_azure_sync(dryrun=True, timeout_seconds=120, use_summary=True, plan_out=None, apply_plan=None):
+    params = {'dryrun': dryrun, 'timeout_seconds': timeout_seconds, 'use_summary': use_summary,
+              'plan_out': plan_out, 'apply_plan': apply_plan}
+    if apply_plan:
+        label = "🔄 Synchronisation Azure AD (application du plan)"
+    else:
+        label = f"🔄 Synchronisation Azure AD{' (dry run)' if dryrun else ''}"
+    return get_job_manager().enqueue(JOB_AZURE_SYNC, params, label=label)
@@ -0,0 +1,436 @@
+"""
+Module de file de tâches en arrière-plan
+
+Les traitements longs (import CSV, RAZ, inventaire SAMBA, synchronisation Azure)
+sont enregistrés dans une base SQLite locale puis exécutés par des threads de
+travail indépendants du script Streamlit : un rafraîchissement du navigateur ou
+un clic sur un widget n'interrompt plus la tâche. L'interface se contente
+d'ajouter des tâches et d'en consulter l'état, la progression et les logs.
+"""
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS_DB_PATH = "/home/streamlit/data/jobs.db"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+STATUS_INTERRUPTED = "interrupted"
+
+FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED, STATUS_INTERRUPTED)
+
+STATUS_LABELS = {
+    STATUS_QUEUED: "⏳ En attente",
+    STATUS_RUNNING: "🔄 En cours",
+    STATUS_SUCCEEDED: "✅ Terminée",
+    STATUS_FAILED: "❌ Échec",
+    STATUS_CANCELLED: "⛔ Annulée",
+    STATUS_INTERRUPTED: "⚠️ Interrompue",
+}
+
+# type de tâche -> {"func", "label", "exclusive", "resumable"}
+_HANDLERS = {}
+
+
+class JobCancelled(Exception):
+    """Levée dans un gestionnaire lorsque l'annulation de la tâche a été demandée"""
+
+
+def job_handler(job_type, label, exclusive=False, resumable=False):
+    """Décorateur d'enregistrement d'un gestionnaire de tâche
+
+    Le gestionnaire reçoit (ctx, params) et retourne un dictionnaire de résultat.
+    `exclusive` : une seule tâche de ce type à la fois. `resumable` : la tâche
+    peut être relancée et ignore alors les éléments déjà traités.
+    """
+    def decorator(func):
+        _HANDLERS[job_type] = {"func": func, "label": label, "exclusive": exclusive, "resumable": resumable}
+        return func
+    return decorator
+
+
+def get_handler_label(job_type):
+    handler = _HANDLERS.get(job_type)
+    return handler["label"] if handler else job_type
+
+
+def is_resumable(job_type):
+    handler = _HANDLERS.get(job_type)
+    return bool(handler and handler["resumable"])
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class JobContext:
+    """Contexte passé aux gestionnaires : logs, progression, annulation, reprise"""
+
+    def __init__(self, manager, job_id):
+        self.manager = manager
+        self.job_id = job_id
+        self._cancel_checked_at = 0.0
+        self._cancelled = False
+
+    def log(self, message, level="INFO"):
+        """Ajoute une ligne au journal de la tâche"""
+        logger.log(getattr(logging, level, logging.INFO), f"[tâche {self.job_id[:8]}] {message}")
+        with self.manager._connect() as conn:
+            conn.execute(
+                "INSERT INTO job_logs (job_id, created_at, level, message) VALUES (?, ?, ?, ?)",
+                (self.job_id, _now(), level, str(message))
+            )
+
+    def progress(self, done, total, message=None):
+        """Met à jour la progression (done / total) et le message d'état"""
+        with self.manager._connect() as conn:
+            if message is None:
+                conn.execute("UPDATE jobs SET progress_done = ?, progress_total = ? WHERE id = ?",
+                             (done, total, self.job_id))
+            else:
+                conn.execute("UPDATE jobs SET progress_done = ?, progress_total = ?, message = ? WHERE id = ?",
+                             (done, total, str(message), self.job_id))
+
+    @property
+    def cancelled(self):
+        """Indique si l'annulation a été demandée (vérifiée au plus une fois par seconde)"""
+        if not self._cancelled and time.monotonic() - self._cancel_checked_at > 1:
+            self._cancel_checked_at = time.monotonic()
+            with self.manager._connect() as conn:
+                row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.job_id,)).fetchone()
+            self._cancelled = bool(row and row[0])
+        return self._cancelled
+
+    def check_cancelled(self):
+        """Lève JobCancelled si l'annulation a été demandée"""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def completed_items(self):
+        """Éléments déjà traités lors d'une exécution précédente : {clé: (statut, résultat)}"""
+        with self.manager._connect() as conn:
+            rows = conn.execute("SELECT item_key, status, result FROM job_items WHERE job_id = ?",
+                                (self.job_id,)).fetchall()
+        return {key: (status, json.loads(result) if result else None) for key, status, result in rows}
+
+    def mark_items(self, items):
+        """Enregistre des éléments traités : liste de (clé, statut, résultat)"""
+        with self.manager._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO job_items (job_id, item_key, status, result, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(self.job_id, key, status, json.dumps(result, ensure_ascii=False, default=str), _now())
+                 for key, status, result in items]
+            )
+
+    def replace_params(self, params):
+        """Remplace les paramètres enregistrés (ex. pour effacer des mots de passe)"""
+        with self.manager._connect() as conn:
+            conn.execute("UPDATE jobs SET params = ? WHERE id = ?",
+                         (json.dumps(params, ensure_ascii=False, default=str), self.job_id))
+
+
+class JobManager:
+    """File de tâches SQLite et threads de travail associés"""
+
+    def __init__(self, db_path, workers=2, poll_interval=1.0):
+        self.db_path = db_path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._started = False
+        self._lock = threading.Lock()
+        self._init_db()
+
+    # ------------------------------------------------------------------ base
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        return _AutoClosing(conn)
+
+    def _init_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Les paramètres peuvent contenir des mots de passe : la base est créée en 0600
+        # avant que SQLite ne l'ouvre (il crée les fichiers -wal et -shm avec les mêmes droits),
+        # et les droits d'une base existante et de ses fichiers annexes sont corrigés
+        os.close(os.open(self.db_path, os.O_RDWR | os.O_CREAT, 0o600))
+        for path in (self.db_path, f"{self.db_path}-wal", f"{self.db_path}-shm"):
+            if os.path.exists(path):
+                os.chmod(path, 0o600)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                label TEXT,
+                status TEXT NOT NULL,
+                params TEXT,
+                result TEXT,
+                message TEXT,
+                error TEXT,
+                progress_done INTEGER DEFAULT 0,
+                progress_total INTEGER DEFAULT 0,
+                cancel_requested INTEGER DEFAULT 0,
+                attempts INTEGER DEFAULT 0,
+                created_by TEXT,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                level TEXT NOT NULL,
+                message TEXT
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_job_logs_job ON job_logs (job_id, id)")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                item_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                updated_at TEXT,
+                PRIMARY KEY (job_id, item_key)
+            )
+            """)
+
+    # ------------------------------------------------------------------ workers
+
+    def start(self):
+        """Démarre les threads de travail (une seule fois par processus)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            # Les tâches « en cours » d'un processus précédent ne tournent plus
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ?, message = ? WHERE status = ?",
+                    (STATUS_INTERRUPTED, _now(), "Interrompue par un redémarrage de l'application", STATUS_RUNNING)
+                )
+            self.purge(days=getattr(config, 'JOBS_RETENTION_DAYS', 30))
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i + 1}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _claim_next(self):
+        """Réserve atomiquement la prochaine tâche en attente"""
+        exclusive_types = [t for t, h in _HANDLERS.items() if h["exclusive"]]
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                running_types = {row[0] for row in conn.execute(
+                    "SELECT DISTINCT type FROM jobs WHERE status = ?", (STATUS_RUNNING,))}
+                rows = conn.execute(
+                    "SELECT id, type, params FROM jobs WHERE status = ? ORDER BY created_at", (STATUS_QUEUED,)
+                ).fetchall()
+                for job_id, job_type, params in rows:
+                    if job_type in exclusive_types and job_type in running_types:
+                        continue
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1, error = NULL WHERE id = ?",
+                        (STATUS_RUNNING, _now(), job_id)
+                    )
+                    conn.execute("COMMIT")
+                    return job_id, job_type, json.loads(params) if params else {}
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return None
+
+    def _worker_loop(self):
+        while True:
+            try:
+                claimed = self._claim_next()
+            except Exception as e:
+                logger.error(f"Erreur lors de la lecture de la file de tâches: {e}")
+                claimed = None
+            if claimed is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run_job(*claimed)
+
+    def _run_job(self, job_id, job_type, params):
+        ctx = JobContext(self, job_id)
+        handler = _HANDLERS.get(job_type)
+        if handler is None:
+            self._finish(job_id, STATUS_FAILED, error=f"Type de tâche inconnu: {job_type}")
+            return
+
+        ctx.log(f"Démarrage de la tâche « {handler['label']} »")
+        try:
+            result = handler["func"](ctx, params) or {}
+        except JobCancelled:
+            ctx.log("Tâche annulée à la demande de l'utilisateur", "WARNING")
+            self._finish(job_id, STATUS_CANCELLED, message="Annulée")
+        except Exception as e:
+            ctx.log(f"Erreur: {e}", "ERROR")
+            ctx.log(traceback.format_exc(), "ERROR")
+            self._finish(job_id, STATUS_FAILED, error=str(e))
+        else:
+            ctx.log("Tâche terminée")
+            self._finish(job_id, STATUS_SUCCEEDED, result=result, message=result.get("message"))
+
+    def _finish(self, job_id, status, result=None, message=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, message = COALESCE(?, message), error = ? WHERE id = ?",
+                (status, _now(), json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                 message, error, job_id)
+            )
+
+    # ------------------------------------------------------------------ API
+
+    def enqueue(self, job_type, params=None, label=None, created_by=None):
+        """Ajoute une tâche à la file et retourne son identifiant"""
+        self.start()
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, type, label, status, params, created_by, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, job_type, label or get_handler_label(job_type), STATUS_QUEUED,
+                 json.dumps(params or {}, ensure_ascii=False, default=str), created_by, _now())
+            )
+        self._wakeup.set()
+        return job_id
+
+    def cancel(self, job_id):
+        """Demande l'annulation d'une tâche (immédiate si elle n'a pas démarré)"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, message = ? WHERE id = ? AND status = ?",
+                (STATUS_CANCELLED, _now(), "Annulée avant démarrage", job_id, STATUS_QUEUED)
+            )
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, STATUS_RUNNING))
+
+    def resume(self, job_id):
+        """Remet en file une tâche interrompue, annulée ou en échec (éléments déjà traités ignorés)"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, cancel_requested = 0, finished_at = NULL, error = NULL "
+                "WHERE id = ? AND status IN (?, ?, ?)",
+                (STATUS_QUEUED, job_id, STATUS_INTERRUPTED, STATUS_CANCELLED, STATUS_FAILED)
+            )
+            resumed = cursor.rowcount > 0
+        if resumed:
+            self.start()
+            self._wakeup.set()
+        return resumed
+
+    def get_job(self, job_id):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_from_row(row) if row else None
+
+    def list_jobs(self, limit=50, job_type=None):
+        """Historique des tâches, la plus récente en premier"""
+        query = "SELECT * FROM jobs"
+        args = []
+        if job_type:
+            query += " WHERE type = ?"
+            args.append(job_type)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(query, args).fetchall()
+        return [_job_from_row(row) for row in rows]
+
+    def get_logs(self, job_id, after_id=0, limit=500):
+        """Lignes de log d'une tâche : liste de (id, date, niveau, message)"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, created_at, level, message FROM job_logs WHERE job_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+                (job_id, after_id, limit)
+            ).fetchall()
+        return list(reversed(rows))
+
+    def count_items(self, job_id):
+        """Nombre d'éléments traités par statut : {statut: nombre}"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status",
+                                (job_id,)).fetchall()
+        return dict(rows)
+
+    def purge(self, days=30):
+        """Supprime les tâches terminées depuis plus de `days` jours"""
+        limit = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        with self._connect() as conn:
+            old_ids = [row[0] for row in conn.execute(
+                f"SELECT id FROM jobs WHERE finished_at < ? AND status IN ({','.join('?' * len(FINISHED_STATUSES))})",
+                (limit, *FINISHED_STATUSES))]
+            for job_id in old_ids:
+                conn.execute("DELETE FROM job_logs WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return len(old_ids)
+
+
+class _AutoClosing:
+    """Connexion SQLite utilisable en `with`, fermée à la sortie"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.close()
+        return False
+
+
+def _job_from_row(row):
+    job = dict(row)
+    for key in ("params", "result"):
+        job[key] = json.loads(job[key]) if job.get(key) else None
+    job["status_label"] = STATUS_LABELS.get(job["status"], job["status"])
+    job["resumable"] = is_resumable(job["type"]) and job["status"] in (STATUS_INTERRUPTED, STATUS_CANCELLED, STATUS_FAILED)
+    return job
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Retourne le gestionnaire de tâches partagé par tout le processus (démarré)"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(
+                getattr(config, 'JOBS_DB_PATH', DEFAULT_JOBS_DB_PATH),
+                workers=getattr(config, 'JOBS_WORKERS', 2),
+            )
+        _manager.start()
+        return _manager
@@ -0,0 +1,217 @@
+"""
+Module de gestion du ticket Kerberos de la synchronisation Azure AD
+
+Le script de synchronisation utilise le cache de tickets KRB5_CCACHE. Au lieu
+d'un `kinit -k -t keytab` (aller-retour vers le KDC) avant chaque
+synchronisation, l'expiration du ticket présent dans le cache est lue avec
+`klist` (lecture locale) et le ticket n'est renouvelé que s'il expire dans
+moins de KERBEROS_RENEW_WINDOW secondes. L'expiration est gardée en mémoire :
+tant qu'elle est loin et que le fichier du cache n'a pas changé, aucune
+commande n'est lancée.
+"""
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRINCIPAL = "xxx@xxx-xxx.LAN"
+# Renouveler le ticket s'il expire dans moins de 30 minutes
+DEFAULT_RENEW_WINDOW = 1800
+
+# Formats de date de klist : MIT (locale C, année sur 2 ou 4 chiffres) et Heimdal
+KLIST_DATE_FORMATS = ("%m/%d/%y %H:%M:%S", "%m/%d/%Y %H:%M:%S", "%b %d %H:%M:%S %Y", "%Y-%m-%dT%H:%M:%S")
+
+
+class KerberosError(RuntimeError):
+    """Ticket Kerberos impossible à obtenir"""
+
+
+def _parse_klist_date(value):
+    for date_format in KLIST_DATE_FORMATS:
+        try:
+            return time.mktime(time.strptime(value.strip(), date_format))
+        except ValueError:
+            continue
+    return None
+
+
+def parse_klist(output):
+    """(principal, expiration, fin de renouvellement) du TGT d'une sortie de klist ; dates en epoch ou None"""
+    principal = None
+    expires = None
+    renew_until = None
+    in_tgt = False
+    for line in output.splitlines():
+        match = re.match(r'\s*Default principal:\s*(\S+)', line) or re.match(r'\s*Principal:\s*(\S+)', line)
+        if match:
+            principal = match.group(1)
+            continue
+        # Colonnes séparées par au moins deux espaces : début, expiration, service
+        columns = re.split(r'\s{2,}', line.strip())
+        if len(columns) >= 3 and columns[2].startswith("krbtgt/"):
+            expires = _parse_klist_date(columns[1])
+            in_tgt = True
+            continue
+        match = re.match(r'\s*renew until\s+(.+)', line)
+        if match and in_tgt:
+            renew_until = _parse_klist_date(match.group(1))
+        in_tgt = False
+    return principal, expires, renew_until
+
+
+class KerberosCredentials:
+    """Ticket Kerberos obtenu depuis un keytab, renouvelé seulement à l'approche de son expiration"""
+
+    def __init__(self, keytab, principal, ccache, krb5_conf=None, renew_window=DEFAULT_RENEW_WINDOW, env=None):
+        self.keytab = keytab
+        self.principal = principal
+        self.ccache = ccache
+        self.krb5_conf = krb5_conf
+        self.renew_window = renew_window
+        self.env = dict(env if env is not None else os.environ)
+        self.env["KRB5CCNAME"] = ccache
+        if krb5_conf:
+            self.env["KRB5_CONFIG"] = krb5_conf
+        # Dates de klist dans un format connu
+        self.env["LC_ALL"] = "C"
+
+        self._lock = threading.Lock()
+        self._ticket = None  # dernier état lu : principal, expires, renew_until, checked, mtime
+        self._stats = {
+            'checks': 0,
+            'cache_hits': 0,
+            'renewals': 0,
+            'failures': 0,
+            'last_renewal': None,
+        }
+
+    def _ccache_mtime(self):
+        """Date de modification du fichier du cache (None pour un cache non fichier)"""
+        path = self.ccache[len("FILE:"):] if self.ccache.startswith("FILE:") else self.ccache
+        if ":" in path:
+            return None
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def _run(self, cmd):
+        try:
+            return subprocess.run(cmd, env=self.env, capture_output=True, text=True)
+        except OSError as e:
+            # Outils Kerberos absents : même forme qu'un échec de la commande
+            return subprocess.CompletedProcess(cmd, 127, "", str(e))
+
+    def klist(self):
+        """Sortie brute de `klist` sur le cache (lecture locale, sans KDC)"""
+        return self._run(["klist", "-c", self.ccache])
+
+    def renew(self):
+        """Nouveau ticket depuis le keytab (`kinit`, aller-retour vers le KDC)"""
+        result = self._run(["kinit", "-k", "-t", self.keytab, "-c", self.ccache, self.principal])
+        with self._lock:
+            if result.returncode == 0:
+                self._stats['renewals'] += 1
+                self._stats['last_renewal'] = time.time()
+            else:
+                self._stats['failures'] += 1
+            self._ticket = None
+        return result
+
+    def _read_ticket(self):
+        self._stats['checks'] += 1
+        result = self.klist()
+        principal, expires, renew_until = parse_klist(result.stdout) if result.returncode == 0 else (None, None, None)
+        self._ticket = {"principal": principal, "expires": expires, "renew_until": renew_until,
+                        "checked": time.time(), "mtime": self._ccache_mtime()}
+        return self._ticket
+
+    def _same_principal(self, principal):
+        return bool(principal) and principal.lower() == self.principal.lower()
+
+    def _usable(self, ticket):
+        return (ticket is not None and ticket["expires"] is not None
+                and self._same_principal(ticket["principal"])
+                and ticket["expires"] - time.time() > self.renew_window)
+
+    def ensure_ticket(self):
+        """Garantit un ticket valide au-delà de la fenêtre de renouvellement
+
+        Retourne l'état du ticket (voir `status`) avec `renewed` à True si un
+        `kinit` a été nécessaire ; lève KerberosError si le renouvellement échoue.
+        """
+        with self._lock:
+            ticket = self._ticket
+            if self._usable(ticket) and ticket["mtime"] == self._ccache_mtime():
+                self._stats['cache_hits'] += 1
+                return self._status(ticket, renewed=False)
+            if self._usable(self._read_ticket()):
+                return self._status(self._ticket, renewed=False)
+
+        logger.info(f"Ticket Kerberos absent ou proche de l'expiration : renouvellement pour {self.principal}")
+        result = self.renew()
+        if result.returncode != 0:
+            raise KerberosError(result.stderr.strip() or f"kinit a échoué (code {result.returncode})")
+        with self._lock:
+            return self._status(self._read_ticket(), renewed=True)
+
+    def _status(self, ticket, renewed=None):
+        expires = ticket["expires"] if ticket else None
+        status = {
+            "valid": bool(expires and expires > time.time() and self._same_principal(ticket["principal"])),
+            "principal": ticket["principal"] if ticket else None,
+            "expires": expires,
+            "expires_in": expires - time.time() if expires else None,
+            "renew_until": ticket["renew_until"] if ticket else None,
+            "checked": ticket["checked"] if ticket else None,
+        }
+        if renewed is not None:
+            status["renewed"] = renewed
+        return status
+
+    def status(self):
+        """État du ticket présent dans le cache (relu avec klist), sans le renouveler"""
+        with self._lock:
+            return self._status(self._read_ticket())
+
+    def get_stats(self):
+        """Compteurs : lectures du cache, réutilisations sans commande, renouvellements, échecs"""
+        with self._lock:
+            return dict(self._stats)
+
+
+def describe_ticket(ticket):
+    """Texte court de l'état retourné par `ensure_ticket`"""
+    text = f"Ticket Kerberos {'renouvelé' if ticket.get('renewed') else 'valide'}"
+    if ticket.get("expires"):
+        text += f" (expire le {time.strftime('%d/%m/%Y %H:%M', time.localtime(ticket['expires']))})"
+    return text
+
+
+_credentials = None
+_credentials_lock = threading.Lock()
+
+
+def get_kerberos_credentials():
+    """Retourne le gestionnaire de ticket partagé par tout le processus"""
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = KerberosCredentials(
+                config.KEYTAB_PATH,
+                getattr(config, 'KERBEROS_PRINCIPAL', DEFAULT_PRINCIPAL),
+                config.KRB5_CCACHE,
+                krb5_conf=getattr(config, 'KRB5_CONF', None),
+                renew_window=getattr(config, 'KERBEROS_RENEW_WINDOW', DEFAULT_RENEW_WINDOW),
+                env=config.get_kerberos_env(),
+            )
+        return _credentials
@@ -0,0 +1,109 @@
+"""
+Module de rapprochement des listes d'élèves (IMFR / JSON) avec les comptes SAMBA
+
+Les clés (Nom, Prénom) sont normalisées une seule fois par des opérations
+vectorisées pandas, puis comparées par tables de hachage (isin / merge) au lieu
+de boucles imbriquées sur les lignes.
+"""
+import pandas as pd
+
+FUZZY_COLUMNS = ['Nom', 'Prénom', 'Classe', 'Login', 'Nom_samba', 'Prénom_samba', 'Correspondance']
+
+
+def _column(df, name):
+    """Retourne la colonne en chaîne de caractères, ou une colonne vide si absente"""
+    if name in df.columns:
+        return df[name].astype(str)
+    return pd.Series('', index=df.index, dtype=object)
+
+
+def name_keys(df, nom_col='Nom', prenom_col='Prénom'):
+    """Clé exacte de comparaison : NOM en majuscules | Prénom en casse titre"""
+    nom = _column(df, nom_col).str.strip().str.upper()
+    prenom = _column(df, prenom_col).str.strip().str.title()
+    return nom + '|' + prenom
+
+
+def _fold(series):
+    """Supprime accents, espaces et ponctuation : 'Le Goff-André' -> 'LEGOFFANDRE'"""
+    return (series.astype(str)
+            .str.normalize('NFKD')
+            .str.encode('ascii', errors='ignore')
+            .str.decode('ascii')
+            .str.upper()
+            .str.replace(r'[^A-Z0-9]', '', regex=True))
+
+
+def _fuzzy_candidates(df_missing, df_extra, nom_col, prenom_col):
+    """Propose des correspondances approchées entre élèves manquants et comptes en trop
+
+    Deux règles : mêmes noms une fois accents/ponctuation retirés, ou nom et
+    prénom inversés.
+    """
+    if df_missing.empty or df_extra.empty:
+        return pd.DataFrame(columns=FUZZY_COLUMNS)
+
+    source = pd.DataFrame({
+        'Nom': _column(df_missing, nom_col).str.strip(),
+        'Prénom': _column(df_missing, prenom_col).str.strip(),
+        'Classe': _column(df_missing, 'Classe').str.strip(),
+    })
+    source['_nom'] = _fold(source['Nom'])
+    source['_prenom'] = _fold(source['Prénom'])
+
+    target = pd.DataFrame({
+        'Login': _column(df_extra, 'Login').str.strip(),
+        'Nom_samba': _column(df_extra, nom_col).str.strip(),
+        'Prénom_samba': _column(df_extra, prenom_col).str.strip(),
+    })
+    target['_nom'] = _fold(target['Nom_samba'])
+    target['_prenom'] = _fold(target['Prénom_samba'])
+    target = target[(target['_nom'] != '') | (target['_prenom'] != '')]
+
+    folded = source.merge(target, on=['_nom', '_prenom'])
+    folded['Correspondance'] = 'Accents / ponctuation'
+
+    swapped = source.merge(target, left_on=['_nom', '_prenom'], right_on=['_prenom', '_nom'],
+                           suffixes=('', '_t'))
+    swapped['Correspondance'] = 'Nom / prénom inversés'
+
+    candidates = pd.concat([folded[FUZZY_COLUMNS], swapped[FUZZY_COLUMNS]], ignore_index=True)
+    return candidates.drop_duplicates(subset=['Nom', 'Prénom', 'Login']).reset_index(drop=True)
+
+
+def reconcile_students(df_source, df_samba, nom_col='Nom', prenom_col='Prénom', fuzzy=True):
+    """Rapproche une liste d'élèves avec les utilisateurs SAMBA
+
+    Retourne un dictionnaire de DataFrames :
+    - missing : élèves de la source absents de SAMBA
+    - extra : utilisateurs SAMBA absents de la source
+    - matched : élèves présents des deux côtés (colonnes SAMBA suffixées `_samba`)
+    - fuzzy : correspondances approchées entre `missing` et `extra`
+    """
+    source_keys = name_keys(df_source, nom_col, prenom_col)
+    samba_keys = name_keys(df_samba, nom_col, prenom_col)
+
+    present = source_keys.isin(samba_keys)
+    known = samba_keys.isin(source_keys)
+
+    df_missing = df_source[~present]
+    df_extra = df_samba[~known]
+
+    df_matched = (
+        df_source[present].assign(_key=source_keys[present])
+        .merge(df_samba[known].assign(_key=samba_keys[known]).drop_duplicates('_key'),
+               on='_key', how='left', suffixes=('', '_samba'))
+        .drop(columns='_key')
+    )
+
+    if fuzzy:
+        df_fuzzy = _fuzzy_candidates(df_missing, df_extra, nom_col, prenom_col)
+    else:
+        df_fuzzy = pd.DataFrame(columns=FUZZY_COLUMNS)
+
+    return {
+        'missing': df_missing,
+        'extra': df_extra,
+        'matched': df_matched,
+        'fuzzy': df_fuzzy,
+    }
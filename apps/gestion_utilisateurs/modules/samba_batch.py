@@ -0,0 +1,436 @@
+"""
+Module d'exécution groupée des commandes samba-tool
+
+Une liste d'opérations (création, ajout aux groupes, mot de passe, suppression)
+est envoyée en un seul script exécuté par un unique `sudo bash` sur le serveur.
+Le script est d'abord déposé dans un fichier temporaire (0600) : l'entrée de
+sudo ne contient que le mot de passe, jamais lu par le shell root.
+Chaque opération est encadrée par des marqueurs dans la sortie, ce qui permet de
+récupérer son code retour, sa sortie et ses erreurs individuellement.
+"""
+import logging
+import math
+import queue
+import random
+import shlex
+import socket
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+from .utils import ssh_connection, execute_ssh_command
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_CONCURRENCY = 3
+DEFAULT_RETRY_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 1.0
+
+# Erreurs de transport SSH pour lesquelles un lot est rejoué
+TRANSIENT_ERRORS = (paramiko.SSHException, EOFError, ConnectionError, socket.timeout, TimeoutError)
+
+EXISTS_MESSAGES = ["already exists", "utilisateur existe déjà", "entry already exists", "entrée existe déjà"]
+MEMBER_MESSAGES = ["is already a member", "est déjà membre"]
+
+
+# ========================= Construction des opérations =========================
+
+def op_create_user(username, password, given_name="", surname="", description=""):
+    """Opération de création d'un utilisateur"""
+    args = ["user", "create", str(username).strip(), str(password)]
+    if given_name:
+        args.append(f"--given-name={str(given_name).strip()}")
+    if surname:
+        args.append(f"--surname={str(surname).strip()}")
+    if description:
+        args.append(f"--description={str(description).strip()}")
+    return {"action": "create", "target": str(username).strip(), "args": args}
+
+
+def op_add_group(group):
+    """Opération de création d'un groupe (ignorée s'il existe déjà)"""
+    return {"action": "addgroup", "target": str(group).strip(), "args": ["group", "add", str(group).strip()]}
+
+
+def op_add_members(group, members, requires=None):
+    """Opération d'ajout d'un ou plusieurs membres à un groupe"""
+    if isinstance(members, str):
+        members = [members]
+    members = [str(m).strip() for m in members]
+    return {
+        "action": "addmembers",
+        "target": str(group).strip(),
+        "members": members,
+        "args": ["group", "addmembers", str(group).strip(), ",".join(members)],
+        "requires": requires,
+    }
+
+
+def op_set_password(username, password):
+    """Opération de changement de mot de passe"""
+    return {
+        "action": "setpassword",
+        "target": str(username).strip(),
+        "args": ["user", "setpassword", str(username).strip(), f"--newpassword={password}"],
+    }
+
+
+def op_delete_user(username):
+    """Opération de suppression d'un utilisateur"""
+    return {"action": "delete", "target": str(username).strip(), "args": ["user", "delete", str(username).strip()]}
+
+
+def _command_for(op):
+    return "samba-tool " + " ".join(shlex.quote(arg) for arg in op["args"])
+
+
+# ========================= Script et analyse des résultats =========================
+
+def build_batch_script(indexed_ops, token):
+    """Construit le script bash exécutant toutes les opérations d'un lot
+
+    `indexed_ops` est une liste de (indice global, opération). `requires`
+    désigne l'indice global d'une opération qui doit avoir réussi pour que
+    l'opération soit exécutée ; sinon elle est marquée SKIP.
+    """
+    lines = [
+        # Le reste de l'entrée (mot de passe sudo si sudo ne l'a pas lu) n'est jamais lu
+        "exec </dev/null",
+        "T=$(mktemp -d)",
+        "trap 'rm -rf \"$T\"' EXIT",
+        "declare -A RC",
+        "run_op() {",
+        "  idx=$1; shift",
+        # Avant la commande : une opération commencée mais sans END a pu aboutir
+        f"  printf '%s START %s\\n' '{token}' \"$idx\"",
+        "  \"$@\" >\"$T/out\" 2>\"$T/err\" </dev/null; rc=$?",
+        "  RC[$idx]=$rc",
+        f"  printf '%s BEGIN %s %s\\n' '{token}' \"$idx\" \"$rc\"",
+        "  cat \"$T/out\"",
+        f"  printf '\\n%s STDERR %s\\n' '{token}' \"$idx\"",
+        "  cat \"$T/err\"",
+        f"  printf '\\n%s END %s\\n' '{token}' \"$idx\"",
+        "}",
+        "skip_op() {",
+        "  RC[$1]=255",
+        f"  printf '%s SKIP %s\\n' '{token}' \"$1\"",
+        "}",
+    ]
+    for idx, op in indexed_ops:
+        command = _command_for(op)
+        requires = op.get("requires")
+        if requires is not None:
+            lines.append(f"if [ \"${{RC[{requires}]:-255}}\" = 0 ]; then run_op {idx} {command}; else skip_op {idx}; fi")
+        else:
+            lines.append(f"run_op {idx} {command}")
+    return "\n".join(lines) + "\n"
+
+
+def classify_result(exit_code, error):
+    """Détermine le statut d'une opération à partir de son code retour et de stderr"""
+    error_lower = (error or "").lower()
+    if any(msg in error_lower for msg in MEMBER_MESSAGES):
+        return "already_member"
+    if any(msg in error_lower for msg in EXISTS_MESSAGES):
+        return "exists"
+    if exit_code == 0:
+        return "ok"
+    return "error"
+
+
+def _make_result(op, exit_code, output="", error="", status=None):
+    return {
+        "operation": op,
+        "exit_code": exit_code,
+        "output": output.strip(),
+        "error": error.strip(),
+        "status": status or classify_result(exit_code, error),
+    }
+
+
+def _skipped_result(op):
+    return _make_result(op, None, error="Non exécutée (opération préalable en échec)", status="skipped")
+
+
+def parse_batch_output(lines, token, ops_by_index, on_result=None, on_start=None):
+    """Analyse la sortie balisée du script et retourne {indice global: résultat}
+
+    `on_start(indice)` est appelé quand une opération commence, avant son
+    exécution ; `on_result(indice, résultat)` quand elle est terminée.
+    """
+    results = {}
+    current = None
+    section = None
+    buffers = {"out": [], "err": []}
+
+    for raw_line in lines:
+        line = raw_line.rstrip("\r\n")
+        if line.startswith(token + " "):
+            parts = line.split()
+            marker, idx = parts[1], int(parts[2])
+            if marker == "START":
+                if on_start:
+                    on_start(idx)
+            elif marker == "BEGIN":
+                current = (idx, int(parts[3]))
+                section = "out"
+                buffers = {"out": [], "err": []}
+            elif marker == "STDERR":
+                section = "err"
+            elif marker == "END" and current is not None:
+                op = ops_by_index[current[0]]
+                results[current[0]] = _make_result(op, current[1], "\n".join(buffers["out"]), "\n".join(buffers["err"]))
+                if on_result:
+                    on_result(current[0], results[current[0]])
+                current, section = None, None
+            elif marker == "SKIP":
+                results[idx] = _skipped_result(ops_by_index[idx])
+                if on_result:
+                    on_result(idx, results[idx])
+        elif current is not None and section:
+            buffers[section].append(line)
+    return results
+
+
+# ========================= Exécution =========================
+
+def _upload_script(client, script, timeout):
+    """Dépose le script dans un fichier temporaire (0600) du compte SSH ; retourne son chemin"""
+    stdin, stdout, stderr = client.exec_command(
+        "umask 077 && f=$(mktemp /tmp/samba_batch.XXXXXX) && cat > \"$f\" && echo \"$f\"", timeout=timeout)
+    stdin.write(script)
+    stdin.flush()
+    stdin.channel.shutdown_write()
+    path = stdout.read().decode("utf-8", errors="ignore").strip()
+    if stdout.channel.recv_exit_status() != 0 or not path:
+        raise OSError(f"Dépôt du script impossible : {stderr.read().decode('utf-8', errors='ignore').strip()[:200]}")
+    return path
+
+
+def _remove_script(client, path):
+    try:
+        _, stdout, _ = client.exec_command(f"rm -f {shlex.quote(path)}", timeout=30)
+        stdout.channel.recv_exit_status()
+    except Exception as e:
+        logger.warning(f"Suppression du script {path} impossible: {e}")
+
+
+def _execute_sequential(client, indexed_ops, sudo_password, on_result=None, on_start=None):
+    """Repli : une commande `sudo -S samba-tool` par opération sur la même connexion"""
+    results = {}
+    for idx, op in indexed_ops:
+        requires = op.get("requires")
+        if requires is not None and (requires not in results or results[requires]["status"] != "ok"):
+            results[idx] = _skipped_result(op)
+        else:
+            if on_start:
+                on_start(idx)
+            output, error = execute_ssh_command(client, f"sudo -S {_command_for(op)}", sudo_password, timeout=60)
+            results[idx] = _make_result(op, 1 if error else 0, output, error)
+        if on_result:
+            on_result(idx, results[idx])
+    return results
+
+
+def execute_samba_batch(client, operations, sudo_password, base_index=0, timeout=120, on_result=None, indexes=None,
+                        on_start=None):
+    """Exécute un lot d'opérations dans un seul shell root distant
+
+    Les indices globaux des opérations valent `base_index + position`, ou sont
+    fournis explicitement par `indexes`. Retourne un dictionnaire {indice global:
+    résultat}. Si le shell groupé ne peut pas être lancé (sudo restreint à
+    samba-tool par exemple), les opérations sont rejouées une par une.
+
+    Les erreurs de transport SSH sont propagées : les résultats déjà reçus ont
+    alors été transmis à `on_result`, et `on_start` a été appelé pour chaque
+    opération commencée.
+    """
+    if not operations:
+        return {}
+
+    if indexes is None:
+        indexes = range(base_index, base_index + len(operations))
+    indexed_ops = list(zip(indexes, operations))
+    ops_by_index = dict(indexed_ops)
+
+    token = f"__SAMBA_BATCH_{uuid.uuid4().hex}__"
+    script = build_batch_script(indexed_ops, token)
+
+    path = _upload_script(client, script, timeout)
+    try:
+        # Le fichier est supprimé par la commande elle-même, que sudo réussisse ou non
+        quoted = shlex.quote(path)
+        stdin, stdout, stderr = client.exec_command(
+            f"sudo -S -p '' bash {quoted}; rc=$?; rm -f {quoted}; exit $rc", timeout=timeout)
+        stdin.write(f"{sudo_password}\n")
+        stdin.flush()
+        stdin.channel.shutdown_write()
+
+        results = parse_batch_output(
+            (line for line in stdout),
+            token, ops_by_index, on_result, on_start
+        )
+        exit_status = stdout.channel.recv_exit_status()
+        channel_error = stderr.read().decode("utf-8", errors="ignore").strip()
+    except Exception as e:
+        logger.error(f"Erreur lors de l'exécution groupée samba-tool: {e}")
+        # Le script contient les mots de passe des comptes créés
+        _remove_script(client, path)
+        raise
+
+    if not results and channel_error:
+        logger.warning(f"Shell groupé indisponible ({channel_error[:100]}), repli sur l'exécution commande par commande")
+        return _execute_sequential(client, indexed_ops, sudo_password, on_result, on_start)
+
+    # Opérations sans marqueur (script interrompu) : signalées en erreur
+    for idx, op in indexed_ops:
+        if idx not in results:
+            results[idx] = _make_result(op, None, error=channel_error or f"Script interrompu (code {exit_status})", status="error")
+            if on_result:
+                on_result(idx, results[idx])
+    return results
+
+
+def _split_chunks(operations, batch_size):
+    """Découpe les opérations en lots contigus sans séparer une opération de son `requires`"""
+    chunks = []
+    total = len(operations)
+    start = 0
+    while start < total:
+        end = min(start + batch_size, total)
+        while end < total and operations[end].get("requires") is not None and operations[end]["requires"] >= start:
+            end += 1
+        chunks.append(list(range(start, end)))
+        start = end
+    return chunks
+
+
+def _run_chunk(operations, chunk, events, attempts, backoff):
+    """Exécute un lot sur une connexion du pool, avec reprise sur erreur SSH transitoire
+
+    Seules les opérations sans résultat sont rejouées. Une opération commencée
+    (START) mais non terminée (END) au moment de la coupure a pu aboutir : si
+    elle répond « existe déjà » une fois rejouée, son résultat est marqué
+    `retried`. Une opération qui n'avait pas commencé garde le sens habituel de
+    « existe déjà » (compte préexistant). Toute autre erreur est convertie en
+    résultats `error` pour les opérations restantes du lot, sans interrompre
+    les autres lots.
+    """
+    done = {}
+    started = set()
+    retried = set()
+
+    def on_result(idx, result):
+        if idx in retried:
+            result["retried"] = True
+        done[idx] = result
+        events.put((idx, result))
+
+    for attempt in range(1, attempts + 1):
+        remaining = []
+        for idx in chunk:
+            if idx in done:
+                continue
+            op = operations[idx]
+            requires = op.get("requires")
+            if requires is not None and requires in done:
+                # Dépendance déjà traitée lors d'une tentative précédente
+                if done[requires]["status"] != "ok":
+                    on_result(idx, _skipped_result(op))
+                    continue
+                op = dict(op, requires=None)
+            elif requires is not None and attempt > 1:
+                # La dépendance est rejouée et peut répondre « existe déjà » si elle
+                # avait abouti avant la coupure : l'opération est exécutée sans condition
+                op = dict(op, requires=None)
+            remaining.append((idx, op))
+        if not remaining:
+            break
+
+        try:
+            with ssh_connection(config.SAMBA_SERVER, config.SAMBA_USER, config.SAMBA_PWD) as client:
+                if client is None:
+                    raise ConnectionError("Impossible de se connecter au serveur SAMBA")
+                execute_samba_batch(client, [op for _, op in remaining], config.SAMBA_PWD,
+                                    indexes=[idx for idx, _ in remaining], on_result=on_result,
+                                    on_start=started.add)
+            break
+        except TRANSIENT_ERRORS as e:
+            if attempt == attempts:
+                status = "unreachable" if isinstance(e, ConnectionError) and not done else "error"
+                for idx, op in remaining:
+                    if idx not in done:
+                        on_result(idx, _make_result(op, None, error=str(e), status=status))
+                break
+            delay = backoff * (2 ** (attempt - 1)) * (1 + random.random() / 2)
+            logger.warning(f"Erreur SSH transitoire ({e}), nouvelle tentative {attempt + 1}/{attempts} dans {delay:.1f}s")
+            retried.update(idx for idx in started if idx not in done)
+            time.sleep(delay)
+        except Exception as e:
+            logger.error(f"Erreur inattendue sur un lot samba-tool: {e}")
+            for idx, op in remaining:
+                if idx not in done:
+                    on_result(idx, _make_result(op, None, error=str(e), status="error"))
+            break
+    return done
+
+
+def run_samba_batch(operations, batch_size=None, progress_callback=None, concurrency=None):
+    """Exécute une liste d'opérations par lots, en parallèle sur plusieurs connexions du pool
+
+    Au plus `concurrency` lots (SAMBA_CREATION_CONCURRENCY) s'exécutent en même
+    temps, chacun sur sa propre connexion SSH. `progress_callback(terminées,
+    total)` est appelé depuis le thread appelant (compatible Streamlit) au fil
+    des résultats. Retourne la liste des résultats, dans l'ordre des opérations.
+    """
+    batch_size = batch_size or getattr(config, 'SAMBA_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    concurrency = max(1, concurrency or getattr(config, 'SAMBA_CREATION_CONCURRENCY', DEFAULT_CONCURRENCY))
+    attempts = max(1, getattr(config, 'SAMBA_RETRY_ATTEMPTS', DEFAULT_RETRY_ATTEMPTS))
+    backoff = getattr(config, 'SAMBA_RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF)
+    total = len(operations)
+    if total == 0:
+        return []
+
+    # Assez de lots pour occuper tous les workers, sans dépasser la taille maximale
+    batch_size = max(1, min(batch_size, math.ceil(total / concurrency)))
+    chunks = _split_chunks(operations, batch_size)
+
+    results = {}
+    events = queue.Queue()
+
+    def drain(block_timeout=None):
+        try:
+            while True:
+                idx, result = events.get(timeout=block_timeout) if block_timeout else events.get_nowait()
+                block_timeout = None
+                results[idx] = result
+                if progress_callback:
+                    progress_callback(len(results), total)
+        except queue.Empty:
+            pass
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(chunks)), thread_name_prefix="samba-batch") as executor:
+        futures = [executor.submit(_run_chunk, operations, chunk, events, attempts, backoff) for chunk in chunks]
+        pending = set(futures)
+        while pending:
+            drain(block_timeout=0.2)
+            pending = {future for future in pending if not future.done()}
+        drain()
+        for future in futures:
+            # Chaque lot retourne un résultat par opération, même en cas d'erreur
+            results.update(future.result())
+
+    return [results[idx] for idx in range(total)]
+
+
+def is_success(result):
+    """Indique si une opération a abouti (y compris 'déjà existant' / 'déjà membre')"""
+    return result["status"] in ("ok", "exists", "already_member")
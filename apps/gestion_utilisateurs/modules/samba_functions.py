@@ -12,6 +12,7 @@ import config
 
 # Import des utilitaires locaux
 from .utils import ssh_connection, execute_ssh_command, logger
+from .samba_batch import op_create_user, op_add_group, op_add_members, run_samba_batch
 
 
 def get_all_samba_users():
@@ -208,31 +209,25 @@ def add_students_to_wifi_group_by_description(descriptions_filter, target_group=
         
         st.info(f"🔍 {len(matching_users)} utilisateurs trouvés correspondant aux critères")
         
-        # Connexion SSH et ajout au groupe
-        with ssh_connection(config.SAMBA_SERVER, config.SAMBA_USER, config.SAMBA_PWD) as client:
-            if client:
-                # Créer le groupe WIFI s'il n'existe pas
-                create_group_cmd = f"sudo -S samba-tool group add {target_group} || true"
-                output, error = execute_ssh_command(client, create_group_cmd, config.SAMBA_PWD)
-                
-                # Ajouter chaque utilisateur au groupe WIFI
-                for user in matching_users:
-                    username = user['Login']
-                    user_class = user['Classe'] if 'Classe' in user else 'N/A'
-                    
-                    add_to_group_cmd = f"sudo -S samba-tool group addmembers {target_group} {username}"
-                    output, error = execute_ssh_command(client, add_to_group_cmd, config.SAMBA_PWD)
-                    
-                    if error:
-                        if "is already a member" in error.lower():
-                            results.append(f"ℹ️ {username} ({user_class}) : Déjà membre du groupe {target_group}")
-                        else:
-                            results.append(f"❌ {username} ({user_class}) : {error}")
-                    else:
-                        results.append(f"✅ {username} ({user_class}) : Ajouté au groupe {target_group}")
-                        added_count += 1
+        # Création du groupe s'il n'existe pas, puis ajout des utilisateurs par lots
+        group_result = run_samba_batch([op_add_group(target_group)])[0]
+        if group_result["status"] == "unreachable":
+            st.error("❌ Impossible de se connecter au serveur Samba")
+            return results, 0
+        
+        batch_results = run_samba_batch([op_add_members(target_group, user['Login']) for user in matching_users])
+        
+        for user, result in zip(matching_users, batch_results):
+            username = user['Login']
+            user_class = user['Classe'] if 'Classe' in user else 'N/A'
+            
+            if result["status"] == "already_member":
+                results.append(f"ℹ️ {username} ({user_class}) : Déjà membre du groupe {target_group}")
+            elif result["status"] == "ok":
+                results.append(f"✅ {username} ({user_class}) : Ajouté au groupe {target_group}")
+                added_count += 1
             else:
-                st.error("❌ Impossible de se connecter au serveur Samba")
+                results.append(f"❌ {username} ({user_class}) : {result['error']}")
                 
     except Exception as e:
         st.error(f"❌ Erreur lors de l'ajout au groupe WIFI : {e}")
@@ -295,6 +290,53 @@ def create_samba_user(username, password, prenom, nom, classe_normalized, groupe
         return False, f"Erreur générale: {str(e)}"
 
 
+def create_samba_users_batch(users, progress_callback=None):
+    """Crée plusieurs utilisateurs SAMBA en un seul lot de commandes
+    
+    `users` est une liste de dictionnaires (username, password, prenom, nom,
+    classe, groupe). Retourne une liste de (succès, message, créé) dans le même
+    ordre ; `créé` vaut False pour un compte déjà existant.
+    """
+    operations = []
+    indexes = []
+    for user in users:
+        create_index = len(operations)
+        operations.append(op_create_user(
+            user['username'], user['password'],
+            given_name=user.get('prenom', ''), surname=user.get('nom', ''),
+            description=user.get('classe', '')
+        ))
+        group_index = None
+        if user.get('groupe'):
+            group_index = len(operations)
+            operations.append(op_add_members(user['groupe'], user['username'], requires=create_index))
+        indexes.append((create_index, group_index))
+    
+    batch_results = run_samba_batch(operations, progress_callback=progress_callback)
+    
+    outcomes = []
+    for user, (create_index, group_index) in zip(users, indexes):
+        username = str(user['username']).strip()
+        create_result = batch_results[create_index]
+        group_result = batch_results[group_index] if group_index is not None else None
+        
+        if create_result["status"] == "exists" and create_result.get("retried"):
+            # Création rejouée après une coupure SSH : le compte a été créé par la première tentative
+            logger.warning(f"Utilisateur {username} créé avant une coupure SSH (création rejouée)")
+            outcomes.append((True, f"Utilisateur {username} créé avec succès", True))
+        elif create_result["status"] == "exists":
+            logger.info(f"Utilisateur {username} existe déjà dans SAMBA")
+            outcomes.append((True, f"Utilisateur {username} existe déjà (non créé)", False))
+        elif create_result["status"] != "ok":
+            outcomes.append((False, f"Erreur création utilisateur: {create_result['error']}", False))
+        else:
+            if group_result is not None and group_result["status"] not in ("ok", "already_member"):
+                # Ne pas échouer complètement pour les problèmes de groupe
+                logger.warning(f"Avertissement groupe pour {username}: {group_result['error']}")
+            outcomes.append((True, f"Utilisateur {username} créé avec succès", True))
+    return outcomes
+
+
 def delete_samba_user(username):
     """Supprime un utilisateur SAMBA"""
     try:
@@ -0,0 +1,187 @@
+"""
+Module d'inventaire des utilisateurs SAMBA
+
+Tous les comptes et leurs attributs (sn, givenName, description, memberOf) sont
+récupérés par une seule commande `ldbsearch` au format LDIF, analysée au fil de
+l'eau, au lieu d'un `samba-tool user show` par utilisateur.
+"""
+import base64
+import logging
+import shlex
+import sys
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+from .db_pool import bulk_upsert, db_connection
+from .utils import ssh_connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LDB_URL = "/var/lib/samba/private/sam.ldb"
+USER_FILTER = "(&(objectCategory=person)(objectClass=user))"
+INVENTORY_ATTRIBUTES = ["sAMAccountName", "sn", "givenName", "description", "comment", "memberOf"]
+
+
+def build_inventory_command():
+    """Construit la commande ldbsearch récupérant tous les utilisateurs"""
+    ldb_url = getattr(config, 'SAMBA_LDB_URL', DEFAULT_LDB_URL)
+    args = ["ldbsearch", "-H", ldb_url, USER_FILTER] + INVENTORY_ATTRIBUTES
+    return "sudo -S -p '' " + " ".join(shlex.quote(arg) for arg in args)
+
+
+def _decode_value(parts, is_base64):
+    value = "".join(parts)
+    if is_base64:
+        try:
+            return base64.b64decode(value).decode("utf-8", errors="replace")
+        except Exception:
+            logger.warning(f"Valeur LDIF base64 invalide ignorée: {value[:40]}")
+            return ""
+    return value
+
+
+def iter_ldif_records(lines):
+    """Analyse un flux LDIF ligne par ligne et produit un dictionnaire par entrée
+
+    Chaque entrée est de la forme {attribut: [valeurs]}. Les lignes de
+    continuation (commençant par une espace) et les valeurs encodées en base64
+    (`attribut:: ...`) sont prises en charge.
+    """
+    record = {}
+    current = None  # (attribut, base64, morceaux de valeur)
+
+    def flush():
+        if current is not None:
+            attr, is_base64, parts = current
+            record.setdefault(attr, []).append(_decode_value(parts, is_base64))
+
+    for raw_line in lines:
+        line = raw_line.rstrip("\r\n")
+
+        if line.startswith(" ") and current is not None:
+            current[2].append(line[1:])
+            continue
+
+        flush()
+        current = None
+
+        if not line:
+            if record:
+                yield record
+                record = {}
+            continue
+        if line.startswith("#") or ":" not in line:
+            continue
+
+        attr, _, rest = line.partition(":")
+        is_base64 = rest.startswith(":")
+        if is_base64:
+            rest = rest[1:]
+        current = (attr.strip(), is_base64, [rest.lstrip()])
+
+    flush()
+    if record:
+        yield record
+
+
+def user_details_from_record(record):
+    """Convertit une entrée LDIF en enregistrement Login/Nom/Prénom/Classe/Groupe"""
+    username = (record.get("sAMAccountName") or [""])[0].strip()
+    user_info = {
+        'Login': username,
+        'Nom': '',
+        'Prénom': '',
+        'Classe': '',
+        'Groupe': ''
+    }
+
+    for value in record.get("sn", []):
+        user_info['Nom'] = value.strip()
+    for value in record.get("givenName", []):
+        user_info['Prénom'] = value.strip()
+    for value in record.get("description", []) + record.get("comment", []):
+        value = value.strip()
+        if value and not any(kw in value.lower() for kw in ['warning', 'note', 'sudo']):
+            user_info['Classe'] = value
+    for value in record.get("memberOf", []):
+        # Extraire le groupe (premier CN=)
+        if 'CN=' in value:
+            group = value.split('CN=')[1].split(',')[0]
+            if group and not any(kw in group.lower() for kw in ['users', 'domain']):
+                user_info['Groupe'] = group
+
+    # Si sn et givenName ne sont pas trouvés, extraire depuis le login
+    # Format attendu: prenom.nom
+    if not user_info['Nom'] and not user_info['Prénom'] and '.' in username:
+        parts = username.split('.')
+        if len(parts) >= 2:
+            user_info['Prénom'] = parts[0].capitalize()
+            user_info['Nom'] = parts[1].upper()
+
+    return user_info
+
+
+def parse_inventory(lines, progress_callback=None):
+    """Produit la liste des utilisateurs à partir de la sortie LDIF de ldbsearch"""
+    ignored_users = {u.lower() for u in config.get_ignored_users()}
+    users_details = []
+
+    for record in iter_ldif_records(lines):
+        user_info = user_details_from_record(record)
+        username = user_info['Login']
+        if len(username) < 3 or username.endswith('$') or username.lower() in ignored_users:
+            continue
+        users_details.append(user_info)
+        if progress_callback:
+            progress_callback(len(users_details))
+
+    return users_details
+
+
+def fetch_samba_inventory(progress_callback=None, timeout=120):
+    """Récupère tous les utilisateurs SAMBA et leurs attributs en une seule commande
+
+    Retourne (users_details, erreur) ; `erreur` vaut None en cas de succès.
+    `progress_callback(nombre)` est appelé après chaque utilisateur analysé.
+    """
+    with ssh_connection(config.SAMBA_SERVER, config.SAMBA_USER, config.SAMBA_PWD) as client:
+        if client is None:
+            return [], "Impossible de se connecter au serveur SAMBA"
+
+        stdin, stdout, stderr = client.exec_command(build_inventory_command(), timeout=timeout)
+        stdin.write(f"{config.SAMBA_PWD}\n")
+        stdin.flush()
+        stdin.channel.shutdown_write()
+
+        users_details = parse_inventory((line for line in stdout), progress_callback)
+        exit_status = stdout.channel.recv_exit_status()
+        error = stderr.read().decode("utf-8", errors="ignore").strip()
+
+    if exit_status != 0 and not users_details:
+        logger.error(f"Erreur ldbsearch (code {exit_status}): {error}")
+        return [], error or f"ldbsearch a échoué (code {exit_status})"
+
+    logger.info(f"Inventaire SAMBA: {len(users_details)} utilisateurs récupérés")
+    return users_details, None
+
+
+def save_inventory_to_db(users_details):
+    """Insère ou met à jour les utilisateurs de l'inventaire dans la table utilisateurs
+
+    Retourne les compteurs {"inserted", "updated", "unchanged"}. Les mots de passe
+    connus ne sont pas modifiés, la date de modification seulement si le compte a changé.
+    """
+    with db_connection() as conn:
+        counts = bulk_upsert(
+            conn, "utilisateurs", ["Login", "Nom", "Prénom", "Classe", "Groupe"],
+            [(user['Login'], user['Nom'], user['Prénom'], user['Classe'], user['Groupe']) for user in users_details],
+            key_columns=["Login"], update_columns=["Nom", "Prénom", "Classe", "Groupe"],
+            constants={"Mot_de_passe": "'****'", "Dernière_modification": "NOW()"},
+            touch_column="Dernière_modification")
+        conn.commit()
+
+    logger.info(f"Inventaire SAMBA: {counts['inserted']} ajouté(s), {counts['updated']} mis à jour, "
+                f"{counts['unchanged']} inchangé(s) dans MySQL")
+    return counts
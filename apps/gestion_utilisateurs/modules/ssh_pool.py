@@ -0,0 +1,235 @@
+"""
+Module du pool de connexions SSH partagé pour les opérations SAMBA
+"""
+import atexit
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import paramiko
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class SSHConnectionPool:
+    """Pool de connexions SSH réutilisables, indexées par (serveur, port, utilisateur)
+
+    Chaque connexion empruntée est exclusive jusqu'à sa restitution. Les connexions
+    inactives depuis plus de `idle_timeout` secondes sont fermées, et une connexion
+    restée inutilisée plus de `health_check_interval` secondes est vérifiée avant
+    d'être redonnée.
+    """
+
+    def __init__(self, max_size=4, idle_timeout=300, connect_timeout=30,
+                 checkout_timeout=60, health_check_interval=30):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = {}      # clé -> liste de (client, date de dernière utilisation)
+        self._in_use = {}    # clé -> nombre de connexions empruntées
+        self._owners = {}    # id(client) -> clé
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'discarded': 0,
+            'evicted': 0,
+            'connect_errors': 0,
+            'checkout_time_total': 0.0,
+            'checkout_time_max': 0.0,
+            'connect_time_total': 0.0,
+        }
+
+    # ------------------------------------------------------------------ interne
+
+    @staticmethod
+    def _is_alive(client, deep=False):
+        """Vérifie que le transport SSH est toujours actif"""
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if deep:
+            try:
+                transport.send_ignore()
+            except Exception:
+                return False
+        return True
+
+    @staticmethod
+    def _close_quietly(client):
+        try:
+            client.close()
+        except Exception as close_error:
+            logger.error(f"Erreur lors de la fermeture SSH: {close_error}")
+
+    def _total(self, key):
+        return self._in_use.get(key, 0) + len(self._idle.get(key, []))
+
+    def _evict_idle_locked(self, now):
+        """Retire les connexions inactives trop anciennes (appelé sous verrou)"""
+        expired = []
+        for key, entries in self._idle.items():
+            kept = []
+            for client, last_used in entries:
+                if now - last_used > self.idle_timeout:
+                    expired.append(client)
+                else:
+                    kept.append((client, last_used))
+            self._idle[key] = kept
+        self._stats['evicted'] += len(expired)
+        return expired
+
+    def _connect(self, server, port, username, password):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(server, port=port, username=username, password=password,
+                       timeout=self.connect_timeout)
+        transport = client.get_transport()
+        if transport is not None:
+            transport.set_keepalive(30)
+        return client
+
+    # ------------------------------------------------------------------ API
+
+    def acquire(self, server, username, password, port=22):
+        """Emprunte une connexion au pool (ou en ouvre une nouvelle)"""
+        key = (server, port, username)
+        start = time.monotonic()
+        deadline = start + self.checkout_timeout
+
+        while True:
+            candidate = None
+            reserved = False
+            with self._cond:
+                expired = self._evict_idle_locked(time.monotonic())
+                idle = self._idle.setdefault(key, [])
+                if idle:
+                    candidate = idle.pop()
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                elif self._total(key) < self.max_size:
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                    reserved = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"Aucune connexion SSH disponible vers {server} après {self.checkout_timeout}s"
+                        )
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+            for client in expired:
+                self._close_quietly(client)
+
+            if candidate is not None:
+                client, last_used = candidate
+                deep = time.monotonic() - last_used > self.health_check_interval
+                if self._is_alive(client, deep=deep):
+                    self._register_checkout(key, client, start, hit=True)
+                    return client
+                # Connexion morte : on la jette et on recommence
+                self._close_quietly(client)
+                with self._cond:
+                    self._in_use[key] -= 1
+                    self._stats['discarded'] += 1
+                    self._cond.notify()
+                continue
+
+            if reserved:
+                connect_start = time.monotonic()
+                try:
+                    client = self._connect(server, port, username, password)
+                except Exception:
+                    with self._cond:
+                        self._in_use[key] -= 1
+                        self._stats['connect_errors'] += 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['connect_time_total'] += time.monotonic() - connect_start
+                self._register_checkout(key, client, start, hit=False)
+                return client
+
+    def _register_checkout(self, key, client, start, hit):
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._owners[id(client)] = key
+            self._stats['hits' if hit else 'misses'] += 1
+            self._stats['checkout_time_total'] += elapsed
+            self._stats['checkout_time_max'] = max(self._stats['checkout_time_max'], elapsed)
+
+    def release(self, client, discard=False):
+        """Restitue une connexion au pool (ou la ferme si elle est inutilisable)"""
+        with self._cond:
+            key = self._owners.pop(id(client), None)
+            if key is None:
+                return
+            self._in_use[key] -= 1
+            keep = not discard and self._is_alive(client)
+            if keep:
+                self._idle.setdefault(key, []).append((client, time.monotonic()))
+            else:
+                self._stats['discarded'] += 1
+            self._cond.notify()
+        if not keep:
+            self._close_quietly(client)
+
+    @contextmanager
+    def connection(self, server, username, password, port=22):
+        """Context manager : emprunte une connexion et la restitue à la sortie"""
+        client = self.acquire(server, username, password, port=port)
+        discard = False
+        try:
+            yield client
+        except Exception:
+            discard = True
+            raise
+        finally:
+            self.release(client, discard=discard)
+
+    def close_all(self):
+        """Ferme toutes les connexions inactives du pool"""
+        with self._cond:
+            clients = [client for entries in self._idle.values() for client, _ in entries]
+            self._idle = {}
+        for client in clients:
+            self._close_quietly(client)
+
+    def get_stats(self):
+        """Retourne les compteurs du pool (hits, misses, latences...)"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['idle'] = sum(len(entries) for entries in self._idle.values())
+            stats['in_use'] = sum(self._in_use.values())
+        checkouts = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / checkouts if checkouts else 0.0
+        stats['checkout_time_avg'] = stats['checkout_time_total'] / checkouts if checkouts else 0.0
+        stats['connect_time_avg'] = stats['connect_time_total'] / stats['misses'] if stats['misses'] else 0.0
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ssh_pool():
+    """Retourne le pool SSH partagé par tout le processus"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SSHConnectionPool(
+                max_size=getattr(config, 'SSH_POOL_MAX_SIZE', 4),
+                idle_timeout=getattr(config, 'SSH_POOL_IDLE_TIMEOUT', 300),
+                health_check_interval=getattr(config, 'SSH_POOL_HEALTH_CHECK_INTERVAL', 30),
+            )
+            atexit.register(_pool.close_all)
+        return _pool
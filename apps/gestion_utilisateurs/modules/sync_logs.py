@@ -0,0 +1,169 @@
+"""
+Module du flux de logs de la synchronisation Azure AD
+
+Un thread lit la sortie du script au fil de l'eau : les dernières lignes sont
+gardées dans un tampon circulaire borné (affichage en direct), et chaque ligne
+est écrite dans un fichier JSONL sur disque avec son niveau et l'objet concerné,
+ce qui permet de consulter et filtrer le journal complet après coup sans le
+garder en mémoire.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYNC_LOG_DIR = "/home/streamlit/data/sync_logs"
+
+LEVELS = ("ERROR", "WARNING", "INFO")
+
+# Clés identifiant l'objet concerné dans une ligne JSON du script
+OBJECT_KEYS = ("sourceanchor", "SourceAnchor", "onPremisesSamAccountName", "displayName")
+
+_ERROR_PATTERN = re.compile(r'error|traceback|exception|❌', re.IGNORECASE)
+_WARNING_PATTERN = re.compile(r'warning|⚠️', re.IGNORECASE)
+
+
+def _log_dir():
+    return getattr(config, 'SYNC_LOG_DIR', DEFAULT_SYNC_LOG_DIR)
+
+
+def new_spool_path(prefix="sync"):
+    """Chemin d'un nouveau journal complet (répertoire créé en 0700)"""
+    directory = _log_dir()
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    return os.path.join(directory, f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.jsonl")
+
+
+def list_spools(limit=20):
+    """Journaux complets disponibles, du plus récent au plus ancien"""
+    directory = _log_dir()
+    if not os.path.isdir(directory):
+        return []
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".jsonl")]
+    return sorted(paths, key=os.path.getmtime, reverse=True)[:limit]
+
+
+def purge_spools(keep=None):
+    """Supprime les journaux au-delà des `keep` plus récents (SYNC_LOG_KEEP)"""
+    if keep is None:
+        keep = getattr(config, 'SYNC_LOG_KEEP', 30)
+    for path in list_spools(limit=None)[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def classify_line(line):
+    """(niveau, objet) d'une ligne de sortie du script de synchronisation"""
+    obj = None
+    start = line.find("{")
+    if start >= 0:
+        try:
+            data = json.loads(line[start:])
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            candidates = [data] + [value for value in data.values() if isinstance(value, dict)]
+            for candidate in candidates:
+                obj = next((str(candidate[key]) for key in OBJECT_KEYS if candidate.get(key)), None)
+                if obj:
+                    break
+    if _ERROR_PATTERN.search(line):
+        return "ERROR", obj
+    if _WARNING_PATTERN.search(line):
+        return "WARNING", obj
+    return "INFO", obj
+
+
+class LogStream:
+    """Lecture en arrière-plan de la sortie d'un processus
+
+    `on_line(record)` est appelé depuis le thread de lecture pour chaque ligne
+    (journal d'une tâche par exemple).
+    """
+
+    def __init__(self, stream, spool_path=None, buffer_lines=None, on_line=None):
+        self.lines = deque(maxlen=buffer_lines or getattr(config, 'SYNC_LOG_BUFFER_LINES', 500))
+        self.spool_path = spool_path or new_spool_path()
+        self.total = 0
+        self.counts = {level: 0 for level in LEVELS}
+        self.last_activity = time.time()
+        self._on_line = on_line
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._read, args=(stream,), name="sync-log-reader", daemon=True)
+        self._thread.start()
+
+    def _read(self, stream):
+        try:
+            with open(self.spool_path, "a", encoding="utf-8", buffering=1) as spool:
+                for raw in iter(stream.readline, ""):
+                    line = raw.rstrip("\n")
+                    level, obj = classify_line(line)
+                    with self._lock:
+                        self.total += 1
+                        record = {"n": self.total, "t": time.time(), "level": level, "object": obj, "line": line}
+                        self.lines.append(line)
+                        self.counts[level] += 1
+                        self.last_activity = record["t"]
+                    spool.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    if self._on_line:
+                        self._on_line(record)
+        except Exception as e:
+            logger.error(f"Lecture des logs de synchronisation interrompue: {e}")
+
+    @property
+    def finished(self):
+        return not self._thread.is_alive()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def tail(self, count=30):
+        """(dernières lignes, nombre total de lignes lues)"""
+        with self._lock:
+            lines = list(self.lines)[-count:] if count else list(self.lines)
+            return lines, self.total
+
+    def idle_for(self):
+        """Secondes écoulées depuis la dernière ligne reçue"""
+        return time.time() - self.last_activity
+
+
+def read_spool(path, levels=None, search=None, limit=1000):
+    """Lignes d'un journal complet filtrées par niveau et par texte (objet ou contenu)
+
+    Retourne (enregistrements, nombre total de correspondances) ; seuls les
+    `limit` derniers enregistrements correspondants sont renvoyés.
+    """
+    matches = deque(maxlen=limit)
+    matched = 0
+    search = search.lower() if search else None
+    try:
+        with open(path, encoding="utf-8") as f:
+            for raw in f:
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    continue
+                if levels and record.get("level") not in levels:
+                    continue
+                if search and search not in (record.get("object") or "").lower() \
+                        and search not in record.get("line", "").lower():
+                    continue
+                matched += 1
+                matches.append(record)
+    except OSError as e:
+        logger.warning(f"Journal de synchronisation illisible ({path}): {e}")
+    return list(matches), matched
@@ -0,0 +1,136 @@
+"""
+Module du plan de synchronisation Azure AD
+
+Un dry run lancé avec `--plan-out` écrit la liste exacte des actions prévues
+(suppressions, envois d'objets, envois de mots de passe) avec l'empreinte de
+chaque objet. `--apply-plan` exécute ensuite ce plan sans relire tout
+l'annuaire si celui-ci n'a pas changé (même highestCommittedUSN), et écarte
+les actions dont l'empreinte ne correspond plus sinon. Le plan ne contient
+pas les hash NT des mots de passe (relus dans l'annuaire à l'application),
+mais la liste des comptes et les données envoyées : il est écrit en 0600 dans
+SYNC_PLAN_DIR (0700), supprimé par le script après application, et les plans
+jamais appliqués sont purgés après SYNC_PLAN_MAX_AGE secondes.
+"""
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYNC_PLAN_DIR = "/home/streamlit/data/sync_plans"
+# Même valeur par défaut que plan_max_age de run_sync.py : un plan plus ancien est refusé
+DEFAULT_PLAN_MAX_AGE = 3600
+PLAN_PREFIX = "aadsync_plan_"
+
+ACTION_LABELS = {
+    "delete": "🗑️ Suppression",
+    "send": "📤 Envoi",
+    "hashnt": "🔑 Mot de passe",
+}
+
+TYPE_LABELS = {
+    "user": "Utilisateur",
+    "group": "Groupe",
+    "device": "Appareil",
+}
+
+# Clés donnant un libellé lisible à un objet du plan
+LABEL_KEYS = ("onPremisesSamAccountName", "displayName", "mailNickname")
+
+
+def _plan_dir():
+    return getattr(config, 'SYNC_PLAN_DIR', DEFAULT_SYNC_PLAN_DIR)
+
+
+def purge_plans(max_age=None):
+    """Supprime les plans (et fichiers temporaires) plus anciens que SYNC_PLAN_MAX_AGE ; retourne leur nombre"""
+    if max_age is None:
+        max_age = getattr(config, 'SYNC_PLAN_MAX_AGE', DEFAULT_PLAN_MAX_AGE)
+    limit = time.time() - max_age
+    removed = 0
+    for path in glob.glob(os.path.join(_plan_dir(), f"{PLAN_PREFIX}*")):
+        try:
+            if os.path.getmtime(path) < limit:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def new_plan_file():
+    """Chemin d'un fichier (0600, répertoire en 0700) destiné au plan d'un dry run"""
+    directory = _plan_dir()
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    purge_plans()
+    fd, path = tempfile.mkstemp(prefix=PLAN_PREFIX, suffix=".json", dir=directory)
+    os.close(fd)
+    return path
+
+
+def plan_args(plan_out=None, apply_plan=None):
+    """Arguments de run_sync.py pour écrire ou appliquer un plan"""
+    args = []
+    if plan_out:
+        args += ["--plan-out", plan_out]
+    if apply_plan:
+        args += ["--apply-plan", apply_plan]
+    return args
+
+
+def _label(entry, data):
+    if isinstance(data, dict):
+        return next((str(data[key]) for key in LABEL_KEYS if data.get(key)), entry)
+    return entry
+
+
+def load_plan_overview(path):
+    """Aperçu d'un plan sans les données envoyées ni les hash ; None s'il n'est pas (encore) écrit
+
+    Retourne {"created", "age", "usn", "counts": {action: nombre}, "actions": [lignes]}.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            content = f.read()
+        if not content.strip():
+            return None
+        plan = json.loads(content)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Plan de synchronisation illisible ({path}): {e}")
+        return None
+
+    actions = []
+    for object_type, entries in plan.get("delete", {}).items():
+        for entry, data in entries.items():
+            actions.append({"Action": ACTION_LABELS["delete"], "Type": TYPE_LABELS.get(object_type, object_type),
+                            "Objet": _label(entry, data), "Ancre": entry})
+    for object_type, entries in plan.get("send", {}).items():
+        for entry, action in entries.items():
+            actions.append({"Action": ACTION_LABELS["send"], "Type": TYPE_LABELS.get(object_type, object_type),
+                            "Objet": _label(entry, action.get("data")), "Ancre": entry})
+    for entry, action in plan.get("hashnt", {}).items():
+        actions.append({"Action": ACTION_LABELS["hashnt"], "Type": TYPE_LABELS["user"],
+                        "Objet": action.get("account") or entry, "Ancre": entry})
+
+    counts = {action: sum(1 for row in actions if row["Action"] == label) for action, label in ACTION_LABELS.items()}
+    return {"created": plan.get("created"), "age": time.time() - plan.get("created", time.time()),
+            "usn": plan.get("usn"), "counts": counts, "actions": actions}
+
+
+def discard_plan(path):
+    """Supprime un plan non appliqué"""
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
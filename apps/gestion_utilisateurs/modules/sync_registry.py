@@ -0,0 +1,190 @@
+"""
+Module du registre des exécutions de la synchronisation Azure AD
+
+`run_sync.py` prend un verrou exclusif (flock) sur un fichier pendant chaque
+cycle et y écrit son PID, l'identifiant de l'exécution et un battement de cœur ;
+chaque exécution est aussi enregistrée dans la table `sync_run` de sa base
+d'état SQLite (statut, journal, résumé). Le portail lit ces informations pour
+suivre une synchronisation en cours au lieu de la tuer, et attendre sa fin
+avant d'en lancer une autre.
+"""
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYNC_STATE_DB = "/home/samba-sync-ad/azure_objects.db"
+# run_sync.py écrit son battement de cœur toutes les 10 secondes
+DEFAULT_HEARTBEAT_TIMEOUT = 60
+
+RUN_STATUS_LABELS = {
+    "running": "🔄 En cours",
+    "success": "✅ Terminée",
+    "errors": "⚠️ Terminée avec erreurs",
+    "failed": "❌ Échec",
+    "interrupted": "⏹️ Interrompue",
+}
+
+
+def _state_db():
+    return getattr(config, 'SYNC_STATE_DB', DEFAULT_SYNC_STATE_DB)
+
+
+def _lock_file():
+    return getattr(config, 'SYNC_LOCK_FILE', None) or _state_db() + ".lock"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Processus d'un autre utilisateur (compte de synchronisation)
+        return True
+    except (TypeError, ValueError, OSError):
+        return False
+    return True
+
+
+def _heartbeat_age(info):
+    try:
+        return time.time() - datetime.datetime.fromisoformat(str(info["heartbeat"])).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def lock_holder():
+    """Contenu du fichier de verrou s'il est tenu par une synchronisation, sinon None
+
+    Le verrou n'est pas testé par flock : même un verrou partagé bref ferait
+    échouer le `LOCK_EX | LOCK_NB` de run_sync.py. Le fichier est lu seulement :
+    il est vide hors d'un cycle, et sinon le processus indiqué doit exister et
+    son battement de cœur dater de moins de SYNC_HEARTBEAT_TIMEOUT secondes.
+    """
+    path = _lock_file()
+    info = None
+    for attempt in range(3):
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                content = f.read()
+        except OSError:
+            return None
+        if not content.strip():
+            return None
+        try:
+            info = json.loads(content)
+            break
+        except ValueError:
+            # Battement de cœur en cours d'écriture
+            time.sleep(0.05)
+    if not isinstance(info, dict) or not _pid_alive(info.get("pid")):
+        return None
+    age = _heartbeat_age(info)
+    if age is None or age > getattr(config, 'SYNC_HEARTBEAT_TIMEOUT', DEFAULT_HEARTBEAT_TIMEOUT):
+        return None
+    return info
+
+
+def _query(sql, params=()):
+    path = _state_db()
+    if not os.path.exists(path):
+        return []
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=10)
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict(row) for row in conn.execute(sql, params)]
+    except sqlite3.OperationalError:
+        # Table sync_run pas encore créée (aucune exécution depuis la mise à jour)
+        return []
+    finally:
+        conn.close()
+
+
+def _with_status(run, holder):
+    """Une exécution « running » dont le processus ne tient plus le verrou est interrompue"""
+    if run["status"] == "running" and (not holder or holder.get("run_id") != run["id"]):
+        run["status"] = "interrupted"
+    run["status_label"] = RUN_STATUS_LABELS.get(run["status"], run["status"])
+    if run.get("summary"):
+        try:
+            run["summary"] = json.loads(run["summary"])
+        except ValueError:
+            run["summary"] = None
+    return run
+
+
+def current_run():
+    """Exécution en cours (dictionnaire de la table sync_run), ou None
+
+    Si le fichier de verrou désigne un cycle sans exécution enregistrée,
+    seules les informations du verrou sont
+    retournées.
+    """
+    holder = lock_holder()
+    if holder is None:
+        return None
+    runs = _query("SELECT * FROM sync_run WHERE id = ?", (holder.get("run_id"),)) if holder.get("run_id") else []
+    if runs:
+        return _with_status(runs[0], holder)
+    return {"id": None, "pid": holder.get("pid"), "status": "running", "status_label": RUN_STATUS_LABELS["running"],
+            "started": holder.get("started"), "heartbeat": holder.get("heartbeat"), "log_file": None, "mode": None}
+
+
+def recent_runs(limit=20):
+    """Dernières exécutions, de la plus récente à la plus ancienne"""
+    holder = lock_holder()
+    return [_with_status(run, holder) for run in
+            _query("SELECT * FROM sync_run ORDER BY id DESC LIMIT ?", (limit,))]
+
+
+def tail_log(path, offset=0, lines=None):
+    """Lignes ajoutées à un journal depuis `offset` : (lignes, nouvel offset)
+
+    Accepte les journaux JSONL du portail (champ `line`) comme les journaux texte
+    du mode service ; seules les `lines` dernières lignes sont gardées.
+    """
+    result = deque(maxlen=lines)
+    if not path or not os.path.exists(path):
+        return list(result), offset
+    with open(path, "rb") as f:
+        f.seek(offset)
+        chunk = f.read()
+    # Ne pas couper une ligne en cours d'écriture
+    end = chunk.rfind(b"\n") + 1
+    for raw in chunk[:end].decode("utf-8", "replace").splitlines():
+        try:
+            record = json.loads(raw)
+            line = record["line"] if isinstance(record, dict) and "line" in record else raw
+        except ValueError:
+            line = raw
+        result.append(line)
+    return list(result), offset + end
+
+
+def wait_until_idle(poll_interval=5, cancelled=None, on_wait=None):
+    """Attend la fin de la synchronisation en cours
+
+    `cancelled()` interrompt l'attente (retourne False) ; `on_wait(run)` est
+    appelé au début de l'attente.
+    """
+    run = current_run()
+    if run is None:
+        return True
+    if on_wait:
+        on_wait(run)
+    while current_run() is not None:
+        if cancelled and cancelled():
+            return False
+        time.sleep(poll_interval)
+    return True
@@ -0,0 +1,118 @@
+"""
+Module du résumé structuré de la synchronisation Azure AD
+
+`run_sync.py` écrit un résumé JSON (compteurs par type d'objet, erreurs,
+durée de chaque phase, objets traités) dans le fichier désigné par la
+variable d'environnement AADSYNC_SUMMARY_FILE. Le portail lit ce fichier au
+lieu d'analyser la sortie texte ; l'analyse des lignes du résumé texte reste
+disponible en secours (ancien script de synchronisation).
+"""
+import json
+import logging
+import os
+import re
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_ENV_VAR = "AADSYNC_SUMMARY_FILE"
+
+OBJECT_TYPES = ("user", "group", "device", "hashnt")
+
+
+def new_summary_file():
+    """Chemin d'un fichier temporaire (0600) destiné au résumé d'une exécution"""
+    fd, path = tempfile.mkstemp(prefix="aadsync_summary_", suffix=".json")
+    os.close(fd)
+    return path
+
+
+def load_summary(path, remove=True):
+    """Lit le résumé JSON écrit par run_sync.py ; None s'il est absent ou vide"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            content = f.read()
+        return json.loads(content) if content.strip() else None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Résumé de synchronisation illisible ({path}): {e}")
+        return None
+    finally:
+        if remove:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _empty_summary():
+    return {"version": 1, "status": None, "dry_run": False, "duration": None, "phases": {},
+            "objects": {}, "outcomes": {}, "errors": []}
+
+
+def _counts(summary, object_type):
+    return summary["objects"].setdefault(object_type, {"sent": 0, "errors": 0, "deleted": 0, "delete_errors": 0})
+
+
+def summary_from_lines(lines):
+    """Reconstruit un résumé à partir des lignes du résumé texte (secours)
+
+    Un seul parcours : la section courante (utilisateurs, groupes, mots de
+    passe) est mémorisée au fil des lignes.
+    """
+    summary = _empty_summary()
+    section = None
+    in_user_names = False
+
+    for line in lines:
+        if "UTILISATEURS" in line:
+            section = "user"
+        elif "GROUPES" in line:
+            section = "group"
+            in_user_names = False
+        elif "MOTS DE PASSE" in line:
+            section = "hashnt"
+            in_user_names = False
+
+        match = re.search(r'Durée: ([\d.]+) secondes', line)
+        if match:
+            summary["duration"] = float(match.group(1))
+        if "Mode: DRY RUN" in line:
+            summary["dry_run"] = True
+        match = re.search(r'Taux de réussite: ([\d.]+)%', line)
+        if match:
+            summary["success_rate"] = float(match.group(1))
+
+        match = re.search(r'Hash synchronisés: (\d+)', line)
+        if match:
+            _counts(summary, "hashnt")["sent"] = int(match.group(1))
+        elif section:
+            match = re.search(r'Synchronisés: (\d+)', line)
+            if match:
+                _counts(summary, section)["sent"] = int(match.group(1))
+            match = re.search(r'Erreurs: (\d+)', line)
+            if match:
+                _counts(summary, section)["errors"] = int(match.group(1))
+
+        if "Premiers utilisateurs synchronisés:" in line:
+            in_user_names = True
+        elif in_user_names and line.strip().startswith("- "):
+            match = re.search(r'- ([^\s]+)', line.strip())
+            if match:
+                summary["outcomes"].setdefault("user", {}).setdefault("sent", []).append(match.group(1))
+
+    return summary
+
+
+def summary_totals(summary):
+    """(objets réussis, erreurs, taux de réussite en %) d'un résumé"""
+    ok = sum(summary["objects"].get(t, {}).get("sent", 0) + summary["objects"].get(t, {}).get("deleted", 0)
+             for t in OBJECT_TYPES)
+    errors = sum(summary["objects"].get(t, {}).get("errors", 0) + summary["objects"].get(t, {}).get("delete_errors", 0)
+                 for t in OBJECT_TYPES)
+    if summary.get("success_rate") is not None:
+        rate = summary["success_rate"]
+    else:
+        rate = 100.0 * ok / (ok + errors) if ok + errors else 100.0
+    return ok, errors, rate
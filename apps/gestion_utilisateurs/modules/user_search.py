@@ -0,0 +1,188 @@
+"""
+Module de recherche des comptes de la table utilisateurs
+
+La recherche est faite par MySQL au lieu de charger toute la table dans pandas.
+Chaque mot saisi doit être le début du login, du prénom ou du nom
+(`LIKE 'mot%'`), ce qui permet à MySQL d'utiliser un index B-tree sur chacune
+de ces colonnes (fusion d'index pour le OU) au lieu de parcourir la table.
+Prénom et nom sont lus dans des colonnes générées VIRTUAL indexées, en
+collation insensible à la casse et aux accents : 'helene' trouve 'Hélène'.
+Les résultats sont classés (login exact d'abord, puis nom et prénom) et paginés
+par LIMIT/OFFSET.
+
+    page = search_users("dup", limit=20, offset=0)
+    page["total"], page["results"]
+
+Les colonnes et index sont créés par une étape d'installation explicite, pas
+par une recherche :
+
+    cd /home/streamlit/apps/gestion_utilisateurs && python -m modules.user_search --migrate
+
+Tant qu'ils n'existent pas, la recherche fonctionne avec les mêmes conditions,
+sans index.
+"""
+import argparse
+import logging
+import sys
+import threading
+import unicodedata
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+from .db_pool import db_connection
+
+logger = logging.getLogger(__name__)
+
+USERS_TABLE = "utilisateurs"
+# Collation insensible à la casse et aux accents
+SEARCH_COLLATION = "utf8mb4_general_ci"
+# Colonne générée -> (colonne source, index)
+SEARCH_COLUMNS = {
+    "Recherche_prenom": ("Prénom", "idx_utilisateurs_recherche_prenom"),
+    "Recherche_nom": ("Nom", "idx_utilisateurs_recherche_nom"),
+}
+LOGIN_INDEX = "idx_utilisateurs_login"
+DEFAULT_PAGE_SIZE = 20
+
+RESULT_COLUMNS = """
+    Login,
+    Prénom,
+    Nom,
+    Mot_de_passe AS 'Mot de passe',
+    Classe,
+    Groupe,
+    Dernière_modification AS 'Date création',
+    ID_Unique AS 'ID Unique'
+"""
+
+_schema_lock = threading.Lock()
+_search_ready = False  # revérifié à chaque recherche tant que la migration n'est pas faite
+
+
+def fold_text(text):
+    """Texte en minuscules, sans accents ni espaces superflus"""
+    text = unicodedata.normalize('NFKD', str(text or ""))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.lower().split())
+
+
+def _like_escape(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _existing_columns(cursor):
+    cursor.execute("""
+    SELECT COLUMN_NAME FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (USERS_TABLE,))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _indexed_columns(cursor):
+    """{colonne: nom d'index} des colonnes en tête d'un index"""
+    cursor.execute("""
+    SELECT COLUMN_NAME, INDEX_NAME FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND SEQ_IN_INDEX = 1
+    """, (USERS_TABLE,))
+    return {column: index for column, index in cursor.fetchall()}
+
+
+def search_index_ready(cursor):
+    """True si les colonnes de recherche existent (lecture seule, mémorisé une fois présentes)"""
+    global _search_ready
+    with _schema_lock:
+        if not _search_ready:
+            try:
+                _search_ready = set(SEARCH_COLUMNS) <= _existing_columns(cursor)
+            except Exception as e:
+                logger.warning(f"Colonnes de recherche non vérifiables : {e}")
+                return False
+            if not _search_ready:
+                logger.warning("Colonnes de recherche absentes : recherche sans index "
+                               "(python -m modules.user_search --migrate)")
+        return _search_ready
+
+
+def migrate_search_index():
+    """Crée les colonnes générées et les index de recherche manquants ; retourne les changements faits
+
+    Les colonnes sont VIRTUAL : leur ajout ne reconstruit pas la table, seul
+    l'index est construit (en ligne).
+    """
+    global _search_ready
+    changes = []
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        columns = _existing_columns(cursor)
+        for column, (source, _) in SEARCH_COLUMNS.items():
+            if column not in columns:
+                cursor.execute(f"""
+                ALTER TABLE {USERS_TABLE}
+                ADD COLUMN {column} VARCHAR(255) CHARACTER SET utf8mb4 COLLATE {SEARCH_COLLATION}
+                    GENERATED ALWAYS AS ({source}) VIRTUAL
+                """)
+                changes.append(f"colonne {column} ajoutée")
+
+        indexed = _indexed_columns(cursor)
+        wanted = {column: index for column, (_, index) in SEARCH_COLUMNS.items()}
+        wanted["Login"] = LOGIN_INDEX
+        for column, index in wanted.items():
+            if column not in indexed:
+                cursor.execute(f"CREATE INDEX {index} ON {USERS_TABLE} ({column})")
+                changes.append(f"index {index} créé")
+        cursor.close()
+    with _schema_lock:
+        _search_ready = True
+    return changes
+
+
+def search_users(text, limit=None, offset=0):
+    """Comptes correspondant à `text` ; retourne {"total", "results", "limit", "offset"}
+
+    Chaque mot de `text` doit être le début du login, du prénom ou du nom.
+    Les résultats sont des dictionnaires aux mêmes clés que la liste complète
+    de l'application des mots de passe.
+    """
+    limit = limit or getattr(config, 'USER_SEARCH_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    terms = list(dict.fromkeys(fold_text(text).split()))
+    page = {"total": 0, "results": [], "limit": limit, "offset": offset}
+    if not terms:
+        return page
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if search_index_ready(cursor):
+            columns = ["Login"] + list(SEARCH_COLUMNS)
+        else:
+            columns = ["Login"] + [f"CONVERT({source} USING utf8mb4) COLLATE {SEARCH_COLLATION}"
+                                   for source, _ in SEARCH_COLUMNS.values()]
+
+        term_sql = "(" + " OR ".join(f"{column} LIKE %s" for column in columns) + ")"
+        where = " AND ".join([term_sql] * len(terms))
+        where_params = [f"{_like_escape(term)}%" for term in terms for _ in columns]
+        order = "CASE WHEN Login = %s THEN 0 ELSE 1 END, Nom, Prénom"
+        cursor.execute(f"SELECT {RESULT_COLUMNS} FROM {USERS_TABLE} WHERE {where} ORDER BY {order} LIMIT %s OFFSET %s",
+                       where_params + [" ".join(terms), limit, offset])
+        names = [description[0] for description in cursor.description]
+        page["results"] = [{name: ("" if value is None else value) for name, value in zip(names, row)}
+                           for row in cursor.fetchall()]
+
+        if offset == 0 and len(page["results"]) < limit:
+            page["total"] = len(page["results"])
+        else:
+            cursor.execute(f"SELECT COUNT(*) FROM {USERS_TABLE} WHERE {where}", where_params)
+            page["total"] = cursor.fetchone()[0]
+        cursor.close()
+    return page
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index de recherche de la table utilisateurs")
+    parser.add_argument("--migrate", action="store_true", help="crée les colonnes générées et les index manquants")
+    args = parser.parse_args()
+    if not args.migrate:
+        parser.error("rien à faire : utilisez --migrate")
+    done = migrate_search_index()
+    print("\n".join(done) if done else "Index de recherche déjà en place")
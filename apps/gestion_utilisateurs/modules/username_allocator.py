@@ -0,0 +1,246 @@
+"""
+Module d'attribution des noms d'utilisateur (prenom.nom, prenom.nom1, ...)
+
+Les logins existants sont chargés une fois dans un ensemble insensible à la
+casse au lieu de relire toute la source pour chaque nom généré. La source est
+relue seulement si elle a changé : date de modification pour le classeur
+Excel des mots de passe, toutes les USERNAME_ALLOCATOR_REFRESH secondes pour
+la colonne Login de la table utilisateurs.
+
+Les noms attribués à un lot sont réservés ensemble, sous un verrou : deux lots
+lancés en même temps dans le processus n'obtiennent jamais le même login. Une
+réservation est gardée tant que le login n'apparaît pas dans la source, au plus
+USERNAME_RESERVATION_TTL secondes, ou jusqu'à `release` (création échouée).
+Le prochain suffixe libre de chaque base est mémorisé : la résolution d'une
+collision ne reparcourt pas prenom.nom1, prenom.nom2, ...
+
+`assign_many` sert aux créations de comptes d'élèves existants ou non : un
+login déjà présent dont le titulaire porte le même nom est repris tel quel
+(le compte est recréé ou la création échoue comme compte existant), seuls
+les homonymes d'un même lot et les logins d'une personne d'un autre nom
+reçoivent un suffixe.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+import unicodedata
+
+import pandas as pd
+
+# Ajouter le chemin parent pour importer config
+sys.path.append('/home/streamlit')
+import config
+
+from .db_pool import db_connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH = 30
+DEFAULT_RESERVATION_TTL = 3600
+
+LOGIN_COLUMNS = ('Login', 'Username', 'login', 'username')
+
+
+def base_username(first_name, last_name):
+    """Login de base prenom.nom : minuscules, sans accents ni caractères spéciaux"""
+    parts = []
+    for value in (first_name, last_name):
+        value = unicodedata.normalize('NFD', str(value).strip().lower()).encode('ascii', 'ignore').decode('ascii')
+        parts.append(''.join(c for c in value if c.isalnum()))
+    return f"{parts[0]}.{parts[1]}"
+
+
+class UsernameAllocator:
+    """Logins pris (source et réservations) et prochain suffixe libre par base"""
+
+    def __init__(self, logins=(), reservation_ttl=DEFAULT_RESERVATION_TTL, owners=None):
+        self.reservation_ttl = reservation_ttl
+        self._lock = threading.Lock()
+        self._existing = set()
+        self._owners = {}  # login en minuscules -> (prénom, nom) du titulaire, si connu
+        self._reserved = {}  # login en minuscules -> date de réservation
+        self._next_suffix = {}  # base en minuscules -> premier suffixe à essayer
+        self._stats = {
+            'loads': 0,
+            'allocated': 0,
+            'collisions': 0,
+            'released': 0,
+        }
+        self.load(logins, owners)
+
+    def load(self, logins, owners=None):
+        """Remplace les logins de la source ; les réservations encore absentes de la source sont gardées
+
+        `owners` : {login: (prénom, nom)} des titulaires connus.
+        """
+        existing = {str(login).strip().lower() for login in logins if login and str(login).strip()}
+        owners = {str(login).strip().lower(): owner for login, owner in (owners or {}).items()}
+        with self._lock:
+            self._existing = existing
+            self._owners = owners
+            # Les suffixes libres peuvent avoir changé (comptes supprimés)
+            self._next_suffix = {}
+            self._stats['loads'] += 1
+            limit = time.time() - self.reservation_ttl
+            self._reserved = {login: reserved_at for login, reserved_at in self._reserved.items()
+                              if login not in existing and reserved_at > limit}
+
+    def _taken(self, login):
+        return login in self._existing or login in self._reserved
+
+    def _resolve(self, base, pending, next_suffix):
+        """Premier login libre pour `base` (hors `pending`) et le suffixe suivant"""
+        key = base.lower()
+        if not self._taken(key) and key not in pending:
+            return base, next_suffix.get(key, 1)
+        counter = next_suffix.get(key, 1)
+        while self._taken(f"{key}{counter}") or f"{key}{counter}" in pending:
+            counter += 1
+        return f"{base}{counter}", counter + 1
+
+    def allocate_many(self, bases, reserve=True):
+        """Logins libres pour une liste de bases, distincts entre eux
+
+        Avec `reserve`, les logins sont réservés ensemble (atomiquement) ; sans,
+        le résultat est un aperçu de ce qu'une réservation donnerait.
+        """
+        with self._lock:
+            pending = set()
+            next_suffix = dict(self._next_suffix)
+            logins = []
+            collisions = 0
+            for base in bases:
+                login, next_suffix[base.lower()] = self._resolve(base, pending, next_suffix)
+                collisions += login != base
+                pending.add(login.lower())
+                logins.append(login)
+            if reserve:
+                now = time.time()
+                self._reserved.update((login, now) for login in pending)
+                self._next_suffix = next_suffix
+                self._stats['allocated'] += len(logins)
+                self._stats['collisions'] += collisions
+            return logins
+
+    def allocate(self, base, reserve=True):
+        """Login libre pour `base` (prenom.nom, sinon prenom.nom1, ...)"""
+        return self.allocate_many([base], reserve=reserve)[0]
+
+    def assign_many(self, bases_and_names, name_base=base_username, reserve=True):
+        """Logins d'un lot de personnes à créer : [(base, prénom, nom)] -> [login]
+
+        Pour chaque personne, premier login de base, base1, base2, ... non
+        utilisé dans le lot et soit libre, soit existant avec un titulaire de
+        même nom (`name_base(prénom, nom)` égal à la base) ou inconnu. Un élève
+        déjà enregistré garde donc son login ; seuls les homonymes du lot et
+        les logins d'une personne d'un autre nom reçoivent un suffixe.
+        """
+        with self._lock:
+            pending = set()
+            logins = []
+            collisions = 0
+            for base, _, _ in bases_and_names:
+                key = base.lower()
+                counter = 0
+                while True:
+                    candidate = f"{key}{counter or ''}"
+                    if candidate not in pending:
+                        if candidate in self._existing:
+                            owner = self._owners.get(candidate)
+                            if owner is None or name_base(*owner).lower() == key:
+                                break
+                        elif candidate not in self._reserved:
+                            break
+                    counter += 1
+                collisions += counter > 0
+                pending.add(candidate)
+                logins.append(f"{base}{counter or ''}")
+            if reserve:
+                now = time.time()
+                self._reserved.update((login, now) for login in pending if login not in self._existing)
+                self._stats['allocated'] += len(logins)
+                self._stats['collisions'] += collisions
+            return logins
+
+    def release(self, *logins):
+        """Libère des logins réservés dont le compte n'a pas été créé"""
+        with self._lock:
+            for login in logins:
+                key = str(login).lower()
+                if self._reserved.pop(key, None) is not None:
+                    self._stats['released'] += 1
+            # Un suffixe libéré peut être réattribué
+            self._next_suffix = {}
+
+    def __contains__(self, login):
+        with self._lock:
+            return self._taken(str(login).lower())
+
+    def get_stats(self):
+        """Compteurs : chargements de la source, logins attribués, collisions, libérations"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['existing'] = len(self._existing)
+            stats['reserved'] = len(self._reserved)
+            return stats
+
+
+def load_logins_from_excel(path=None):
+    """(logins, titulaires) du classeur Excel des mots de passe (colonne Login seulement)"""
+    path = path or config.PASSWORD_EXCEL_FILE
+    if not os.path.exists(path):
+        return [], {}
+    df = pd.read_excel(path, usecols=lambda column: column in LOGIN_COLUMNS)
+    column = next((column for column in LOGIN_COLUMNS if column in df.columns), None)
+    return (df[column].dropna().astype(str).tolist() if column else []), {}
+
+
+def load_logins_from_db():
+    """(logins, titulaires) de la table utilisateurs"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT Login, Prénom, Nom FROM utilisateurs WHERE Login IS NOT NULL AND Login != ''")
+        rows = cursor.fetchall()
+        cursor.close()
+    owners = {login: (prenom, nom) for login, prenom, nom in rows if prenom or nom}
+    return [row[0] for row in rows], owners
+
+
+_allocators = {}  # source -> (allocateur, version de la source)
+_allocators_lock = threading.Lock()
+
+
+def _source_version(source):
+    """Valeur qui change quand la source doit être relue"""
+    if source == "excel":
+        try:
+            return os.path.getmtime(config.PASSWORD_EXCEL_FILE)
+        except OSError:
+            return None
+    return int(time.time() // getattr(config, 'USERNAME_ALLOCATOR_REFRESH', DEFAULT_REFRESH))
+
+
+def get_username_allocator(source="excel"):
+    """Allocateur partagé par le processus pour une source ("excel" ou "mysql"), relu si elle a changé"""
+    loaders = {"excel": load_logins_from_excel, "mysql": load_logins_from_db}
+    with _allocators_lock:
+        allocator, version = _allocators.get(source, (None, None))
+        current = _source_version(source)
+        if allocator is None or version != current:
+            try:
+                logins, owners = loaders[source]()
+            except Exception as e:
+                logger.error(f"Lecture des logins existants ({source}) impossible: {e}")
+                if allocator is not None:
+                    return allocator
+                logins, owners = [], {}
+                current = None
+            if allocator is None:
+                allocator = UsernameAllocator(logins, getattr(config, 'USERNAME_RESERVATION_TTL',
+                                                              DEFAULT_RESERVATION_TTL), owners)
+            else:
+                allocator.load(logins, owners)
+            _allocators[source] = (allocator, current)
+        return allocator
@@ -5,7 +5,6 @@ import streamlit as st
 import subprocess
 import random
 from contextlib import contextmanager
-import paramiko
 import sys
 import os
 import logging
@@ -19,6 +18,9 @@ import uuid
 import requests
 from msal import ConfidentialClientApplication
 
+from .ssh_pool import get_ssh_pool
+from .username_allocator import base_username, get_username_allocator
+
 # Ajouter le chemin parent pour importer config
 sys.path.append('/home/streamlit')
 import config
@@ -35,37 +37,19 @@ PASSWORD_EXCEL_FILE = config.PASSWORD_EXCEL_FILE
 CLASS_MAPPING = config.CLASS_MAPPING
 
 
-def generate_username(first_name, last_name):
-    """Génère un nom d'utilisateur au format prenom.nom"""
-    clean_first_name = first_name.strip().lower()
-    clean_last_name = last_name.strip().lower()
-    
-    # Supprimer les accents et caractères spéciaux
-    import unicodedata
-    clean_first_name = unicodedata.normalize('NFD', clean_first_name).encode('ascii', 'ignore').decode('ascii')
-    clean_last_name = unicodedata.normalize('NFD', clean_last_name).encode('ascii', 'ignore').decode('ascii')
-    
-    # Supprimer les espaces et caractères spéciaux
-    clean_first_name = ''.join(c for c in clean_first_name if c.isalnum())
-    clean_last_name = ''.join(c for c in clean_last_name if c.isalnum())
-    
-    # Format prenom.nom
-    base_username = f"{clean_first_name}.{clean_last_name}"
-    
-    # Ajouter un suffixe numérique si nécessaire
-    username = base_username
-    counter = 1
-    
-    # Vérifier l'unicité
-    existing_users = get_existing_users()
-    if not existing_users.empty and 'Login' in existing_users.columns:
-        existing_logins = existing_users['Login'].str.lower().tolist()
-        
-        while username.lower() in existing_logins:
-            username = f"{clean_first_name}.{clean_last_name}{counter}"
-            counter += 1
-    
-    return username
+def generate_username(first_name, last_name, reserve=False):
+    """Génère un nom d'utilisateur libre au format prenom.nom (sinon prenom.nom1, ...)
+
+    Sans `reserve`, le login n'est pas réservé (aperçu) : pour créer des comptes,
+    utiliser `generate_usernames` qui réserve les logins de tout le lot.
+    """
+    return get_username_allocator("excel").allocate(base_username(first_name, last_name), reserve=reserve)
+
+
+def generate_usernames(names, reserve=True):
+    """Logins libres et distincts pour une liste de (prénom, nom), réservés ensemble"""
+    bases = [base_username(first_name, last_name) for first_name, last_name in names]
+    return get_username_allocator("excel").allocate_many(bases, reserve=reserve)
 
 
 def generate_password(length=8):
@@ -160,22 +144,23 @@ def save_user_to_excel(username, firstname, lastname, password, classe="", group
 
 @contextmanager
 def ssh_connection(server, username, password):
-    """Context manager pour les connexions SSH"""
-    client = None
+    """Context manager pour les connexions SSH (connexions issues du pool partagé)"""
+    pool = get_ssh_pool()
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(server, username=username, password=password, timeout=30)
-        yield client
+        client = pool.acquire(server, username, password)
     except Exception as e:
         logger.error(f"Erreur de connexion SSH: {e}")
         yield None
+        return
+
+    discard = False
+    try:
+        yield client
+    except Exception:
+        discard = True
+        raise
     finally:
-        if client:
-            try:
-                client.close()
-            except Exception as close_error:
-                logger.error(f"Erreur lors de la fermeture SSH: {close_error}")
+        pool.release(client, discard=discard)
 
 
 def execute_ssh_command(client, command, sudo_password=None, timeout=30):
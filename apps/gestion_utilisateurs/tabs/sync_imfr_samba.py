@@ -13,11 +13,14 @@ sys.path.append('/home/streamlit/apps/gestion_utilisateurs')
 
 import config
 from modules.utils import (
-    get_existing_users, generate_username, generate_password, 
+    get_existing_users, generate_usernames, generate_password, 
     normalize_class_name, save_user_to_excel
 )
-from modules.imfr_functions import compare_imfr_samba
-from modules.samba_functions import create_samba_user, check_user_exists_in_samba, get_all_samba_users
+from modules.username_allocator import base_username, get_username_allocator
+from modules.reconciliation import reconcile_students
+from modules.samba_functions import (
+    create_samba_users_batch, check_user_exists_in_samba, get_all_samba_users
+)
 
 # Import du module eleves_utils pour la récupération des élèves
 try:
@@ -98,30 +101,18 @@ def render_sync_imfr_samba_tab():
     _render_comparison_section_auto()
 
 
+@st.cache_data(show_spinner=False)
+def _reconcile_cached(df_eleves, df_samba):
+    """Rapprochement mis en cache : recalculé uniquement si les données changent"""
+    return reconcile_students(df_eleves, df_samba)
+
+
 def _calculate_missing_students(df_eleves, df_samba):
     """Calcule rapidement le nombre d'élèves manquants dans SAMBA"""
     if df_eleves.empty or df_samba.empty:
         return len(df_eleves) if not df_eleves.empty else 0
     
-    missing_count = 0
-    for _, eleve in df_eleves.iterrows():
-        eleve_nom = str(eleve['Nom']).strip().upper()
-        eleve_prenom = str(eleve['Prénom']).strip().title()
-        
-        # Chercher dans SAMBA
-        found = False
-        for _, samba_student in df_samba.iterrows():
-            samba_nom = str(samba_student.get('Nom', '')).strip().upper()
-            samba_prenom = str(samba_student.get('Prénom', '')).strip().title()
-            
-            if eleve_nom == samba_nom and eleve_prenom == samba_prenom:
-                found = True
-                break
-        
-        if not found:
-            missing_count += 1
-    
-    return missing_count
+    return len(_reconcile_cached(df_eleves, df_samba)['missing'])
 
 
 def _render_eleves_section():
@@ -183,7 +174,9 @@ def _render_comparison_section_auto():
         return
     
     # Comparaison complète
-    missing_in_samba, extra_in_samba = compare_imfr_samba(df_eleves, df_samba)
+    reconciliation = _reconcile_cached(df_eleves, df_samba)
+    missing_in_samba = reconciliation['missing'].to_dict('records')
+    extra_in_samba = reconciliation['extra'].to_dict('records')
     
     # Statistiques
     col_stats1, col_stats2, col_stats3, col_stats4 = st.columns(4)
@@ -203,6 +196,9 @@ def _render_comparison_section_auto():
     else:
         st.success("✅ Tous les élèves sont déjà présents dans SAMBA!")
     
+    if not reconciliation['fuzzy'].empty:
+        _render_fuzzy_candidates_section(reconciliation['fuzzy'])
+    
     if extra_in_samba:
         _render_extra_students_section(extra_in_samba)
 
@@ -338,25 +334,26 @@ def _render_missing_students_section(missing_in_samba):
         # Vérifier d'abord avec les utilisateurs du serveur si disponible
         if 'samba_users_live' in st.session_state and st.session_state['samba_users_live']:
             samba_users_live = st.session_state['samba_users_live']
+            samba_logins = {u.lower() for u in samba_users_live}
             
             for eleve in [missing_in_samba[i] for i in selected_indices]:
                 nom = str(eleve.get('Nom', eleve.get('nom', ''))).strip()
                 prenom = str(eleve.get('Prénom', eleve.get('prenom', ''))).strip()
-                potential_username = generate_username(prenom, nom)
+                potential_username = base_username(prenom, nom)
                 
-                if potential_username.lower() in [u.lower() for u in samba_users_live]:
+                if potential_username.lower() in samba_logins:
                     potentially_existing.append(f"{prenom} {nom} (→ {potential_username})")
         
         # Sinon utiliser les utilisateurs Excel comme fallback
         else:
             df_samba_excel = get_existing_users()
             if not df_samba_excel.empty and 'Login' in df_samba_excel.columns:
-                excel_logins = df_samba_excel['Login'].str.lower().tolist()
+                excel_logins = set(df_samba_excel['Login'].str.lower())
                 
                 for eleve in [missing_in_samba[i] for i in selected_indices]:
                     nom = str(eleve.get('Nom', eleve.get('nom', ''))).strip()
                     prenom = str(eleve.get('Prénom', eleve.get('prenom', ''))).strip()
-                    potential_username = generate_username(prenom, nom)
+                    potential_username = base_username(prenom, nom)
                     
                     if potential_username.lower() in excel_logins:
                         potentially_existing.append(f"{prenom} {nom} (→ {potential_username})")
@@ -421,51 +418,72 @@ def _render_extra_students_section(extra_in_samba):
         st.info("💡 Ces comptes peuvent être des anciens élèves ou des comptes créés manuellement.")
 
 
+def _render_fuzzy_candidates_section(df_fuzzy):
+    """Affiche les correspondances approchées entre élèves manquants et comptes SAMBA"""
+    with st.expander(f"🔎 Correspondances possibles ({len(df_fuzzy)})", expanded=False):
+        st.markdown("*Ces élèves semblent déjà avoir un compte SAMBA (accents, ponctuation ou nom/prénom inversés)*")
+        st.dataframe(df_fuzzy, hide_index=True, use_container_width=True)
+
+
 def _create_missing_students(missing_in_samba, groupe_cible, generate_passwords, send_to_excel):
     """Crée les élèves manquants dans SAMBA"""
     creation_results = []
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    for idx, student in enumerate(missing_in_samba):
+    # Préparation des comptes (identifiants, mots de passe, classes)
+    # Logins réservés ensemble pour tout le lot : deux homonymes obtiennent prenom.nom et prenom.nom1
+    usernames = generate_usernames(
+        [(str(student['Prénom']).strip(), str(student['Nom']).strip()) for student in missing_in_samba]
+    )
+    prepared = []
+    for student, username in zip(missing_in_samba, usernames):
         nom = str(student['Nom']).strip()
         prenom = str(student['Prénom']).strip()
         classe = str(student['Classe']).strip()
         
-        status_text.text(f"Création de {prenom} {nom}... ({idx+1}/{len(missing_in_samba)})")
-        
-        # Générer username et password
-        username = generate_username(prenom, nom)
+        # Générer le mot de passe
         if generate_passwords:
             password = generate_password()
         else:
             import random
             password = f"{nom.lower()}{prenom.lower()[0]}{random.randint(10,99)}"
         
-        # Créer l'utilisateur SAMBA
-        try:
-            # Normaliser la classe
-            classe_normalized = normalize_class_name(classe) if classe else ""
-            
-            success, message = create_samba_user(username, password, prenom, nom, classe_normalized, groupe_cible)
-            
-            if success:
-                result = f"✅ {prenom} {nom} ({classe_normalized}) : Utilisateur créé avec succès"
-                creation_results.append(result)
-                
+        # Normaliser la classe
+        classe_normalized = normalize_class_name(classe) if classe else ""
+        prepared.append({
+            'username': username, 'password': password, 'prenom': prenom, 'nom': nom,
+            'classe': classe_normalized, 'groupe': groupe_cible
+        })
+    
+    def update_progress(done, total):
+        status_text.text(f"Création des comptes SAMBA... ({done}/{total} commandes)")
+        progress_bar.progress(done / total)
+    
+    # Création de tous les comptes en un seul lot de commandes
+    try:
+        outcomes = create_samba_users_batch(prepared, progress_callback=update_progress)
+    except Exception as e:
+        outcomes = [(False, str(e), False)] * len(prepared)
+    
+    for user, (success, message, created) in zip(prepared, outcomes):
+        prenom, nom, classe_normalized = user['prenom'], user['nom'], user['classe']
+        if success:
+            if created:
+                creation_results.append(f"✅ {prenom} {nom} ({classe_normalized}) : Utilisateur créé avec succès")
                 # Sauvegarder dans Excel si demandé
                 if send_to_excel:
-                    save_user_to_excel(username, prenom, nom, password, classe_normalized, groupe_cible)
+                    save_user_to_excel(user['username'], prenom, nom, user['password'], classe_normalized, groupe_cible)
             else:
-                result = f"❌ {prenom} {nom} : {message}"
-                creation_results.append(result)
-            
-        except Exception as e:
-            result = f"❌ {prenom} {nom} : {str(e)}"
-            creation_results.append(result)
-        
-        progress_bar.progress((idx + 1) / len(missing_in_samba))
+                creation_results.append(f"✅ {prenom} {nom} ({classe_normalized}) : {message}")
+        else:
+            creation_results.append(f"❌ {prenom} {nom} : {message}")
+    
+    # Logins des comptes non créés : de nouveau disponibles
+    get_username_allocator("excel").release(*(user['username'] for user, (success, _, _) in zip(prepared, outcomes)
+                                              if not success))
     
+    progress_bar.progress(1.0)
     status_text.text("Création terminée!")
     
     # Afficher les résultats
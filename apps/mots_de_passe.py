@@ -2,13 +2,15 @@ def run():
     import streamlit as st
     import pandas as pd
     import numpy as np
-    import pymysql
     import sys
     import os
 
-    # Importer la configuration depuis config.py
-    sys.path.insert(0, '/home/streamlit')
-    from config import MYSQL_CONFIG
+    # Connexions MySQL du pool partagé (configuration lue depuis config.py)
+    sys.path.append('/home/streamlit/apps/gestion_utilisateurs')
+    from modules.db_pool import db_connection
+    from modules.user_search import search_users, DEFAULT_PAGE_SIZE
+    sys.path.append('/home/streamlit')
+    import config
 
     # Configuration - Utiliser MySQL au lieu d'Excel
     USE_MYSQL = True
@@ -55,7 +57,6 @@ def run():
     def get_all_users_from_mysql():
         """Récupère tous les utilisateurs depuis MySQL"""
         try:
-            conn = pymysql.connect(**MYSQL_CONFIG)
             query = """
             SELECT
                 Login,
@@ -69,8 +70,8 @@ def run():
             FROM utilisateurs
             ORDER BY Nom, Prénom
             """
-            df = pd.read_sql(query, conn)
-            conn.close()
+            with db_connection() as conn:
+                df = pd.read_sql(query, conn)
 
             # Remplacer les NaN par des chaînes vides pour éviter les erreurs
             df = df.fillna('')
@@ -98,11 +99,23 @@ def run():
                 st.error(f"Erreur lors de la lecture du fichier Excel: {e}")
                 return pd.DataFrame()
 
-    def search_user_password(search_term):
-        """Recherche un utilisateur et son mot de passe"""
+    def search_user_password(search_term, page=0):
+        """Recherche un utilisateur et son mot de passe (une page de résultats)
+
+        Retourne {"total", "results", "limit", "offset"} ; avec MySQL le filtrage,
+        le tri et la pagination sont faits par la base (début des mots, colonnes indexées).
+        """
+        limit = getattr(config, 'USER_SEARCH_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+        if USE_MYSQL:
+            try:
+                return search_users(search_term, limit=limit, offset=page * limit)
+            except Exception as e:
+                st.error(f"❌ Erreur lors de la recherche dans MySQL: {e}")
+                return {"total": 0, "results": [], "limit": limit, "offset": 0}
+
         df = get_all_users_excel()
         if df.empty:
-            return []
+            return {"total": 0, "results": [], "limit": limit, "offset": 0}
         
         # Détecter la colonne username/login disponible
         username_col = None
@@ -113,18 +126,20 @@ def run():
         
         if not username_col:
             st.error("❌ Colonne username/login non trouvée dans le fichier Excel")
-            return []
+            return {"total": 0, "results": [], "limit": limit, "offset": 0}
             
         # Recherche dans username/login, prénom, nom
-        mask = df[username_col].str.contains(search_term, case=False, na=False)
+        mask = df[username_col].str.contains(search_term, case=False, na=False, regex=False)
         
         # Ajouter recherche dans prénom/nom si les colonnes existent
         if 'Prénom' in df.columns:
-            mask = mask | df['Prénom'].str.contains(search_term, case=False, na=False)
+            mask = mask | df['Prénom'].str.contains(search_term, case=False, na=False, regex=False)
         if 'Nom' in df.columns:
-            mask = mask | df['Nom'].str.contains(search_term, case=False, na=False)
+            mask = mask | df['Nom'].str.contains(search_term, case=False, na=False, regex=False)
         
-        return df[mask].to_dict('records')
+        matches = df[mask]
+        return {"total": len(matches), "results": matches.iloc[page * limit:(page + 1) * limit].to_dict('records'),
+                "limit": limit, "offset": page * limit}
 
     def delete_user_from_excel(username):
         """Supprime un utilisateur du fichier Excel"""
@@ -220,39 +235,50 @@ def run():
         col1, col2 = st.columns([2, 1])
         
         with col1:
-            if st.button("🔍 Rechercher", type="primary"):
-                if search_term:
-                    results = search_user_password(search_term)
-                    if results:
-                        st.success(f"✅ {len(results)} utilisateur(s) trouvé(s):")
+            search_clicked = st.button("🔍 Rechercher", type="primary")
+            # Nouvelle recherche : retour à la première page
+            if st.session_state.get("search_last_term") != search_term:
+                st.session_state["search_last_term"] = search_term
+                st.session_state["search_page"] = 1
+
+            if search_term:
+                page = search_user_password(search_term, st.session_state.get("search_page", 1) - 1)
+                results = page["results"]
+                if results:
+                    page_count = -(-page["total"] // page["limit"])
+                    st.success(f"✅ {page['total']} utilisateur(s) trouvé(s):")
+                    if page_count > 1:
+                        st.number_input(f"Page (sur {page_count})", min_value=1, max_value=page_count,
+                                        step=1, key="search_page")
+                        st.caption(f"Résultats {page['offset'] + 1} à {page['offset'] + len(results)}")
+                    
+                    for user in results:
+                        # Détecter la colonne username/login
+                        username_key = 'Login' if 'Login' in user else 'Username' if 'Username' in user else 'login'
+                        username_value = user.get(username_key, 'N/A')
                         
-                        for user in results:
-                            # Détecter la colonne username/login
-                            username_key = 'Login' if 'Login' in user else 'Username' if 'Username' in user else 'login'
-                            username_value = user.get(username_key, 'N/A')
+                        with st.expander(f"{username_value} - {user['Prénom']} {user['Nom']}", expanded=True):
+                            # Informations utilisateur sans colonnes imbriquées
+                            st.write(f"**Login INFO & WIFI:** `{username_value}`")                                
+                            st.write(f"**Compte O365:** {username_value} @xxx-xxx")
+                            st.write(f"**Nom complet:** {user['Prénom']} {user['Nom']}")
+                            st.write(f"**Classe:** {user['Classe']} | **Groupe:** {user['Groupe']}")
+                            if 'Date création' in user and pd.notna(user['Date création']) and user['Date création'] != '':
+                                st.write(f"**Créé le:** {user['Date création']}")
+                            st.write(f"**ID:** {user['ID Unique']}")
                             
-                            with st.expander(f"{username_value} - {user['Prénom']} {user['Nom']}", expanded=True):
-                                # Informations utilisateur sans colonnes imbriquées
-                                st.write(f"**Login INFO & WIFI:** `{username_value}`")                                
-                                st.write(f"**Compte O365:** {username_value} @xxx-xxx")
-                                st.write(f"**Nom complet:** {user['Prénom']} {user['Nom']}")
-                                st.write(f"**Classe:** {user['Classe']} | **Groupe:** {user['Groupe']}")
-                                if 'Date création' in user and pd.notna(user['Date création']) and user['Date création'] != '':
-                                    st.write(f"**Créé le:** {user['Date création']}")
-                                st.write(f"**ID:** {user['ID Unique']}")
-                                
-                                # Mot de passe en évidence
-                                st.markdown("### Mot de passe:")
-                                st.code(user['Mot de passe'], language="text")
-                                        
-                    else:
-                        st.warning("❌ Aucun utilisateur trouvé")
-                        st.info("💡 Essayez avec une partie du nom, prénom ou username")
+                            # Mot de passe en évidence
+                            st.markdown("### Mot de passe:")
+                            st.code(user['Mot de passe'], language="text")
+                                    
                 else:
-                    st.error("⚠️ Veuillez saisir un terme de recherche")
+                    st.warning("❌ Aucun utilisateur trouvé")
+                    st.info("💡 Essayez avec le début du nom, du prénom ou du username")
+            elif search_clicked:
+                st.error("⚠️ Veuillez saisir un terme de recherche")
         
         with col2:
-            st.info("**💡 Astuces de recherche:**\n- Tapez juste une partie du nom\n- La recherche ignore les majuscules\n- Ex: 'dup' trouve 'Dupont'")
+            st.info("**💡 Astuces de recherche:**\n- Tapez juste le début du nom\n- La recherche ignore les majuscules\n- Les accents sont ignorés : 'helene' trouve 'Hélène'\n- Plusieurs mots : 'dup mar' trouve 'Martin Dupont'\n- Ex: 'dup' trouve 'Dupont'")
 
     # ========================= Onglet Liste complète =========================
     with tab2:
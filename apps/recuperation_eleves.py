@@ -18,7 +18,13 @@ import pymysql
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(os.path.join(os.path.dirname(__file__), 'gestion_utilisateurs'))
 import config
+from modules.db_pool import db_connection
+from modules.imfr_journal import (
+    detect_changes, is_unchanged, save_changes, summarize_changes, get_recent_changes, CHANGE_LABELS,
+    ensure_eleves_table, import_lock, replace_eleves, compare_with_previous
+)
 
 def login_to_site(config_data):
     """Fonction de connexion au site"""
@@ -251,47 +257,30 @@ def recuperer_eleves():
             # Sauvegarder dans la base de données MySQL
             try:
                 st.write("💾 Sauvegarde dans la base de données MySQL...")
-                conn = pymysql.connect(**config.MYSQL_CONFIG)
-                cursor = conn.cursor()
-
-                # Créer la table si elle n'existe pas
-                create_table_query = """
-                CREATE TABLE IF NOT EXISTS eleves_imfr (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    nom VARCHAR(100) NOT NULL,
-                    prenom VARCHAR(100) NOT NULL,
-                    classe VARCHAR(50),
-                    date_import TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_nom_prenom (nom, prenom),
-                    INDEX idx_classe (classe)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-                """
-                cursor.execute(create_table_query)
-
-                # Vider la table avant d'insérer les nouvelles données
-                cursor.execute("TRUNCATE TABLE eleves_imfr")
-                st.write("   🗑️ Table vidée")
-
-                # Insérer les nouvelles données
-                insert_query = """
-                INSERT INTO eleves_imfr (nom, prenom, classe)
-                VALUES (%s, %s, %s)
-                """
-
-                count_inserted = 0
-                for eleve in eleves_data_raw:
-                    cursor.execute(insert_query, (
-                        eleve['nom'],
-                        eleve['prenom'],
-                        eleve['classe']
-                    ))
-                    count_inserted += 1
-
-                conn.commit()
-                cursor.close()
-                conn.close()
 
-                st.success(f"✅ {count_inserted} élèves sauvegardés dans MySQL (table: eleves_imfr)")
+                with import_lock():
+                    # Comparaison avec les empreintes du dernier import
+                    plan = detect_changes(eleves_data_raw)
+
+                    if is_unchanged(plan):
+                        st.success("✅ Aucun changement depuis le dernier import : la base de données est déjà à jour")
+                    else:
+                        # Chargement dans une table temporaire puis bascule atomique (RENAME TABLE)
+                        count_inserted = replace_eleves(eleves_data_raw)
+                        st.success(f"✅ {count_inserted} élèves sauvegardés dans MySQL (table: eleves_imfr)")
+                        snapshot_diff = compare_with_previous()
+                        if snapshot_diff is not None:
+                            st.write(f"   📚 Instantané précédent conservé (eleves_imfr_prev) : "
+                                     f"+{snapshot_diff['added']} / -{snapshot_diff['removed']} ligne(s)")
+
+                        # Journaliser les changements (création, classe, sortie...)
+                        save_changes(plan)
+                        if plan['baseline']:
+                            st.write(f"   📌 Empreintes initiales enregistrées ({len(plan['current'])} élèves)")
+                        else:
+                            summary = summarize_changes(plan['changes'])
+                            details = ", ".join(f"{CHANGE_LABELS[t]}: {n}" for t, n in summary.items())
+                            st.write(f"   📝 {len(plan['changes'])} changement(s) journalisé(s) ({details})")
 
                 # Également sauvegarder en JSON comme backup
                 json_file_path = "/home/streamlit/data/eleves.json"
@@ -334,29 +323,25 @@ def recuperer_eleves():
 def ensure_table_exists():
     """Crée la table eleves_imfr si elle n'existe pas"""
     try:
-        conn = pymysql.connect(**config.MYSQL_CONFIG)
-        cursor = conn.cursor()
-
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS eleves_imfr (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            nom VARCHAR(100) NOT NULL,
-            prenom VARCHAR(100) NOT NULL,
-            classe VARCHAR(50),
-            date_import TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            INDEX idx_nom_prenom (nom, prenom),
-            INDEX idx_classe (classe)
-        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        """
-        cursor.execute(create_table_query)
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            ensure_eleves_table(cursor)
+            conn.commit()
+            cursor.close()
         return True
     except Exception as e:
         st.error(f"❌ Erreur lors de la création de la table: {e}")
         return False
 
+@st.cache_data(ttl=60)
+def get_recent_changes_from_db(hours=24):
+    """Récupère le journal des changements IMFR des dernières heures"""
+    try:
+        return get_recent_changes(hours)
+    except Exception as e:
+        st.error(f"❌ Erreur lors de la lecture du journal des changements: {e}")
+        return pd.DataFrame()
+
 @st.cache_data(ttl=60)
 def get_eleves_from_db():
     """Récupère les élèves depuis la base de données MySQL"""
@@ -364,7 +349,6 @@ def get_eleves_from_db():
         # S'assurer que la table existe
         ensure_table_exists()
 
-        conn = pymysql.connect(**config.MYSQL_CONFIG)
         query = """
         SELECT
             id,
@@ -375,8 +359,8 @@ def get_eleves_from_db():
         FROM eleves_imfr
         ORDER BY classe, nom, prenom
         """
-        df = pd.read_sql(query, conn)
-        conn.close()
+        with db_connection() as conn:
+            df = pd.read_sql(query, conn)
         return df
     except pymysql.Error as e:
         if "doesn't exist" in str(e):
@@ -416,6 +400,14 @@ def run():
             else:
                 st.metric("Dernière mise à jour", "N/A")
 
+        # Journal des changements depuis le dernier import
+        df_changes = get_recent_changes_from_db()
+        if df_changes.empty:
+            st.caption("🕒 Aucun changement depuis hier")
+        else:
+            with st.expander(f"🕒 {len(df_changes)} changement(s) depuis hier"):
+                st.dataframe(df_changes, use_container_width=True, hide_index=True)
+
         # Filtres
         st.markdown("---")
         col_filter1, col_filter2 = st.columns(2)
@@ -459,7 +451,7 @@ def run():
     st.markdown("---")
     st.subheader("🔄 Récupération depuis IMFR")
 
-    st.warning("⚠️ Cette opération va remplacer toutes les données actuelles en base de données.")
+    st.warning("⚠️ Cette opération va remplacer toutes les données actuelles en base de données (sauf si IMFR n'a pas changé depuis le dernier import).")
 
     if st.button("🔄 Actualiser la liste depuis IMFR", type="primary"):
         with st.spinner("Récupération en cours depuis IMFR..."):
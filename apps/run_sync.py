@@ -8,7 +8,11 @@ import time
 import configparser
 import traceback
 import argparse
-from peewee import SqliteDatabase,CharField,Model,TextField,DateTimeField
+import fcntl
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from peewee import SqliteDatabase,CharField,Model,TextField,DateTimeField,IntegerField,BooleanField
 
 if "__file__" in locals():
     sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
@@ -19,10 +23,16 @@ parser = argparse.ArgumentParser(description='Azure ad sync')
 parser.add_argument('--conf', dest='azureconf', default='/home/samba-sync-ad/azure.conf',help='path to conf file')
 parser.add_argument('--service-mode', action=argparse.BooleanOptionalAction,dest='servicemode',help='Run the script in service mode',default=False)
 parser.add_argument('--force', action=argparse.BooleanOptionalAction,dest='force',help='Force synchronization of all objects',default=False)
+parser.add_argument('--summary-file', dest='summaryfile', default=os.environ.get('AADSYNC_SUMMARY_FILE'),help='write a JSON summary of each run to this file (default: $AADSYNC_SUMMARY_FILE)')
+parser.add_argument('--plan-out', dest='planout', default=None,help='write the planned actions (with object fingerprints) to this file, mode 0600')
+parser.add_argument('--apply-plan', dest='applyplan', default=None,help='execute exactly the actions of a plan written by --plan-out (the file is removed afterwards)')
 parser.add_argument('--dryrun', action=argparse.BooleanOptionalAction,dest='dryrun',help='simulate a send but does not actually perform the actions',default=None)
 
 args = parser.parse_args()
 
+if args.servicemode and (args.planout or args.applyplan):
+    parser.error('--plan-out and --apply-plan are not available in service mode')
+
 azureconf=args.azureconf
 config = configparser.ConfigParser()
 config.read(azureconf)
@@ -35,7 +45,8 @@ else:
     callback_after_send_hashnt = None
     callback_end_synchro = None
 
-db = SqliteDatabase(config.get('common', 'dbpath'))
+# WAL: readers (portal) are not blocked while a run flushes its state
+db = SqliteDatabase(config.get('common', 'dbpath'),pragmas={'journal_mode': 'wal','synchronous': 'normal'})
 
 if args.dryrun != None:
     dry_run=args.dryrun
@@ -52,6 +63,43 @@ if config.has_option('common', 'synchronization_interval_service'):
 if config.has_option('common', 'logfile'):
     logfile = config.get('common', 'logfile')
 
+# >1: independent objects of a phase are pushed to Azure AD by a thread pool
+send_workers = 1
+if config.has_option('common', 'send_workers'):
+    send_workers = max(1,config.getint('common', 'send_workers'))
+
+# objects rejected by Azure AD (e.g. a group referencing a group that is not
+# provisioned yet) are retried after retry_initial_delay, doubled up to
+# retry_max_delay, at most retry_attempts times
+retry_initial_delay = 2
+retry_max_delay = 30
+retry_attempts = 5
+if config.has_option('common', 'retry_initial_delay'):
+    retry_initial_delay = config.getfloat('common', 'retry_initial_delay')
+if config.has_option('common', 'retry_max_delay'):
+    retry_max_delay = config.getfloat('common', 'retry_max_delay')
+if config.has_option('common', 'retry_attempts'):
+    retry_attempts = config.getint('common', 'retry_attempts')
+
+# service mode: skip a cycle when highestCommittedUSN did not move since the
+# last clean run, but do a full run at least every full_reconcile_interval
+incremental_sync = True
+full_reconcile_interval = 86400
+if config.has_option('common', 'incremental_sync'):
+    incremental_sync = config.getboolean('common', 'incremental_sync')
+if config.has_option('common', 'full_reconcile_interval'):
+    full_reconcile_interval = config.getint('common', 'full_reconcile_interval')
+
+# held during a cycle; the portal reads the holder (pid, run id) from it
+lock_file = config.get('common', 'dbpath') + '.lock'
+if config.has_option('common', 'lock_file'):
+    lock_file = config.get('common', 'lock_file')
+
+# a plan older than this is refused by --apply-plan
+plan_max_age = 3600
+if config.has_option('common', 'plan_max_age'):
+    plan_max_age = config.getint('common', 'plan_max_age')
+
 calculate_deletions_based_on_last_sync = False
 if config.has_option('common', 'calculate_deletions_based_on_last_sync'):
     calculate_deletions_based_on_last_sync = config.getboolean('common', 'calculate_deletions_based_on_last_sync')
@@ -72,16 +120,472 @@ class AzureObject(Model):
     class Meta:
         database = db
 
+class SyncRun(Model):
+    pid = IntegerField()
+    host = CharField()
+    mode = CharField()
+    dry_run = BooleanField()
+    status = CharField()
+    started = DateTimeField()
+    heartbeat = DateTimeField()
+    finished = DateTimeField(null=True)
+    log_file = TextField(null=True)
+    summary = TextField(null=True)
+
+    class Meta:
+        database = db
+        table_name = 'sync_run'
+
+HEARTBEAT_INTERVAL = 10
+
+class RunLock:
+    """Exclusive flock on lock_file for the duration of a cycle.
+
+    While held, the file contains the pid, run id and last heartbeat of
+    the holder as JSON; the lock is released by the kernel if the process
+    dies, so a stale file never blocks the next run.
+    """
+
+    def __init__(self,path):
+        self.path = path
+        self.fd = None
+
+    def holder(self):
+        try:
+            with open(self.path) as f:
+                return json.loads(f.read() or '{}')
+        except (OSError,ValueError):
+            return {}
+
+    def acquire(self,wait=False):
+        fd = os.open(self.path,os.O_RDWR | os.O_CREAT,0o644)
+        waited = 0
+        while True:
+            try:
+                fcntl.flock(fd,fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if not wait:
+                    os.close(fd)
+                    return False
+                if waited % 30 == 0:
+                    print('Another synchronization is running (pid %s), waiting for it to finish...' % self.holder().get('pid'))
+                time.sleep(5)
+                waited += 5
+        self.fd = fd
+        return True
+
+    def write(self,info):
+        # overwrite then truncate: readers never see an empty file mid-cycle
+        data = json.dumps(info,default=str).encode('utf-8')
+        os.pwrite(self.fd,data,0)
+        os.ftruncate(self.fd,len(data))
+
+    def release(self):
+        if self.fd is not None:
+            os.ftruncate(self.fd,0)
+            fcntl.flock(self.fd,fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+run_lock = RunLock(lock_file)
+current_run = None
+
+def start_run():
+    """Register the cycle in sync_run and start heartbeating (lock file + row)."""
+    global current_run
+    if not SyncRun.table_exists():
+        db.create_tables([SyncRun])
+    now = datetime.datetime.now()
+    # we hold the lock: any row still 'running' belongs to a process that died
+    SyncRun.update(status='interrupted',finished=now).where(SyncRun.status == 'running').execute()
+    current_run = SyncRun.create(pid=os.getpid(),
+                                 host=socket.gethostname(),
+                                 mode='service' if args.servicemode else 'oneshot',
+                                 dry_run=dry_run,
+                                 status='running',
+                                 started=now,
+                                 heartbeat=now,
+                                 log_file=os.environ.get('AADSYNC_LOG_FILE') or (logfile if not dry_run else None))
+    heartbeat()
+    threading.Thread(target=heartbeat_loop,args=(current_run.id,),name='heartbeat',daemon=True).start()
+
+def heartbeat():
+    if current_run is None:
+        return
+    now = datetime.datetime.now()
+    run_lock.write({'pid':current_run.pid,'run_id':current_run.id,'started':current_run.started,'heartbeat':now})
+    SyncRun.update(heartbeat=now).where(SyncRun.id == current_run.id).execute()
+
+def heartbeat_loop(run_id):
+    while current_run is not None and current_run.id == run_id:
+        time.sleep(HEARTBEAT_INTERVAL)
+        try:
+            if current_run is not None and current_run.id == run_id:
+                heartbeat()
+        except:
+            logger.warning('sync run heartbeat failed: %s' % traceback.format_exc())
+
+def finish_run():
+    global current_run
+    if current_run is None:
+        return
+    run = current_run
+    current_run = None
+    SyncRun.update(status=summary.data['status'] if summary else 'failed',
+                   finished=datetime.datetime.now(),
+                   summary=json.dumps(summary.data,default=str) if summary else None).where(SyncRun.id == run.id).execute()
+
 def hash_for_data(data):
     return hashlib.sha1(pickle.dumps(data)).hexdigest()
 
-def run_sync(force=False,from_db=False):
+def content_hash(data):
+    # key-sorted serialisation: equal objects always give the same hash
+    return hashlib.sha256(json.dumps(data,sort_keys=True,separators=(',',':')).encode('utf-8')).hexdigest()
+
+STATE_FIELDS = ['sourceanchor','object_type','last_data_send','last_data_send_date','last_sha256_hashnt_send','last_send_hashnt_date']
+STATE_FLUSH_BATCH = 100
+
+class SyncState:
+    """All AzureObject rows of the state database, loaded once per run.
+
+    Lookups and diffs are done against in-memory dicts; changes are kept
+    as dirty rows and written by flush() as batched upserts inside a
+    single transaction, instead of one SELECT and one INSERT/UPDATE per
+    object. In a dry run nothing is written: flush() is a no-op.
+    """
+
+    def __init__(self,dry_run=False):
+        self.dry_run = dry_run
+        self.rows = {}
+        self.dirty = set()
+        self.deleted = set()
+        self._parsed = {}
+        for row in AzureObject.select().dicts().iterator():
+            self.rows[row['sourceanchor']] = row
+
+    def get(self,entry,object_type):
+        row = self.rows.get(entry)
+        if row and row['object_type'] == object_type:
+            return row
+        return None
+
+    def last_data(self,entry,object_type):
+        row = self.get(entry,object_type)
+        if not row or row['last_data_send'] is None:
+            return None
+        if entry not in self._parsed:
+            self._parsed[entry] = json.loads(row['last_data_send'])
+        return self._parsed[entry]
+
+    def changed(self,entry,object_type,data):
+        """True when data differs from what was last sent (or was never sent)."""
+        # compared to the decoded last send: hashing a key-sorted dump of data
+        # costs more than the json.loads it would save
+        if not self.get(entry,object_type):
+            return True
+        return self.last_data(entry,object_type) != data
+
+    def anchors(self,object_type):
+        return [entry for entry,row in self.rows.items() if row['object_type'] == object_type]
+
+    def record_send(self,entry,object_type,data):
+        row = self.rows.get(entry)
+        if row is None:
+            row = dict.fromkeys(STATE_FIELDS)
+            row['sourceanchor'] = entry
+            self.rows[entry] = row
+        row['object_type'] = object_type
+        row['last_data_send'] = json.dumps(data)
+        row['last_data_send_date'] = datetime.datetime.now()
+        self._parsed[entry] = data
+        self.dirty.add(entry)
+        self.deleted.discard(entry)
+
+    def record_hashnt(self,entry,sha2password):
+        # like the former UPDATE ... WHERE sourceanchor: no row, nothing to record
+        row = self.rows.get(entry)
+        if row is None:
+            return
+        row['last_sha256_hashnt_send'] = sha2password
+        row['last_send_hashnt_date'] = datetime.datetime.now()
+        self.dirty.add(entry)
+
+    def delete(self,entry,object_type):
+        if self.get(entry,object_type):
+            del self.rows[entry]
+            self._parsed.pop(entry,None)
+            self.dirty.discard(entry)
+            self.deleted.add(entry)
+
+    def flush(self):
+        if self.dry_run or (not self.dirty and not self.deleted):
+            return
+        with db.atomic():
+            deleted = list(self.deleted)
+            for i in range(0,len(deleted),STATE_FLUSH_BATCH):
+                AzureObject.delete().where(AzureObject.sourceanchor.in_(deleted[i:i+STATE_FLUSH_BATCH])).execute()
+            dirty = [self.rows[entry] for entry in self.dirty]
+            for i in range(0,len(dirty),STATE_FLUSH_BATCH):
+                AzureObject.insert_many(dirty[i:i+STATE_FLUSH_BATCH]).on_conflict_replace().execute()
+        self.dirty.clear()
+        self.deleted.clear()
+
+def send_objects(azure,objects,entries,phase):
+    """Push objects[entry] for each entry with azure.send_obj_to_az.
+
+    Yields (entry, traceback or None) in the order of entries, in the
+    calling thread: callbacks, error bookkeeping and SyncState writes stay
+    serialised there. With send_workers > 1 the sends themselves run in a
+    thread pool; a phase only starts once the previous one is finished, so
+    users are always in Azure AD before the groups that contain them.
+    Per-worker throughput is logged at the end of the phase.
+    """
+    stats = {}
+    stats_lock = threading.Lock()
+
+    def send(entry):
+        start = time.perf_counter()
+        try:
+            azure.send_obj_to_az(objects[entry])
+            return entry,None
+        except:
+            return entry,traceback.format_exc()
+        finally:
+            elapsed = time.perf_counter() - start
+            with stats_lock:
+                worker = stats.setdefault(threading.current_thread().name,{'objects':0,'seconds':0.0})
+                worker['objects'] += 1
+                worker['seconds'] += elapsed
+
+    started = time.perf_counter()
+    if send_workers <= 1 or len(entries) <= 1:
+        for entry in entries:
+            write_log_json_data('send',objects[entry])
+            yield send(entry)
+    else:
+        with ThreadPoolExecutor(max_workers=send_workers,thread_name_prefix='send') as executor:
+            futures = []
+            for entry in entries:
+                write_log_json_data('send',objects[entry])
+                futures.append(executor.submit(send,entry))
+            for future in futures:
+                yield future.result()
+
+    if entries:
+        duration = time.perf_counter() - started
+        write_log_json_data('send_stats',{'phase':phase,
+                                          'workers':send_workers,
+                                          'objects':len(entries),
+                                          'seconds':round(duration,2),
+                                          'objects_per_second':round(len(entries)/duration,1) if duration else None,
+                                          'per_worker':{name:{'objects':w['objects'],
+                                                              'objects_per_second':round(w['objects']/w['seconds'],1) if w['seconds'] else None}
+                                                        for name,w in sorted(stats.items())}})
+
+SUMMARY_MAX_OUTCOMES = 1000
+
+class SyncSummary:
+    """Machine-readable report of one run, written as JSON for the portal.
+
+    Counts are exact; the per-object outcome and error lists are capped at
+    SUMMARY_MAX_OUTCOMES entries each.
+    """
+
+    def __init__(self,dry_run):
+        self.started = time.perf_counter()
+        self.current_phase = None
+        self.data = {'version':1,
+                     'status':'running',
+                     'dry_run':dry_run,
+                     'started_at':datetime.datetime.now().isoformat(timespec='seconds'),
+                     'duration':None,
+                     'phases':{},
+                     'objects':{},
+                     'outcomes':{},
+                     'errors':[]}
+
+    def phase(self,name):
+        self.end_phase()
+        self.current_phase = (name,time.perf_counter())
+
+    def end_phase(self):
+        if self.current_phase:
+            name,start = self.current_phase
+            self.data['phases'][name] = round(self.data['phases'].get(name,0) + time.perf_counter() - start,3)
+            self.current_phase = None
+
+    def count(self,object_type,outcome,label):
+        counts = self.data['objects'].setdefault(object_type,{'sent':0,'errors':0,'deleted':0,'delete_errors':0})
+        counts[outcome] += 1
+        labels = self.data['outcomes'].setdefault(object_type,{}).setdefault(outcome,[])
+        if len(labels) < SUMMARY_MAX_OUTCOMES:
+            labels.append(label)
+
+    def sent(self,object_type,entry,data):
+        self.count(object_type,'sent',data.get('onPremisesSamAccountName') or data.get('displayName') or entry)
+
+    def deleted(self,object_type,entry,data):
+        data = data or {}
+        self.count(object_type,'deleted',data.get('onPremisesSamAccountName') or data.get('displayName') or entry)
+
+    def error(self,data):
+        # action is '<send|delete>_<user|device|group|hashnt>'
+        verb,_,object_type = data.get('action','').partition('_')
+        self.count(object_type or 'other','delete_errors' if verb == 'delete' else 'errors',data.get('sourceanchor'))
+        if len(self.data['errors']) < SUMMARY_MAX_OUTCOMES:
+            lines = [l for l in str(data.get('traceback','')).splitlines() if l.strip()]
+            self.data['errors'].append({'sourceanchor':data.get('sourceanchor'),
+                                        'action':data.get('action'),
+                                        'message':lines[-1] if lines else ''})
+
+    def finish(self,status,message=None):
+        self.end_phase()
+        self.data['status'] = status
+        self.data['duration'] = round(time.perf_counter() - self.started,3)
+        if message:
+            self.data['message'] = message
+
+    def write(self,path):
+        tmp = path + '.tmp'
+        with open(tmp,'w') as f:
+            json.dump(self.data,f,default=str)
+        os.replace(tmp,path)
+
+summary = None
+sync_errors = 0
+
+def log_error(data):
+    global sync_errors
+    sync_errors += 1
+    if summary:
+        summary.error(data)
+    write_log_json_data('error',data)
+
+def highest_committed_usn(smb):
+    """highestCommittedUSN of the rootDSE of the local DC, None when it cannot be read.
+
+    It increases with every change written to the directory (objects,
+    passwords), so an unchanged value means there is nothing new to sync.
+    """
+    try:
+        from ldb import SCOPE_BASE
+        res = smb.samdb_loc.search(base='',scope=SCOPE_BASE,attrs=['highestCommittedUSN'])
+        return int(str(res[0]['highestCommittedUSN'][0]))
+    except:
+        return None
+
+def backoff_delays():
+    delay = retry_initial_delay
+    for _ in range(retry_attempts):
+        yield min(delay,retry_max_delay)
+        delay *= 2
+
+def retry_rejected(pending,send_one,action,delays):
+    """Re-send the entries of pending ({entry: traceback}) after each delay.
+
+    Yields each entry as soon as a retry succeeds and removes it from
+    pending; whatever is left in pending once the delays are exhausted
+    failed for good and is logged as an error.
+    """
+    for delay in delays:
+        if not pending:
+            break
+        if delay:
+            print('%s object(s) rejected for %s, retrying in %ss' % (len(pending),action,delay))
+            time.sleep(delay)
+        for entry in list(pending):
+            try:
+                send_one(entry)
+            except:
+                pending[entry] = traceback.format_exc()
+                continue
+            del pending[entry]
+            yield entry
+    for entry in pending:
+        log_error({'sourceanchor':entry,'action':action,'traceback':pending[entry]})
+
+def group_levels(groups,entries):
+    """Split entries into levels so that a group is sent after the groups it contains.
+
+    The first level holds the groups without pending member groups; a
+    membership cycle cannot be ordered and is sent as one last level.
+    """
+    pending = set(entries)
+    levels = []
+    while pending:
+        level = [entry for entry in entries if entry in pending
+                 and not [g for g in groups[entry]['groupMembers'] if g in pending and g != entry]]
+        if not level:
+            level = [entry for entry in entries if entry in pending]
+        levels.append(level)
+        pending.difference_update(level)
+    return levels
+
+PLAN_VERSION = 1
+OBJECT_TYPES = ['user','device','group']
+
+def write_plan(plan,path):
+    # owner only: the plan lists accounts and the payloads to send
+    tmp = path + '.tmp'
+    fd = os.open(tmp,os.O_WRONLY | os.O_CREAT | os.O_TRUNC,0o600)
+    with os.fdopen(fd,'w') as f:
+        json.dump(plan,f,default=str)
+    os.replace(tmp,path)
+
+def load_plan(path):
+    with open(path) as f:
+        plan = json.load(f)
+    if plan.get('version') != PLAN_VERSION:
+        raise ValueError('unsupported plan version %s' % plan.get('version'))
+    if plan.get('dbpath') != config.get('common', 'dbpath'):
+        raise ValueError('plan was made for another state database (%s)' % plan.get('dbpath'))
+    age = time.time() - plan['created']
+    if age > plan_max_age:
+        raise ValueError('plan is %d s old (plan_max_age = %d s), run a new dry run' % (age,plan_max_age))
+    return plan
+
+def verify_plan(plan,smb):
+    """Keep only the actions still matching the directory just read; returns the number dropped."""
+    samba = {'user':smb.dict_all_users_samba,'device':smb.dict_all_device_samba,'group':smb.dict_all_group_samba}
+    stale = 0
+    for object_type in OBJECT_TYPES:
+        for entry in list(plan['delete'][object_type]):
+            if entry in samba[object_type]:
+                del plan['delete'][object_type][entry]
+                stale += 1
+        for entry,action in list(plan['send'][object_type].items()):
+            current = samba[object_type].get(entry)
+            if current is None or content_hash(current) != action['fingerprint']:
+                del plan['send'][object_type][entry]
+                stale += 1
+            else:
+                action['data'] = current
+    for entry,action in list(plan['hashnt'].items()):
+        current = smb.dict_id_hash.get(entry)
+        if current is None or hash_for_data(current) != action['fingerprint']:
+            del plan['hashnt'][entry]
+            stale += 1
+    return stale
+
+def run_sync(force=False,from_db=False,skip_if_usn=None,plan_out=None,apply_plan=None):
+    """One synchronization cycle.
+
+    Returns the highestCommittedUSN read before the directory was loaded,
+    or None if it is unknown or the cycle logged errors (the next cycle
+    must not be skipped). When skip_if_usn is given and the directory did
+    not change since, nothing is read nor sent.
+    """
 
     global config
     global db
+    global sync_errors
+    global summary
 
     global dry_run
 
+    summary = None
+
     hash_synchronization = config.getboolean('common', 'hash_synchronization')
 
     sync_device = config.getboolean('common', 'sync_device')
@@ -212,10 +716,23 @@ def run_sync(force=False,from_db=False):
     if config.has_option('common', 'warning_duplicate_mail_value'):
         smb.warning_duplicate_mail_value = config.getboolean('common', 'warning_duplicate_mail_value')
 
+    # read before generate_all_dict: a change made while this run reads the
+    # directory moves the USN and triggers the next cycle
+    usn = highest_committed_usn(smb)
+    if usn is not None and usn == skip_if_usn:
+        logger.debug('highestCommittedUSN %s unchanged, nothing to synchronize' % usn)
+        return usn
+    sync_errors = 0
+    summary = SyncSummary(dry_run)
+
     if not AzureObject.table_exists():
         db.create_tables([AzureObject])
 
-    if AzureObject.select(AzureObject.sourceanchor).first() == None :
+    start_run()
+
+    state = SyncState(dry_run)
+
+    if not state.rows :
         # enable ad sync
         write_log_json_data('enable_ad_sync',{"EnableDirSync":True})
         azure.enable_ad_sync()
@@ -248,87 +765,127 @@ def run_sync(force=False,from_db=False):
 
             smb.set_password_azureadssoacc(password=random_password)
 
-    smb.generate_all_dict()
-
-    if config.getboolean('common', 'do_delete'):
-        
-        if from_db:
-            for u in AzureObject.select(AzureObject.sourceanchor,AzureObject.last_data_send).where(AzureObject.object_type=='user'):
-                azure.dict_az_user[u.sourceanchor] = json.loads(u.last_data_send)
+    summary.phase('load')
+    if apply_plan is not None:
+        plan = apply_plan
+        # unchanged USN: the directory is exactly as planned, the payloads of the plan are used as is.
+        # NT hashes are never written to the plan: password pushes always re-read them from the directory
+        if usn is None or usn != plan['usn'] or plan['hashnt']:
+            smb.generate_all_dict()
+            stale = verify_plan(plan,smb)
+            summary.data['plan'] = {'verified':'fingerprints','stale':stale}
+            if stale:
+                print('%s planned action(s) no longer match the directory and were dropped' % stale)
         else:
-            azure.generate_all_dict()
-
-        # Delete user in azure and not found in samba
-        for user in azure.dict_az_user:
-            if not user in smb.dict_all_users_samba:
-                write_log_json_data('delete',azure.dict_az_user[user])
-                try:
-                    azure.delete_user(user)
-                except:
-                    write_log_json_data('error',{'sourceanchor':user,'action':'delete_user','traceback':traceback.format_exc()})
-                    continue
-                if not dry_run:
-                    AzureObject.delete().where(AzureObject.sourceanchor==user,AzureObject.object_type=='user').execute()
-
-
-        # Delete group in azure and not found in samba
-        if (not use_get_syncobjects) or from_db:
-            for g in AzureObject.select(AzureObject.sourceanchor,AzureObject.last_data_send).where(AzureObject.object_type=='group'):
-                azure.dict_az_group[g.sourceanchor] = json.loads(g.last_data_send)
+            summary.data['plan'] = {'verified':'usn','stale':0}
+    else:
+        smb.generate_all_dict()
+        samba = {'user':smb.dict_all_users_samba,'device':smb.dict_all_device_samba,'group':smb.dict_all_group_samba}
+        plan = {'version':PLAN_VERSION,
+                'created':time.time(),
+                'usn':usn,
+                'dbpath':config.get('common', 'dbpath'),
+                'delete':{t:{} for t in OBJECT_TYPES},
+                'send':{t:{} for t in OBJECT_TYPES},
+                'hashnt':{}}
+
+        if config.getboolean('common', 'do_delete'):
+            if from_db:
+                for entry in state.anchors('user'):
+                    azure.dict_az_user[entry] = state.last_data(entry,'user')
+            else:
+                azure.generate_all_dict()
 
-        for group in azure.dict_az_group:
-            if not group in smb.dict_all_group_samba:
-                write_log_json_data('delete',azure.dict_az_group[group])
+            if (not use_get_syncobjects) or from_db:
+                for entry in state.anchors('group'):
+                    azure.dict_az_group[entry] = state.last_data(entry,'group')
+
+            if sync_device and ((not use_get_syncobjects) or from_db):
+                for entry in state.anchors('device'):
+                    azure.dict_az_devices[entry] = state.last_data(entry,'device')
+
+            azure_objects = {'user':azure.dict_az_user,'group':azure.dict_az_group,'device':azure.dict_az_devices if sync_device else {}}
+            for object_type in OBJECT_TYPES:
+                # in azure and not found in samba
+                for entry in azure_objects[object_type]:
+                    if not entry in samba[object_type]:
+                        plan['delete'][object_type][entry] = azure_objects[object_type][entry]
+
+        for object_type in OBJECT_TYPES:
+            if object_type == 'device' and not sync_device:
+                continue
+            for entry in samba[object_type]:
+                if force or state.changed(entry,object_type,samba[object_type][entry]):
+                    plan['send'][object_type][entry] = {'fingerprint':content_hash(samba[object_type][entry]),
+                                                        'data':samba[object_type][entry]}
+
+        if hash_synchronization:
+            for entry in smb.dict_id_hash :
+                sha2password= hash_for_data(smb.dict_id_hash[entry])
+                last_data = state.get(entry,'user')
+                if force or (not last_data) or last_data['last_sha256_hashnt_send'] != sha2password :
+                    plan['hashnt'][entry] = {'fingerprint':sha2password,
+                                             'account':smb.dict_all_users_samba[entry]['onPremisesSamAccountName']}
+
+        if plan_out:
+            write_plan(plan,plan_out)
+            write_log_json_data('plan',{'plan_file':plan_out,
+                                        'delete':{t:len(plan['delete'][t]) for t in OBJECT_TYPES},
+                                        'send':{t:len(plan['send'][t]) for t in OBJECT_TYPES},
+                                        'hashnt':len(plan['hashnt'])})
+
+    users = {entry:action['data'] for entry,action in plan['send']['user'].items()}
+    devices = {entry:action['data'] for entry,action in plan['send']['device'].items()}
+    groups = {entry:action['data'] for entry,action in plan['send']['group'].items()}
+
+    if [entries for entries in plan['delete'].values() if entries]:
+        summary.phase('deletions')
+        deleters = {'user':(azure.dict_az_user,azure.delete_user),
+                    'group':(azure.dict_az_group,azure.delete_group),
+                    'device':(azure.dict_az_devices,azure.delete_device)}
+        for object_type in ['user','group','device']:
+            known,delete = deleters[object_type]
+            for entry,data in plan['delete'][object_type].items():
+                known[entry] = data
+                write_log_json_data('delete',data)
                 try:
-                    azure.delete_group(group)
+                    delete(entry)
                 except:
-                    write_log_json_data('error',{'sourceanchor':group,'action':'delete_group','traceback':traceback.format_exc()})
+                    log_error({'sourceanchor':entry,'action':'delete_%s' % object_type,'traceback':traceback.format_exc()})
                     continue
+                summary.deleted(object_type,entry,data)
                 if not dry_run:
-                    AzureObject.delete().where(AzureObject.sourceanchor==group,AzureObject.object_type=='group').execute()
-
-        # Delete device in azure and not found in samba
-        if sync_device:
+                    state.delete(entry,object_type)
 
-            if (not use_get_syncobjects) or from_db:
-                for d in AzureObject.select(AzureObject.sourceanchor,AzureObject.last_data_send).where(AzureObject.object_type=='device'):
-                    azure.dict_az_devices[d.sourceanchor] = json.loads(d.last_data_send)
-
-            for device in azure.dict_az_devices:
-                if not device in smb.dict_all_device_samba:
-                    write_log_json_data('delete',azure.dict_az_devices[device])
-                    try:
-                        azure.delete_device(device)
-                    except:
-                        write_log_json_data('error',{'sourceanchor':device,'action':'delete_device','traceback':traceback.format_exc()})
-                        continue
-                    if not dry_run:
-                        AzureObject.delete().where(AzureObject.sourceanchor==device,AzureObject.object_type=='device').execute()
+        state.flush()
 
     dict_error={}
 
     send_user = False
+
+    if send_workers > 1:
+        # authenticate once here rather than from several workers at the same time
+        azure.connect()
+
     #create all user found samba
-    for entry in smb.dict_all_users_samba:
-        last_data =  AzureObject.select(AzureObject.last_data_send).where(AzureObject.sourceanchor==entry,AzureObject.object_type=='user').first()
-        if force or (not last_data) or json.loads(last_data.last_data_send) != smb.dict_all_users_samba[entry] :
-            write_log_json_data('send',smb.dict_all_users_samba[entry])
-            try:
-                azure.send_obj_to_az(smb.dict_all_users_samba[entry])
-                send_user = True
-            except:
-                dict_error[entry]=None
-                write_log_json_data('error',{'sourceanchor':entry,'action':'send_user','traceback':traceback.format_exc()})
-                continue 
-            if callback_after_send_obj != None :
-                callback_after_send_obj(sambaobj=smb.samdb_loc,az=azure.az,entry=entry,dry_run=dry_run,last_send=last_data.last_data_send if last_data else {})
-            if not dry_run:
-                if not last_data:
-                    AzureObject.insert(sourceanchor=entry,object_type='user',last_data_send =json.dumps(smb.dict_all_users_samba[entry]),last_data_send_date = datetime.datetime.now()).execute()
-                else:
-                    AzureObject.update(last_data_send =json.dumps(smb.dict_all_users_samba[entry]),last_data_send_date = datetime.datetime.now()).where(AzureObject.sourceanchor==entry).execute()
+    summary.phase('users')
+    for entry,error in send_objects(azure,users,list(users),'users'):
+        if error:
+            dict_error[entry]=None
+            log_error({'sourceanchor':entry,'action':'send_user','traceback':error})
+            continue
+        send_user = True
+        summary.sent('user',entry,users[entry])
+        last_data = state.get(entry,'user')
+        if callback_after_send_obj != None :
+            callback_after_send_obj(sambaobj=smb.samdb_loc,az=azure.az,entry=entry,dry_run=dry_run,last_send=last_data['last_data_send'] if last_data else {})
+        if not dry_run:
+            state.record_send(entry,'user',users[entry])
+
+    state.flush()
 
     if sync_device:
+        summary.phase('devices')
         if config.getboolean('common', 'create_service_connection_point'):
             if not smb.check_service_connection_point_existe():
                 azure.connect()
@@ -337,131 +894,143 @@ def run_sync(force=False,from_db=False):
                     smb.write_service_connection_point(azure.tenant_id,config.get('common', 'azureadname'))
             
         #create all device found samba (experimental)
-        for entry in smb.dict_all_device_samba:
-            last_data =  AzureObject.select(AzureObject.last_data_send).where(AzureObject.sourceanchor==entry,AzureObject.object_type=='device').first()
-            if force or (not last_data) or json.loads(last_data.last_data_send) != smb.dict_all_device_samba[entry] :
-                write_log_json_data('send',smb.dict_all_device_samba[entry])
-                try:
-                    azure.send_obj_to_az(smb.dict_all_device_samba[entry])
-                except:
-                    dict_error[entry]=None
-                    write_log_json_data('error',{'sourceanchor':entry,'action':'send_device','traceback':traceback.format_exc()})
-                    continue
-                if callback_after_send_obj != None :
-                    callback_after_send_obj(sambaobj=smb.samdb_loc,az=azure.az,entry=entry,dry_run=dry_run,last_send=last_data.last_data_send if last_data else {})
-                if not dry_run:
-                    if not last_data:
-                        AzureObject.insert(sourceanchor=entry,object_type='device',last_data_send =json.dumps(smb.dict_all_device_samba[entry]),last_data_send_date = datetime.datetime.now()).execute()
-                    else:
-                        AzureObject.update(last_data_send =json.dumps(smb.dict_all_device_samba[entry]),last_data_send_date = datetime.datetime.now()).where(AzureObject.sourceanchor==entry).execute()        
+        for entry,error in send_objects(azure,devices,list(devices),'devices'):
+            if error:
+                dict_error[entry]=None
+                log_error({'sourceanchor':entry,'action':'send_device','traceback':error})
+                continue
+            summary.sent('device',entry,devices[entry])
+            last_data = state.get(entry,'device')
+            if callback_after_send_obj != None :
+                callback_after_send_obj(sambaobj=smb.samdb_loc,az=azure.az,entry=entry,dry_run=dry_run,last_send=last_data['last_data_send'] if last_data else {})
+            if not dry_run:
+                state.record_send(entry,'device',devices[entry])
+
+        state.flush()
 
     #create all group found samba
-    list_nested_group = {}
+    summary.phase('groups')
     list_group_create = {}
 
-    for entry in smb.dict_all_group_samba:
-        if not AzureObject.select(AzureObject.sourceanchor).where(AzureObject.sourceanchor==entry,AzureObject.object_type=='group').first():
+    for entry in groups:
+        if not state.get(entry,'group'):
             list_group_create[entry] = None
 
-    for entry in smb.dict_all_group_samba:
-        last_data =  AzureObject.select(AzureObject.last_data_send).where(AzureObject.sourceanchor==entry,AzureObject.object_type=='group').first()
-        if force or (not last_data) or json.loads(last_data.last_data_send) != smb.dict_all_group_samba[entry] :
-            write_log_json_data('send',smb.dict_all_group_samba[entry])
-            try:
-                azure.send_obj_to_az(smb.dict_all_group_samba[entry])
-            except:
+    def after_send_group(entry):
+        summary.sent('group',entry,groups[entry])
+        last_data = state.get(entry,'group')
+        if callback_after_send_obj != None :
+            callback_after_send_obj(sambaobj=smb.samdb_loc,az=azure.az,entry=entry,dry_run=dry_run,last_send=last_data['last_data_send'] if last_data else {})
+        if [g for g in groups[entry]['groupMembers'] if g in dict_error]:
+            return
+
+        if not dry_run:
+            state.record_send(entry,'group',groups[entry])
+
+    # member groups first; a level is finished (retries included) before the
+    # groups that contain it are sent
+    for level in group_levels(groups,list(groups)):
+        rejected = {}
+        for entry,error in send_objects(azure,groups,level,'groups'):
+            if error:
+                # a member group created a moment ago may not be provisioned yet
+                if [g for g in groups[entry]['groupMembers'] if g in list_group_create]:
+                    rejected[entry] = error
+                    continue
                 dict_error[entry]=None
-                write_log_json_data('error',{'sourceanchor':entry,'action':'send_group','traceback':traceback.format_exc()})
+                log_error({'sourceanchor':entry,'action':'send_group','traceback':error})
                 continue
+            after_send_group(entry)
 
-            if callback_after_send_obj != None :
-                callback_after_send_obj(sambaobj=smb.samdb_loc,az=azure.az,entry=entry,dry_run=dry_run,last_send=last_data.last_data_send if last_data else {})
-            if [g for g in smb.dict_all_group_samba[entry]['groupMembers'] if g in dict_error]:
-                continue
+        for entry in retry_rejected(rejected,lambda e: azure.send_obj_to_az(groups[e]),'send_group',backoff_delays()):
+            after_send_group(entry)
+        for entry in rejected:
+            dict_error[entry]=None
 
-            if dry_run:
-                continue
+    state.flush()
 
-            for g in smb.dict_all_group_samba[entry]["groupMembers"]:
-                if g in list_group_create:
-                    list_nested_group[entry] = None
+    #send all_password
+    if plan['hashnt']:
+        summary.phase('hashes')
+        hashes = {entry:smb.dict_id_hash[entry] for entry in plan['hashnt']}
+
+        def after_send_hashnt(entry):
+            summary.sent('hashnt',entry,{'onPremisesSamAccountName':plan['hashnt'][entry]['account']})
+            if callback_after_send_hashnt != None:
+                callback_after_send_hashnt(sambaobj=smb.samdb_loc,az=azure.az,SourceAnchor=entry,hashnt=hashes[entry],dry_run=dry_run)
+            if not dry_run:
+                state.record_hashnt(entry,plan['hashnt'][entry]['fingerprint'])
 
-            if entry in list_nested_group:
-                continue
+        rejected = {}
+        for entry in hashes:
+            write_log_json_data('send_nthash',{'SourceAnchor':entry,'onPremisesSamAccountName':plan['hashnt'][entry]['account'],'nthash':'XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX'})
 
-            if not dry_run:
-                if not last_data:
-                    AzureObject.insert(sourceanchor=entry,object_type='group',last_data_send =json.dumps(smb.dict_all_group_samba[entry]),last_data_send_date = datetime.datetime.now()).execute()
-                else:
-                    AzureObject.update(last_data_send =json.dumps(smb.dict_all_group_samba[entry]),last_data_send_date = datetime.datetime.now()).where(AzureObject.sourceanchor==entry).execute()
-
-    already_wait = False
-    if list_nested_group:
-        print('New group with nested detected wait 30s for send again')
-        time.sleep(30)
-        already_wait = True
-        for entry in list_nested_group:
             try:
-                write_log_json_data('send',smb.dict_all_group_samba[entry])
-                azure.send_obj_to_az(smb.dict_all_group_samba[entry])
-                last_data =  AzureObject.select(AzureObject.last_data_send).where(AzureObject.sourceanchor==entry,AzureObject.object_type=='group').first()
-                if not last_data:
-                    AzureObject.insert(sourceanchor=entry,object_type='group',last_data_send =json.dumps(smb.dict_all_group_samba[entry]),last_data_send_date = datetime.datetime.now()).execute()
+                azure.send_hashnt(hashes[entry],entry)
+            except Exception as e:
+                # Microsoft is very slow between sending the account and sending the password
+                if "Result" in str(e):
+                    rejected[entry] = traceback.format_exc()
                 else:
-                    AzureObject.update(last_data_send =json.dumps(smb.dict_all_group_samba[entry]),last_data_send_date = datetime.datetime.now()).where(AzureObject.sourceanchor==entry).execute()
-            except:
-                write_log_json_data('error',{'sourceanchor':entry,'action':'send_group','traceback':traceback.format_exc()})
+                    log_error({'sourceanchor':entry,'action':'send_hashnt','traceback':traceback.format_exc()})
                 continue
 
+            after_send_hashnt(entry)
 
-    if not send_user:
-        already_wait = True
-
-    #send all_password
-    if hash_synchronization:
-        for entry in smb.dict_id_hash :
-            sha2password= hash_for_data(smb.dict_id_hash[entry])
-            last_data =  AzureObject.select(AzureObject.last_sha256_hashnt_send).where(AzureObject.sourceanchor==entry,AzureObject.object_type=='user').first()
-            if force or (not last_data) or last_data.last_sha256_hashnt_send != sha2password :
-                write_log_json_data('send_nthash',{'SourceAnchor':entry,'onPremisesSamAccountName':smb.dict_all_users_samba[entry]['onPremisesSamAccountName'],'nthash':'XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX'})
+        # back off only when accounts were just created, otherwise one immediate retry
+        delays = backoff_delays() if send_user else [0]
+        for entry in retry_rejected(rejected,lambda e: azure.send_hashnt(hashes[e],e),'send_hashnt',delays):
+            after_send_hashnt(entry)
+        if rejected:
+            print('\n\nMaybe the user was manually deleted online? Run a force sync again to resend them... (use --force)\n\n')
 
-                # Microsoft is very slow between sending the account and sending the password
-                try:
-                    azure.send_hashnt(smb.dict_id_hash[entry],entry)
-                except Exception as e:
-                    if "Result" in str(e):
-                        if not already_wait:
-                            print('Fail, we may be a little too fast for microsoft, we will wait and try again ...' )
-                            time.sleep(30)
-                            already_wait = True
-                        try:
-                            azure.send_hashnt(smb.dict_id_hash[entry],entry)
-                        except Exception as e:
-                            write_log_json_data('error',{'sourceanchor':entry,'action':'send_hashnt','traceback':traceback.format_exc()})
-                            if "Result" in str(e):
-                                print('\n\nMaybe the user was manually deleted online? Run a force sync again to resend them... (use --force)\n\n')
-                            continue
-
-                    else:
-                        write_log_json_data('error',{'sourceanchor':entry,'action':'send_hashnt','traceback':traceback.format_exc()})
-                        continue
-
-                if callback_after_send_hashnt != None:
-                    callback_after_send_hashnt(sambaobj=smb.samdb_loc,az=azure.az,SourceAnchor=entry,hashnt=smb.dict_id_hash[entry],dry_run=dry_run)
-                if not dry_run:
-                    AzureObject.update(last_sha256_hashnt_send = sha2password,last_send_hashnt_date = datetime.datetime.now()).where(AzureObject.sourceanchor==entry).execute()
+        state.flush()
 
     if callback_end_synchro != None:
         callback_end_synchro(sambaobj=smb.samdb_loc,az=azure.az,dry_run=dry_run)
 
+    summary.finish('success' if not sync_errors else 'errors')
+
+    if sync_errors:
+        return None
+    return usn
+
 if __name__ == '__main__':
+    last_usn = None
+    last_full_run = 0
     while True:
-        try:
-            run_sync(force=args.force,from_db=calculate_deletions_based_on_last_sync)
-        except:
-            write_log_json_data("error",traceback.format_exc())
-            if not args.servicemode :
-                raise
+        # one-shot runs wait for a running cycle to finish, service mode skips the cycle
+        if not run_lock.acquire(wait=not args.servicemode):
+            print('Another synchronization is running (pid %s), cycle skipped' % run_lock.holder().get('pid'))
+        else:
+            try:
+                skip_if_usn = None
+                if incremental_sync and not args.force and time.time() - last_full_run < full_reconcile_interval:
+                    skip_if_usn = last_usn
+                apply_plan = load_plan(args.applyplan) if args.applyplan else None
+                usn = run_sync(force=args.force,from_db=calculate_deletions_based_on_last_sync,skip_if_usn=skip_if_usn,
+                               plan_out=args.planout,apply_plan=apply_plan)
+                if usn is None or usn != skip_if_usn:
+                    last_full_run = time.time()
+                    if args.summaryfile and summary:
+                        summary.write(args.summaryfile)
+                last_usn = usn
+                finish_run()
+            except:
+                last_usn = None
+                if summary:
+                    summary.finish('failed',traceback.format_exc().strip().splitlines()[-1])
+                    if args.summaryfile:
+                        summary.write(args.summaryfile)
+                finish_run()
+                write_log_json_data("error",traceback.format_exc())
+                if not args.servicemode :
+                    raise
+            finally:
+                run_lock.release()
+                if args.applyplan and os.path.exists(args.applyplan):
+                    # a plan is executed once
+                    os.remove(args.applyplan)
         if not args.servicemode :
             break
         calculate_deletions_based_on_last_sync = True
@@ -7,18 +7,42 @@ def run():
     import sys
     import os
     sys.path.append('/home/streamlit')
+    sys.path.append('/home/streamlit/apps/gestion_utilisateurs')
     import config
+    from modules.ssh_pool import get_ssh_pool
+    from modules.graph_client import get_graph_client
+    from modules.graph_batch import check_configured_groups, users_exist, group_type as entra_group_type
+    from modules.entra_mirror import (ensure_fresh as ensure_entra_mirror_fresh, get_groups as get_mirrored_groups,
+                                      get_mirror_status, mirrored_resources, sync_resource as sync_entra_mirror)
+    from modules.samba_batch import op_add_group, op_add_members, run_samba_batch
+    from modules.samba_functions import create_samba_users_batch
+    from modules.reconciliation import reconcile_students
+    from modules.imfr_journal import detect_changes, is_unchanged, save_changes, get_recent_changes, import_lock, replace_eleves
+    from modules.sync_summary import SUMMARY_ENV_VAR, new_summary_file, load_summary, summary_from_lines, summary_totals
+    from modules.sync_logs import (LogStream as SyncLogStream, LEVELS as SYNC_LOG_LEVELS, list_spools as list_sync_logs,
+                                   new_spool_path as new_sync_log_path, purge_spools as purge_sync_logs, read_spool as read_sync_log)
+    from modules.db_pool import db_connection, get_db_pool
+    from modules.username_allocator import get_username_allocator
+    from modules.kerberos import KerberosError, describe_ticket, get_kerberos_credentials
+    from modules.sync_plan import (new_plan_file as new_sync_plan_file, plan_args as sync_plan_args,
+                                   load_plan_overview as load_sync_plan_overview, discard_plan as discard_sync_plan,
+                                   purge_plans as purge_sync_plans)
+    from modules.sync_registry import current_run as current_sync_run, recent_runs as recent_sync_runs, tail_log as tail_sync_log
+    from modules.job_queue import get_job_manager, get_handler_label, STATUS_QUEUED, STATUS_RUNNING, STATUS_SUCCEEDED
+    from modules.job_handlers import (enqueue_csv_import, enqueue_raz_eleves, enqueue_samba_inventory,
+                                      enqueue_azure_sync, JOB_AZURE_SYNC, SYNC_SUMMARY_MARKER)
     import logging
+    import pymysql
     from typing import Tuple, Dict, List
     import time
     import pandas as pd
     import json
+    from collections import deque
     import openpyxl
     from openpyxl import Workbook
     from openpyxl.styles import Font, Fill, PatternFill
     import uuid
     import requests
-    from msal import ConfidentialClientApplication
     # ========================= Configuration depuis config.py =========================
     # Récupération des configurations depuis le fichier config.py
     keytab_path = config.KEYTAB_PATH
@@ -139,31 +163,25 @@ def run():
             
             st.info(f"🔍 {len(matching_users)} utilisateurs trouvés correspondant aux critères")
             
-            # Connexion SSH et ajout au groupe
-            with ssh_connection(config.SAMBA_SERVER, config.SAMBA_USER, config.SAMBA_PWD) as client:
-                if client:
-                    # Créer le groupe WIFI s'il n'existe pas
-                    create_group_cmd = f"sudo -S samba-tool group add {target_group} || true"
-                    output, error = execute_ssh_command(client, create_group_cmd, config.SAMBA_PWD)
-                    
-                    # Ajouter chaque utilisateur au groupe WIFI
-                    for user in matching_users:
-                        username = user['Login']
-                        user_class = user['Classe'] if 'Classe' in user else 'N/A'
-                        
-                        add_to_group_cmd = f"sudo -S samba-tool group addmembers {target_group} {username}"
-                        output, error = execute_ssh_command(client, add_to_group_cmd, config.SAMBA_PWD)
-                        
-                        if error:
-                            if "is already a member" in error.lower():
-                                results.append(f"ℹ️ {username} ({user_class}) : Déjà membre du groupe {target_group}")
-                            else:
-                                results.append(f"❌ {username} ({user_class}) : {error}")
-                        else:
-                            results.append(f"✅ {username} ({user_class}) : Ajouté au groupe {target_group}")
-                            added_count += 1
+            # Création du groupe s'il n'existe pas, puis ajout des utilisateurs par lots
+            group_result = run_samba_batch([op_add_group(target_group)])[0]
+            if group_result["status"] == "unreachable":
+                st.error("❌ Impossible de se connecter au serveur Samba")
+                return results, 0
+            
+            batch_results = run_samba_batch([op_add_members(target_group, user['Login']) for user in matching_users])
+            
+            for user, result in zip(matching_users, batch_results):
+                username = user['Login']
+                user_class = user['Classe'] if 'Classe' in user else 'N/A'
+                
+                if result["status"] == "already_member":
+                    results.append(f"ℹ️ {username} ({user_class}) : Déjà membre du groupe {target_group}")
+                elif result["status"] == "ok":
+                    results.append(f"✅ {username} ({user_class}) : Ajouté au groupe {target_group}")
+                    added_count += 1
                 else:
-                    st.error("❌ Impossible de se connecter au serveur Samba")
+                    results.append(f"❌ {username} ({user_class}) : {result['error']}")
                     
         except Exception as e:
             st.error(f"❌ Erreur lors de l'ajout au groupe WIFI : {e}")
@@ -251,27 +269,8 @@ def run():
         licenses = {}
         
         try:
-            app = ConfidentialClientApplication(
-                config.CLIENT_ID,
-                authority=f"https://login.microsoftonline.com/{config.TENANT_ID}",
-                client_credential=config.CLIENT_SECRET
-            )
-            
-            token_response = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-            access_token = token_response.get("access_token")
-            
-            if not access_token:
-                st.error("Impossible d'obtenir le token Microsoft pour les licences")
-                return {}
-
-            headers = {'Authorization': f'Bearer {access_token}'}
-            
-            # Récupérer les SKUs de licences disponibles
-            url = "https://graph.microsoft.com/v1.0/subscribedSkus"
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            skus_data = response.json().get("value", [])
+            # Récupérer les SKUs de licences disponibles (client Graph partagé, jeton en cache)
+            skus_data = get_graph_client().get_all("/subscribedSkus")
             
             for sku in skus_data:
                 sku_id = sku.get("skuId", "")
@@ -321,33 +320,14 @@ def run():
         
         return licenses
     
-    @st.cache_data(ttl=300)  # Cache 5 minutes
     def get_entra_groups() -> Dict[str, Dict]:
-        """Récupère la liste des groupes depuis Entra ID via Microsoft Graph"""
+        """Récupère la liste des groupes Entra ID depuis le miroir local (tenu à jour par requêtes delta)"""
         groups = {}
         
         try:
-            app = ConfidentialClientApplication(
-                config.CLIENT_ID,
-                authority=f"https://login.microsoftonline.com/{config.TENANT_ID}",
-                client_credential=config.CLIENT_SECRET
-            )
-            
-            token_response = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-            access_token = token_response.get("access_token")
-            
-            if not access_token:
-                st.error("Impossible d'obtenir le token Microsoft pour les groupes")
-                return {}
-
-            headers = {'Authorization': f'Bearer {access_token}'}
-            
-            # Récupérer les groupes depuis Entra ID
-            url = "https://graph.microsoft.com/v1.0/groups?$select=id,displayName,description,groupTypes,membershipRule,securityEnabled,mailEnabled&$top=999"
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            groups_data = response.json().get("value", [])
+            # Seuls les changements depuis la dernière synchronisation transitent par le réseau
+            ensure_entra_mirror_fresh("groups")
+            groups_data = get_mirrored_groups()
             
             for group in groups_data:
                 # Validation et sécurisation des données
@@ -360,21 +340,9 @@ def run():
                     
                 display_name = group.get("displayName") or "Sans nom"
                 description = group.get("description")  # Peut être None
-                group_types = group.get("groupTypes") or []
                 security_enabled = bool(group.get("securityEnabled", False))
                 mail_enabled = bool(group.get("mailEnabled", False))
-                
-                # Déterminer le type de groupe
-                if "Unified" in group_types:
-                    group_type = "Microsoft 365"
-                elif security_enabled and not mail_enabled:
-                    group_type = "Sécurité"
-                elif mail_enabled and not security_enabled:
-                    group_type = "Distribution"
-                elif security_enabled and mail_enabled:
-                    group_type = "Sécurité avec messagerie"
-                else:
-                    group_type = "Autre"
+                group_type = entra_group_type(group)
                 
                 # Sécuriser la description (peut être None)
                 safe_description = description or ""
@@ -579,12 +547,21 @@ def run():
         
         return f"{prenom_clean}.{nom_clean}"
     
+    def allocate_usernames(names, reserve=True):
+        """Logins (prenom.nom) d'une liste de (prénom, nom) à créer
+
+        Un login déjà présent dans la table utilisateurs au même nom est repris
+        tel quel (un compte existant n'est pas dupliqué) ; seuls les homonymes
+        du lot et les logins d'une personne d'un autre nom reçoivent un suffixe
+        (prenom.nom1, ...). Avec `reserve`, les nouveaux logins du lot sont
+        réservés ensemble (sinon aperçu).
+        """
+        entries = [(generate_username(firstname, lastname), firstname, lastname) for firstname, lastname in names]
+        return get_username_allocator("mysql").assign_many(entries, name_base=generate_username, reserve=reserve)
+    
     def get_existing_users():
         """Récupère la liste des utilisateurs depuis la base de données MySQL"""
         try:
-            import pymysql
-            conn = pymysql.connect(**config.MYSQL_CONFIG)
-
             query = """
             SELECT
                 Login,
@@ -599,8 +576,8 @@ def run():
             ORDER BY Nom, Prénom
             """
 
-            df = pd.read_sql(query, conn)
-            conn.close()
+            with db_connection() as conn:
+                df = pd.read_sql(query, conn)
 
             return df
         except Exception as e:
@@ -632,10 +609,6 @@ def run():
 
         # Sauvegarder dans MySQL (table utilisateurs)
         try:
-            import pymysql
-            conn = pymysql.connect(**config.MYSQL_CONFIG)
-            cursor = conn.cursor()
-
             # UPSERT dans la table utilisateurs
             upsert_query = """
             INSERT INTO utilisateurs (Login, Nom, Prénom, Classe, Groupe, Mot_de_passe, Dernière_modification)
@@ -649,10 +622,11 @@ def run():
                 Dernière_modification = NOW()
             """
 
-            cursor.execute(upsert_query, (username, lastname, firstname, normalized_classe, groupe, password))
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(upsert_query, (username, lastname, firstname, normalized_classe, groupe, password))
+                conn.commit()
+                cursor.close()
 
             logger.info(f"Utilisateur {username} sauvegardé dans MySQL")
             return True
@@ -674,14 +648,9 @@ def run():
     # ========================= Connexions et commandes SSH =========================
     @contextmanager
     def ssh_connection(server: str, username: str, password: str):
-        """Context manager pour les connexions SSH."""
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        try:
-            client.connect(server, username=username, password=password)
+        """Context manager pour les connexions SSH (réutilise le pool partagé)."""
+        with get_ssh_pool().connection(server, username, password) as client:
             yield client
-        finally:
-            client.close()
 
     def execute_ssh_command(client: paramiko.SSHClient, command: str, password: str) -> Tuple[str, str]:
         """Exécute une commande SSH avec gestion d'erreur."""
@@ -709,6 +678,15 @@ def run():
             f"Config Azure existe ({config_file})": os.path.exists(config_file),
             f"Venv existe ({venv_path})": os.path.exists(venv_path)
         }
+
+        # Ticket Kerberos du cache (lecture locale avec klist, sans renouvellement)
+        kerberos = get_kerberos_credentials()
+        ticket = kerberos.status()
+        if ticket['valid']:
+            diagnostics[f"Ticket Kerberos valide ({ticket['principal']}, expire dans "
+                        f"{ticket['expires_in'] / 3600:.1f} h)"] = True
+        else:
+            diagnostics[f"Ticket Kerberos valide pour {kerberos.principal} ({krb5_ccache})"] = False
         
         # Test de connectivité Samba
         try:
@@ -723,14 +701,7 @@ def run():
         
         # Test de connectivité Microsoft Graph
         try:
-            app = ConfidentialClientApplication(
-                config.CLIENT_ID,
-                authority=f"https://login.microsoftonline.com/{config.TENANT_ID}",
-                client_credential=config.CLIENT_SECRET
-            )
-            token_response = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-            access_token = token_response.get("access_token")
-            diagnostics["Connexion Microsoft Graph réussie"] = bool(access_token)
+            diagnostics["Connexion Microsoft Graph réussie"] = bool(get_graph_client().get_token())
         except Exception as e:
             diagnostics["Connexion Microsoft Graph réussie"] = False
             st.error(f"Erreur de connexion Microsoft Graph: {e}")
@@ -740,170 +711,169 @@ def run():
                 st.success(diag)
             else:
                 st.error(diag)
-        for diag, status in diagnostics.items():
-            if status:
-                st.success(diag)
-            else:
-                st.error(diag)
+
+        # Statistiques du pool de connexions SSH
+        pool_stats = get_ssh_pool().get_stats()
+        st.write("**Pool de connexions SSH:**")
+        col_pool1, col_pool2, col_pool3, col_pool4 = st.columns(4)
+        with col_pool1:
+            st.metric("Réutilisations (hits)", pool_stats['hits'])
+        with col_pool2:
+            st.metric("Nouvelles connexions", pool_stats['misses'])
+        with col_pool3:
+            st.metric("Taux de réutilisation", f"{pool_stats['hit_rate'] * 100:.0f}%")
+        with col_pool4:
+            st.metric("Connexion moyenne", f"{pool_stats['connect_time_avg']:.2f}s")
+        with st.expander("Détails du pool SSH", expanded=False):
+            st.json(pool_stats)
+
+        # Statistiques du pool de connexions MySQL
+        db_stats = get_db_pool().get_stats()
+        st.write("**Pool de connexions MySQL:**")
+        col_db1, col_db2, col_db3, col_db4 = st.columns(4)
+        with col_db1:
+            st.metric("Réutilisations", db_stats['reused'])
+        with col_db2:
+            st.metric("Nouvelles connexions", db_stats['created'])
+        with col_db3:
+            st.metric("Taux de réutilisation", f"{db_stats['hit_rate'] * 100:.0f}%")
+        with col_db4:
+            st.metric("Connexions inactives", f"{db_stats['idle']}/{db_stats['max_size']}")
+        if db_stats['queries']:
+            with st.expander("Durée des requêtes MySQL", expanded=False):
+                st.dataframe(pd.DataFrame([{
+                    "Requête": name,
+                    "Appels": metrics['calls'],
+                    "Erreurs": metrics['errors'],
+                    "Durée moyenne (s)": round(metrics['time_avg'], 4),
+                    "Durée max (s)": round(metrics['time_max'], 4),
+                } for name, metrics in sorted(db_stats['queries'].items())]), hide_index=True, use_container_width=True)
+
+        # Renouvellements du ticket Kerberos
+        kerberos_stats = kerberos.get_stats()
+        st.write("**Ticket Kerberos:**")
+        col_krb1, col_krb2, col_krb3, col_krb4 = st.columns(4)
+        with col_krb1:
+            st.metric("Expire dans", f"{ticket['expires_in'] / 60:.0f} min" if ticket['valid'] else "—")
+        with col_krb2:
+            st.metric("Renouvellements", kerberos_stats['renewals'])
+        with col_krb3:
+            st.metric("Ticket réutilisé sans commande", kerberos_stats['cache_hits'])
+        with col_krb4:
+            st.metric("Échecs kinit", kerberos_stats['failures'])
+        st.caption(f"Renouvellement si le ticket expire dans moins de {kerberos.renew_window // 60} min "
+                   "(KERBEROS_RENEW_WINDOW)")
+
+        # Statistiques du client Microsoft Graph
+        graph_stats = get_graph_client().get_stats()
+        st.write("**Client Microsoft Graph:**")
+        col_graph1, col_graph2, col_graph3, col_graph4 = st.columns(4)
+        with col_graph1:
+            st.metric("Requêtes", graph_stats['requests'])
+        with col_graph2:
+            st.metric("Jetons demandés", graph_stats['token_requests'])
+        with col_graph3:
+            st.metric("Jetons réutilisés", graph_stats['token_cache_hits'])
+        with col_graph4:
+            st.metric("Réponses 429", graph_stats['throttled'])
+        if graph_stats['endpoints']:
+            st.dataframe(pd.DataFrame([{
+                "Point d'accès": name,
+                "Appels": metrics['calls'],
+                "Erreurs": metrics['errors'],
+                "Latence moyenne (s)": round(metrics['time_avg'], 3),
+                "Latence max (s)": round(metrics['time_max'], 3),
+            } for name, metrics in graph_stats['endpoints'].items()]), hide_index=True, use_container_width=True)
 
     def test_sync_command():
         """Test de la commande de synchronisation"""
         st.subheader("🧪 Test de la commande de synchronisation")
         
-        # Test kinit
-        kinit_cmd = f"KRB5_CONFIG={krb5_conf} kinit -k -t {keytab_path} xxx@xxx-xxx.LAN"
-        result = subprocess.run(kinit_cmd, shell=True, capture_output=True, text=True, env=env)
+        kerberos = get_kerberos_credentials()
+
+        # Test kinit (renouvellement forcé depuis le keytab)
+        result = kerberos.renew()
         
         st.write("**Test kinit:**")
         st.text("kinit stdout:\n" + result.stdout)
         st.text("kinit stderr:\n" + result.stderr)
         
         # Test klist
-        klist_cmd = f"KRB5_CONFIG={krb5_conf} klist"
-        result2 = subprocess.run(klist_cmd, shell=True, capture_output=True, text=True, env=env)
+        result2 = kerberos.klist()
         
         st.write("**Test klist:**")
         st.text("klist stdout:\n" + result2.stdout)
         st.text("klist stderr:\n" + result2.stderr)
 
     # ========================= Affichage résumé avec composants Streamlit =========================
-    def display_streamlit_summary(summary_lines):
-        """Affiche le résumé avec les composants Streamlit natifs"""
-        import re
-        
+    def display_streamlit_summary(summary):
+        """Affiche le résumé structuré (voir modules/sync_summary.py) avec les composants Streamlit natifs"""
         st.subheader("📊 Résumé de la synchronisation")
-        
-        # Extraire les données du résumé
-        users_sent = 0
-        users_errors = 0
-        groups_sent = 0
-        groups_errors = 0
-        passwords_sent = 0 
-        passwords_errors = 0
-        duration = "N/A"
-        is_dry_run = False
-        success_rate = 0
-        
-        for line in summary_lines:
-            # Durée
-            if "Durée:" in line:
-                match = re.search(r'Durée: ([\d.]+) secondes', line)
-                if match:
-                    duration = f"{match.group(1)}s"
-            
-            # Mode
-            if "Mode: DRY RUN" in line:
-                is_dry_run = True
-                
-            # Utilisateurs
-            if "Synchronisés:" in line and "UTILISATEURS" in ''.join(summary_lines[max(0, summary_lines.index(line)-3):summary_lines.index(line)]):
-                match = re.search(r'Synchronisés: (\d+)', line)
-                if match:
-                    users_sent = int(match.group(1))
-            if "Erreurs:" in line and "UTILISATEURS" in ''.join(summary_lines[max(0, summary_lines.index(line)-5):summary_lines.index(line)]):
-                match = re.search(r'Erreurs: (\d+)', line)
-                if match:
-                    users_errors = int(match.group(1))
-                    
-            # Groupes 
-            if "Synchronisés:" in line and "GROUPES" in ''.join(summary_lines[max(0, summary_lines.index(line)-3):summary_lines.index(line)]):
-                match = re.search(r'Synchronisés: (\d+)', line)
-                if match:
-                    groups_sent = int(match.group(1))
-            if "Erreurs:" in line and "GROUPES" in ''.join(summary_lines[max(0, summary_lines.index(line)-5):summary_lines.index(line)]):
-                match = re.search(r'Erreurs: (\d+)', line)
-                if match:
-                    groups_errors = int(match.group(1))
-                    
-            # Mots de passe
-            if "Hash synchronisés:" in line:
-                match = re.search(r'Hash synchronisés: (\d+)', line)
-                if match:
-                    passwords_sent = int(match.group(1))
-            if "Erreurs:" in line and "MOTS DE PASSE" in ''.join(summary_lines[max(0, summary_lines.index(line)-3):summary_lines.index(line)]):
-                match = re.search(r'Erreurs: (\d+)', line)
-                if match:
-                    passwords_errors = int(match.group(1))
-                    
-            # Taux de réussite
-            if "Taux de réussite:" in line:
-                match = re.search(r'Taux de réussite: ([\d.]+)%', line)
-                if match:
-                    success_rate = float(match.group(1))
-        
-        # Affichage avec composants Streamlit
+
+        objects = summary.get("objects", {})
+        users = objects.get("user", {})
+        groups = objects.get("group", {})
+        devices = objects.get("device", {})
+        passwords = objects.get("hashnt", {})
+        ok_count, error_count, success_rate = summary_totals(summary)
+        duration = f"{summary['duration']:.1f}s" if summary.get("duration") is not None else "N/A"
+
         col1, col2 = st.columns(2)
-        
+
         with col1:
             st.metric("⏱️ Durée", duration)
-            if is_dry_run:
+            if summary.get("dry_run"):
                 st.info("🧪 Mode TEST (Dry Run)")
             else:
                 st.success("🚀 Mode PRODUCTION")
-                
+
         with col2:
             st.metric("📈 Taux de réussite", f"{success_rate:.1f}%")
-            
+            if summary.get("status") == "failed":
+                st.error(f"❌ Synchronisation interrompue : {summary.get('message', '')}")
+
         # Métriques principales en colonnes
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.subheader("👥 Utilisateurs")
-            st.success(f"✅ Synchronisés: **{users_sent}**")
-            if users_errors > 0:
-                st.error(f"❌ Erreurs: **{users_errors}**")
-            else:
-                st.success("✅ Aucune erreur")
-                
-        with col2:
-            st.subheader("🗂️ Groupes")  
-            st.success(f"✅ Synchronisés: **{groups_sent}**")
-            if groups_errors > 0:
-                st.error(f"❌ Erreurs: **{groups_errors}**")
-            else:
-                st.success("✅ Aucune erreur")
-                
-        with col3:
-            st.subheader("🔐 Mots de passe")
-            st.success(f"✅ Hash synchronisés: **{passwords_sent}**")
-            if passwords_errors > 0:
-                st.error(f"❌ Erreurs: **{passwords_errors}**")
-            else:
-                st.success("✅ Aucune erreur")
-        
+        sections = [("👥 Utilisateurs", users, "Synchronisés"), ("🗂️ Groupes", groups, "Synchronisés"),
+                    ("🔐 Mots de passe", passwords, "Hash synchronisés")]
+        if devices:
+            sections.append(("💻 Appareils", devices, "Synchronisés"))
+        for column, (title, counts, label) in zip(st.columns(len(sections)), sections):
+            with column:
+                st.subheader(title)
+                st.success(f"✅ {label}: **{counts.get('sent', 0)}**")
+                if counts.get("deleted"):
+                    st.info(f"🗑️ Supprimés: **{counts['deleted']}**")
+                errors = counts.get("errors", 0) + counts.get("delete_errors", 0)
+                if errors > 0:
+                    st.error(f"❌ Erreurs: **{errors}**")
+                else:
+                    st.success("✅ Aucune erreur")
+
         # Barre de progression globale
-        total_items = users_sent + groups_sent + passwords_sent + users_errors + groups_errors + passwords_errors
+        total_items = ok_count + error_count
         if total_items > 0:
-            progress = (users_sent + groups_sent + passwords_sent) / total_items
-            st.progress(progress)
-            st.caption(f"Progression globale: {users_sent + groups_sent + passwords_sent}/{total_items} éléments traités avec succès")
-        
+            st.progress(ok_count / total_items)
+            st.caption(f"Progression globale: {ok_count}/{total_items} éléments traités avec succès")
+
+        if summary.get("phases"):
+            st.caption("⏱️ Durée par phase : " + " • ".join(
+                f"{phase} {seconds:.1f}s" for phase, seconds in summary["phases"].items()))
+
         # Détails dans des expanders
         with st.expander("📋 Détails utilisateurs", expanded=False):
-            # Extraire les noms d'utilisateurs du résumé
-            user_names = []
-            in_user_section = False
-            for line in summary_lines:
-                if "Premiers utilisateurs synchronisés:" in line:
-                    in_user_section = True
-                    continue
-                elif in_user_section and line.strip().startswith("- "):
-                    # Extraire le nom d'utilisateur
-                    match = re.search(r'- ([^\s]+)', line.strip())
-                    if match:
-                        user_names.append(match.group(1))
-                elif in_user_section and ("GROUPES" in line or "🗂️" in line):
-                    break
-                    
+            user_names = summary.get("outcomes", {}).get("user", {}).get("sent", [])
             if user_names:
-                st.write("**Premiers utilisateurs synchronisés :**")
-                for name in user_names[:5]:
-                    st.write(f"• {name}")
-                if len(user_names) > 5:
-                    st.caption(f"... et {users_sent - 5} autres utilisateurs")
+                st.write("**Utilisateurs synchronisés :**")
+                st.dataframe(pd.DataFrame({"Utilisateur": user_names}), use_container_width=True, hide_index=True)
+                if users.get("sent", 0) > len(user_names):
+                    st.caption(f"... et {users['sent'] - len(user_names)} autres utilisateurs")
             else:
                 st.info("Aucun détail utilisateur disponible")
-        
+
+        if summary.get("errors"):
+            with st.expander(f"❌ Erreurs ({error_count})", expanded=False):
+                st.dataframe(pd.DataFrame(summary["errors"]), use_container_width=True, hide_index=True)
+
         # Statut final
         if success_rate == 100.0:
             st.balloons()
@@ -913,138 +883,160 @@ def run():
         else:
             st.warning(f"⚠️ Synchronisation terminée avec des erreurs ({success_rate:.1f}% de réussite)")
 
+    def render_sync_log_viewer(log_file, key):
+        """Consultation du journal complet d'une synchronisation, filtré par niveau et par objet"""
+        col_f1, col_f2 = st.columns([1, 2])
+        with col_f1:
+            levels = st.multiselect("Niveaux", list(SYNC_LOG_LEVELS), default=list(SYNC_LOG_LEVELS), key=f"{key}_levels")
+        with col_f2:
+            search = st.text_input("🔍 Filtrer (objet ou texte)", key=f"{key}_search")
+        records, matched = read_sync_log(log_file, levels=levels, search=search)
+        if matched > len(records):
+            st.caption(f"{matched} ligne(s) correspondante(s), les {len(records)} dernières sont affichées")
+        else:
+            st.caption(f"{matched} ligne(s) correspondante(s)")
+        st.code('\n'.join(record['line'] for record in records), language="text")
+
+    def attach_to_running_sync(log_container):
+        """Affiche les logs de la synchronisation en cours jusqu'à sa fin (sans l'interrompre)"""
+        refresh_interval = 1.0 / getattr(config, 'SYNC_LOG_REFRESH_HZ', 4)
+        recent_logs = deque(maxlen=30)
+        offset = 0
+        run = current_sync_run()
+        while run is not None:
+            if run.get('log_file'):
+                new_lines, offset = tail_sync_log(run['log_file'], offset, lines=30)
+                recent_logs.extend(new_lines)
+            with log_container.container():
+                st.subheader(f"📋 Synchronisation en cours (PID {run.get('pid')})")
+                st.caption(f"Dernier signe de vie : {run.get('heartbeat') or '?'}")
+                if recent_logs:
+                    st.code('\n'.join(recent_logs), language="text")
+                elif not run.get('log_file'):
+                    st.info("Journal de cette synchronisation non disponible : attente de sa fin...")
+            time.sleep(refresh_interval)
+            run = current_sync_run()
+        log_container.empty()
+
     # ========================= Synchronisation =========================
-    def run_sync_with_live_logs(is_dryrun=True, timeout_seconds=120, use_summary=True):
-        """Exécute la synchronisation Azure AD avec logs en temps réel"""
-        import subprocess
-        import threading
-        import queue
-        import time
-        
+    def run_sync_with_live_logs(is_dryrun=True, timeout_seconds=120, use_summary=True, plan_out=None, apply_plan=None):
+        """Exécute la synchronisation Azure AD avec logs en temps réel
+
+        `timeout_seconds` est un délai d'inactivité : une synchronisation longue qui
+        produit des logs continue, dans la limite de SYNC_MAX_DURATION.
+        `plan_out` : fichier où le dry run écrit son plan ; `apply_plan` : plan à exécuter.
+        """
         # Créer les conteneurs pour affichage en temps réel
         log_container = st.empty()
-        output_lines = []
-        error_lines = []
-        
+
         try:
-            # Vérifier si un processus de sync est déjà en cours
-            check_cmd = ["pgrep", "-f", "run_sync.py"]
-            check_result = subprocess.run(check_cmd, capture_output=True, text=True)
-            
-            if check_result.returncode == 0 and check_result.stdout.strip():
-                st.warning("⚠️ Une synchronisation est déjà en cours. Attendez qu'elle se termine ou redémarrez l'application.")
-                # Tuer les anciens processus
-                subprocess.run(["pkill", "-f", "run_sync.py"], capture_output=True)
-                time.sleep(2)
-            
-            # Initialiser le ticket Kerberos avant la synchronisation
-            st.info("🔐 Initialisation de l'authentification Kerberos...")
-            kinit_cmd = ["kinit", "-k", "-t", keytab_path, "xxx@xxx-xxx.LAN"]
-            kinit_result = subprocess.run(kinit_cmd, env=env, capture_output=True, text=True)
-            
-            if kinit_result.returncode != 0:
-                st.error(f"❌ Échec de l'authentification Kerberos: {kinit_result.stderr}")
+            # Synchronisation déjà en cours (service ou autre session) : suivre ses logs, puis lancer la nôtre à la suite
+            running = current_sync_run()
+            if running is not None:
+                st.warning(f"⏳ Une synchronisation est déjà en cours (PID {running.get('pid')}, démarrée le "
+                           f"{running.get('started') or '?'}) : elle n'est pas interrompue, la vôtre démarrera à la suite.")
+                attach_to_running_sync(log_container)
+
+            # Ticket Kerberos du cache, renouvelé seulement s'il expire bientôt
+            try:
+                ticket = get_kerberos_credentials().ensure_ticket()
+            except KerberosError as e:
+                st.error(f"❌ Échec de l'authentification Kerberos: {e}")
                 return None
-            else:
-                st.success("✅ Authentification Kerberos réussie")
+            st.success(f"✅ {describe_ticket(ticket)}")
             
             # Choisir le script selon l'option
             script_to_use = config.SYNC_SCRIPT_WITH_SUMMARY if use_summary else sync_script
             cmd = [f"{venv_path}/bin/python", script_to_use]
             if is_dryrun:
                 cmd.append("--dryrun")
-            
+            cmd += sync_plan_args(plan_out=plan_out, apply_plan=apply_plan)
+
+            # Le script écrit son résumé JSON dans ce fichier, et enregistre le journal dans le registre
+            summary_path = new_summary_file()
+            purge_sync_logs()
+            log_path = new_sync_log_path()
+
             # Démarrer le processus
             process = subprocess.Popen(
                 cmd,
                 cwd="/home/samba-sync-ad",
-                env=env,
+                env={**env, SUMMARY_ENV_VAR: summary_path, "AADSYNC_LOG_FILE": log_path},
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,  # Rediriger stderr vers stdout
                 text=True,
-                bufsize=0,  # Unbuffered
-                universal_newlines=True,
-                preexec_fn=lambda: None  # Force immediate output
+                bufsize=1,
             )
-            
+
+            # Lecture en arrière-plan : tampon borné pour l'affichage, journal complet sur disque
+            log_stream = SyncLogStream(process.stdout, spool_path=log_path)
             start_time = time.time()
-            
-            # Lire les logs ligne par ligne en temps réel
-            import select
+            refresh_interval = 1.0 / getattr(config, 'SYNC_LOG_REFRESH_HZ', 4)
+            max_duration = getattr(config, 'SYNC_MAX_DURATION', 3600)
+            rendered_total = 0
+
             while True:
-                # Vérifier si le processus est terminé
-                if process.poll() is not None:
-                    # Lire les dernières lignes
-                    remaining_output = process.stdout.read()
-                    if remaining_output:
-                        output_lines.extend(remaining_output.strip().split('\n'))
-                    break
-                    
-                # Vérifier le timeout
-                if time.time() - start_time > timeout_seconds:
+                finished = process.poll() is not None
+                if finished:
+                    log_stream.join(timeout=5)
+
+                # Arrêt seulement si le script ne produit plus rien (ou dépasse la durée max)
+                stop_reason = None
+                if not finished and log_stream.idle_for() > timeout_seconds:
+                    stop_reason = f"aucune sortie depuis {timeout_seconds} secondes"
+                elif not finished and max_duration and time.time() - start_time > max_duration:
+                    stop_reason = f"durée maximale de {max_duration} secondes dépassée"
+                if stop_reason:
                     process.terminate()
-                    st.error(f"❌ Timeout après {timeout_seconds} secondes")
+                    try:
+                        process.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+                    load_summary(summary_path)
+                    st.error(f"❌ Synchronisation arrêtée : {stop_reason}")
                     return None
-                
-                # Utiliser select pour lire de manière non-bloquante
-                ready, _, _ = select.select([process.stdout], [], [], 0.1)
-                if ready:
-                    line = process.stdout.readline()
-                    if line:
-                        output_lines.append(line.rstrip())
-                        
-                        # Mettre à jour l'affichage plus fréquemment
-                        if len(output_lines) % 2 == 0 or len(output_lines) > 20:
-                            with log_container.container():
-                                st.subheader("📋 Logs de synchronisation en temps réel")
-                                # Afficher les 30 dernières lignes
-                                recent_logs = output_lines[-30:] if len(output_lines) > 30 else output_lines
-                                st.code('\n'.join(recent_logs), language="text")
-                
-                time.sleep(0.1)  # Petite pause
-            
-            # Lire les dernières lignes
-            remaining_output = process.stdout.read()
-            if remaining_output:
-                output_lines.extend(remaining_output.strip().split('\n'))
-            
+
+                # Rafraîchissement limité (SYNC_LOG_REFRESH_HZ), uniquement s'il y a du nouveau
+                recent_logs, total = log_stream.tail(30)
+                if total != rendered_total and not finished:
+                    rendered_total = total
+                    with log_container.container():
+                        st.subheader("📋 Logs de synchronisation en temps réel")
+                        st.caption(f"{total} lignes • {log_stream.counts['ERROR']} erreur(s) • "
+                                   f"{time.time() - start_time:.0f}s")
+                        st.code('\n'.join(recent_logs), language="text")
+
+                if finished:
+                    break
+                time.sleep(refresh_interval)
+
+            output_lines, total = log_stream.tail(count=None)
+
             # Affichage final
             with log_container.container():
-                if use_summary and output_lines:
-                    # Séparer le résumé des logs JSON
-                    summary_start = -1
-                    for i, line in enumerate(output_lines):
-                        if "📊 RÉSUMÉ DE LA SYNCHRONISATION AZURE AD" in line:
-                            summary_start = i
-                            break
-                    
-                    if summary_start >= 0:
-                        # Afficher le résumé en premier
-                        summary_lines = output_lines[summary_start:]
-                        json_logs = output_lines[:summary_start]
-                        
-                        # Extraire les données du résumé pour un affichage Streamlit
-                        display_streamlit_summary(summary_lines)
-                        
-                        # Afficher les logs JSON dans un expander fermé
-                        if json_logs:
-                            with st.expander("🔍 Voir les logs JSON détaillés", expanded=False):
-                                st.code('\n'.join(json_logs), language="json")
-                    else:
-                        st.subheader("📋 Logs de synchronisation")
-                        st.code('\n'.join(output_lines), language="text")
+                # Résumé JSON du script ; à défaut, analyse du résumé texte
+                summary = load_summary(summary_path)
+                summary_start = next((i for i, line in enumerate(output_lines) if SYNC_SUMMARY_MARKER in line), -1)
+                if summary is None and use_summary and summary_start >= 0:
+                    summary = summary_from_lines(output_lines[summary_start:])
+
+                if summary is not None:
+                    display_streamlit_summary(summary)
                 else:
-                    st.subheader("📋 Logs complets de synchronisation")
-                    st.code('\n'.join(output_lines), language="text")
-            
+                    st.subheader("📋 Dernières lignes de la synchronisation")
+                    st.code('\n'.join(output_lines[-100:]), language="text")
+                st.caption(f"📁 Journal complet ({total} lignes, {log_stream.counts['ERROR']} erreur(s)) : "
+                           "consultable et filtrable dans « 📁 Journaux des synchronisations »")
+
             # Créer un objet résultat compatible
             class SyncResult:
-                def __init__(self, returncode, stdout):
+                def __init__(self, returncode, stdout, log_file):
                     self.returncode = returncode
                     self.stdout = stdout
                     self.stderr = ""
-            
-            return SyncResult(process.returncode, '\n'.join(output_lines))
+                    self.log_file = log_file
+
+            return SyncResult(process.returncode, '\n'.join(output_lines), log_stream.spool_path)
             
         except Exception as e:
             st.error(f"❌ Erreur lors de l'exécution : {e}")
@@ -1055,7 +1047,7 @@ def run():
     st.title(config.APP_TITLE)
     
     # ========================= ONGLETS PRINCIPAUX =========================
-    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9 = st.tabs([
         "👤 Création utilisateur",
         "📂 Import CSV",
         "🔄 Synchronisation AD",
@@ -1063,7 +1055,8 @@ def run():
         "🗑️ Suppression",
         "👥 Groupes",
         "🔄 Sync IMFR/SAMBA",
-        "🔧 Outils"
+        "🔧 Outils",
+        "⏳ Tâches"
     ])
     
     # ========================= ONGLET 1: CRÉATION UTILISATEUR =========================
@@ -1149,8 +1142,8 @@ def run():
                 if not firstname or not lastname:
                     st.error("Merci de remplir tous les champs obligatoires.")
                 else:
-                    # Génération automatique du username
-                    username = generate_username(firstname, lastname)
+                    # Génération automatique du username (suffixe si le login est déjà pris)
+                    username = allocate_usernames([(firstname, lastname)])[0]
                     
                     # Si aucun mot de passe fourni, générer automatiquement
                     if not password:
@@ -1191,6 +1184,7 @@ def run():
                                 # Création de l'utilisateur
                                 output_create, error_create = execute_ssh_command(client, cmd_create, config.SAMBA_PWD)
                                 if error_create:
+                                    get_username_allocator("mysql").release(username)
                                     st.error(f"❌ Erreur lors de la création de {username}: {error_create}")
                                 else:
                                     # Ajout aux groupes (principal + licences)
@@ -1408,16 +1402,20 @@ def run():
                         # Stockage des données d'aperçu dans session_state pour cohérence
                         if 'csv_preview_data' not in st.session_state or st.button("🔄 Actualiser l'aperçu", key="refresh_preview"):
                             st.session_state.csv_preview_data = []
+                            # Logins de tout le fichier en un passage (aperçu, sans réservation)
+                            preview_usernames = allocate_usernames(
+                                [(str(row['prenom']).strip(), str(row['nom']).strip()) for _, row in df.iterrows()],
+                                reserve=False
+                            )
                             
-                            for idx, row in df.iterrows():
+                            for (idx, row), username in zip(df.iterrows(), preview_usernames):
                                 firstname = str(row['prenom']).strip()
                                 lastname = str(row['nom']).strip()
                                 classe = str(row['classe']).strip()
                                 # Normaliser la classe pour l'aperçu
                                 classe_normalized = normalize_class_name(classe) if classe and classe != 'nan' else ""
                                 
-                                # Génération du username et password pour l'aperçu
-                                username = generate_username(firstname, lastname)
+                                # Génération du password pour l'aperçu
                                 password = generate_password(firstname, lastname) if simulate_passwords else "CFA****"
                                 
                                 # Construire la liste des groupes (principal + licences)
@@ -1525,23 +1523,48 @@ def run():
                         error_count = 0
                         warning_count = 0
                         
+                        def render_detailed_logs():
+                            # Mise à jour des logs en temps réel
+                            with log_placeholder:
+                                if len(detailed_logs) <= 5:
+                                    # Afficher tous les logs si peu d'utilisateurs
+                                    for log in detailed_logs:
+                                        st.markdown(log)
+                                else:
+                                    # Afficher seulement les 3 derniers logs si beaucoup d'utilisateurs
+                                    st.markdown("*... (logs précédents masqués pour la performance)*")
+                                    for log in detailed_logs[-3:]:
+                                        st.markdown(log)
+                        
+                        # Comptes à créer (création réelle) : traités par une tâche en arrière-plan
+                        pending_users = []
+                        license_groups = csv_selected_licenses if 'csv_selected_licenses' in locals() and csv_selected_licenses else []
+                        
+                        # Logins réservés pour tout le fichier (création réelle) : homonymes → prenom.nom1, ...
+                        csv_usernames = allocate_usernames(
+                            [(str(row['prenom']).strip(), str(row['nom']).strip()) for _, row in df.iterrows()],
+                            reserve=not dry_run_csv
+                        )
+                        
                         # ========================= TRAITEMENT =========================
-                        for idx, row in df.iterrows():
+                        for (idx, row), username in zip(df.iterrows(), csv_usernames):
                             firstname = str(row['prenom']).strip()
                             lastname = str(row['nom']).strip()
                             classe = str(row['classe']).strip()
                             # Normaliser la classe
                             classe = normalize_class_name(classe) if classe and classe != 'nan' else ""
                             
-                            # Génération automatique du username et password
-                            username = generate_username(firstname, lastname)
+                            # Génération automatique du password
                             password = generate_password(firstname, lastname)
                             
                             # Mise à jour du statut
                             current_progress = (idx + 1) / len(df)
-                            progress_bar.progress(current_progress)
-                            status_text.text(f"🔄 Traitement: {firstname} {lastname} ({idx+1}/{len(df)})")
-                            progress_text.text(f"Progression: {int(current_progress * 100)}%")
+                            if dry_run_csv:
+                                progress_bar.progress(current_progress)
+                                status_text.text(f"🔄 Traitement: {firstname} {lastname} ({idx+1}/{len(df)})")
+                                progress_text.text(f"Progression: {int(current_progress * 100)}%")
+                            else:
+                                status_text.text(f"🔄 Préparation: {firstname} {lastname} ({idx+1}/{len(df)})")
                             
                             # Log de début
                             log_entry = f"🔄 **{idx+1}.** Traitement de **{firstname} {lastname}**\\n"
@@ -1549,27 +1572,8 @@ def run():
                             log_entry += f"   • Classe: `{classe}`\\n"
                             log_entry += f"   • Groupe: `{groupe_par_defaut}`\\n"
                             
-                            # Commandes Samba-Tool
-                            cmd_create = f"sudo -S samba-tool user create {username} {password} " \
-                                f"--description='{classe}'"
-                            
-                            # Commandes pour les groupes (principal + licences)
-                            group_commands = []
-                            all_groups = [groupe_par_defaut]
-                            
-                            # Ajout au groupe principal
-                            group_commands.append(f"sudo -S samba-tool group addmembers {groupe_par_defaut} {username}")
-                            
-                            # Ajout aux groupes de licences sélectionnés (CSV)
-                            if 'csv_selected_licenses' in locals() and csv_selected_licenses:
-                                for license_group in csv_selected_licenses:
-                                    # Créer le groupe s'il n'existe pas
-                                    group_commands.append(f"sudo -S samba-tool group add {license_group} || true")
-                                    # Ajouter l'utilisateur au groupe
-                                    group_commands.append(f"sudo -S samba-tool group addmembers {license_group} {username}")
-                                    all_groups.append(license_group)
-                                
-                                log_entry += f"   • Groupes de licences: `{', '.join(csv_selected_licenses)}`\\n"
+                            if license_groups:
+                                log_entry += f"   • Groupes de licences: `{', '.join(license_groups)}`\\n"
                             
                             if dry_run_csv:
                                 # Mode simulation - PAS DE SAUVEGARDE EN DRY RUN
@@ -1581,109 +1585,56 @@ def run():
                                 # NOTE: En mode dry run, on ne sauvegarde PAS dans Excel
                                 success_count += 1
                                 
+                                log_entry += f"\\n---\\n"
+                                detailed_logs.append(log_entry)
+                                render_detailed_logs()
                             else:
-                                # Mode création réelle
-                                log_entry += f"   • Création du compte sur Samba...\\n"
-                                
-                                try:
-                                    with ssh_connection(config.SAMBA_SERVER, config.SAMBA_USER, config.SAMBA_PWD) as client:
-                                        if client:
-                                            # Création utilisateur
-                                            log_entry += f"   • Exécution: `samba-tool user create {username}...`\\n"
-                                            output_create, error_create = execute_ssh_command(client, cmd_create, config.SAMBA_PWD)
-                                            
-                                            if error_create:
-                                                log_entry += f"   • ❌ **Erreur création**: {error_create[:100]}...\\n"
-                                                results.append(f"❌ {firstname} {lastname}: {error_create}")
-                                                error_count += 1
-                                            else:
-                                                log_entry += f"   • ✅ Utilisateur créé avec succès\\n"
-                                                
-                                                # Ajout aux groupes (principal + licences)
-                                                group_errors = []
-                                                for group_cmd in group_commands:
-                                                    log_entry += f"   • Exécution: `{group_cmd.split('sudo -S ')[1]}`...\\n"
-                                                    output_group, error_group = execute_ssh_command(client, group_cmd, config.SAMBA_PWD)
-                                                    
-                                                    if error_group and "already exists" not in error_group.lower():
-                                                        group_errors.append(error_group[:50])
-                                                
-                                                if group_errors:
-                                                    log_entry += f"   • ⚠️ **Avertissements**: Erreurs groupes: {'; '.join(group_errors)}...\\n"
-                                                    results.append(f"⚠️ {firstname} {lastname}: Créé mais erreur groupes")
-                                                    warning_count += 1
-                                                else:
-                                                    log_entry += f"   • ✅ Ajouté au groupe avec succès\\n"
-                                                    log_entry += f"   • 🔑 Mot de passe: `{password}`\\n"
-                                                    results.append(f"✅ {firstname} {lastname} ({username})")
-                                                    success_count += 1
-                                                
-                                                # Sauvegarder dans Excel
-                                                save_user_to_excel(username, firstname, lastname, password, classe, groupe_par_defaut)
-                                                log_entry += f"   • 💾 Sauvegardé dans Excel\\n"
-                                        else:
-                                            log_entry += f"   • ❌ **Erreur**: Impossible de se connecter au serveur Samba\\n"
-                                            results.append(f"❌ {firstname} {lastname}: Connexion impossible")
-                                            save_user_to_excel(username, firstname, lastname, password, classe, groupe_par_defaut)
-                                            error_count += 1
-                                            
-                                except Exception as e:
-                                    log_entry += f"   • ❌ **Exception**: {str(e)}\\n"
-                                    results.append(f"❌ {firstname} {lastname}: {str(e)}")
-                                    error_count += 1
-                            
-                            log_entry += f"\\n---\\n"
-                            detailed_logs.append(log_entry)
-                            
-                            # Mise à jour des logs en temps réel
-                            with log_placeholder:
-                                if len(detailed_logs) <= 5:
-                                    # Afficher tous les logs si peu d'utilisateurs
-                                    for log in detailed_logs:
-                                        st.markdown(log)
-                                else:
-                                    # Afficher seulement les 3 derniers logs si beaucoup d'utilisateurs
-                                    st.markdown("*... (logs précédents masqués pour la performance)*")
-                                    for log in detailed_logs[-3:]:
-                                        st.markdown(log)
-                        
+                                # Mode création réelle : les comptes sont créés par une tâche en arrière-plan
+                                pending_users.append({
+                                    'username': username, 'password': password,
+                                    'prenom': firstname, 'nom': lastname, 'classe': classe
+                                })
+
+                        if pending_users:
+                            # Création, ajout aux groupes (principal + licences) et sauvegarde MySQL
+                            # exécutés par la file de tâches : un rafraîchissement n'interrompt plus l'import
+                            job_id = enqueue_csv_import(pending_users, groupe_par_defaut, license_groups)
+                            progress_bar.progress(1.0)
+                            status_text.text("✅ Import ajouté à la file de tâches")
+                            progress_text.empty()
+                            st.success(f"🧵 Création de {len(pending_users)} compte(s) lancée en arrière-plan (tâche `{job_id[:8]}`)")
+                            st.info("📋 Suivez la progression, les logs et le résultat dans l'onglet « ⏳ Tâches »")
+
                         # ========================= FINALISATION =========================
-                        status_text.text("✅ Traitement terminé !")
-                        progress_text.text("Terminé à 100%")
-                        
-                        # Résumé final
-                        with summary_container:
-                            st.subheader("📊 Résumé du traitement")
-                            
-                            col_s1, col_s2, col_s3, col_s4 = st.columns(4)
-                            with col_s1:
-                                st.metric("Total traité", len(df))
-                            with col_s2:
-                                st.metric("Succès", success_count, delta=f"{int(success_count/len(df)*100)}%")
-                            with col_s3:
-                                st.metric("Avertissements", warning_count)
-                            with col_s4:
-                                st.metric("Erreurs", error_count)
-                            
-                            if dry_run_csv:
+                        if dry_run_csv:
+                            status_text.text("✅ Traitement terminé !")
+                            progress_text.text("Terminé à 100%")
+
+                            # Résumé final
+                            with summary_container:
+                                st.subheader("📊 Résumé du traitement")
+
+                                col_s1, col_s2, col_s3, col_s4 = st.columns(4)
+                                with col_s1:
+                                    st.metric("Total traité", len(df))
+                                with col_s2:
+                                    st.metric("Succès", success_count, delta=f"{int(success_count/len(df)*100)}%")
+                                with col_s3:
+                                    st.metric("Avertissements", warning_count)
+                                with col_s4:
+                                    st.metric("Erreurs", error_count)
+
                                 st.success(f"🔍 **Simulation terminée** - {len(results)} comptes analysés")
                                 st.info("💡 Désactivez le mode simulation et cliquez sur 'CRÉER LES COMPTES' pour la création réelle.")
-                            else:
-                                if error_count == 0 and warning_count == 0:
-                                    st.success(f"🎉 **Tous les comptes ont été créés avec succès !** ({success_count}/{len(df)})")
-                                elif error_count == 0:
-                                    st.warning(f"⚠️ **Création terminée avec {warning_count} avertissements** ({success_count}/{len(df)} réussis)")
-                                else:
-                                    st.error(f"❌ **Création terminée avec {error_count} erreurs** ({success_count}/{len(df)} réussis)")
-                            
-                            # Logs complets téléchargeables
-                            full_logs = "\\n".join(detailed_logs)
-                            st.download_button(
-                                label="📥 Télécharger les logs complets",
-                                data=full_logs,
-                                file_name=f"logs_creation_{'simulation' if dry_run_csv else 'reel'}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.txt",
-                                mime="text/plain"
-                            )
+
+                                # Logs complets téléchargeables
+                                full_logs = "\\n".join(detailed_logs)
+                                st.download_button(
+                                    label="📥 Télécharger les logs complets",
+                                    data=full_logs,
+                                    file_name=f"logs_creation_simulation_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                                    mime="text/plain"
+                                )
                                 
             except Exception as e:
                 st.error(f"Erreur lors de la lecture du fichier CSV: {str(e)}")
@@ -1695,7 +1646,8 @@ def run():
         col1, col2 = st.columns(2)
         
         with col1:
-            timeout_config = st.slider("Timeout (secondes)", 10, 600, 60, 10)
+            timeout_config = st.slider("Timeout d'inactivité (secondes)", 10, 600, 60, 10,
+                                       help="Arrêt si le script n'écrit plus rien pendant ce délai")
             st.info("💡 **Temps recommandés (mis à jour):**\n- Dry run: 10-30s\n- Sync réelle: 30-60s\n- Si lenteur: 120-180s")
             dryrun = st.checkbox("Dry Run (mode test)", value=True)
             
@@ -1703,8 +1655,30 @@ def run():
             st.info(config.HELP_MESSAGES['dry_run'])
             use_summary = st.checkbox("📊 Affichage résumé (plus lisible)", value=True)
             st.caption("✅ Résumé : affichage digestible\n❌ Logs bruts : JSON détaillé")
-            
-        if st.button("🔄 Exécuter la synchronisation AD", type="primary"):
+            run_in_background = st.checkbox("🧵 Exécuter en arrière-plan", value=True,
+                                            help="La synchronisation continue même si la page est rechargée ; suivi dans l'onglet « ⏳ Tâches »")
+
+        running_sync = current_sync_run()
+        if running_sync is not None:
+            st.info(f"🔄 Une synchronisation est en cours (PID {running_sync.get('pid')}"
+                    f"{', mode service' if running_sync.get('mode') == 'service' else ''}) : "
+                    "une nouvelle synchronisation démarrera à sa suite, sans l'interrompre.")
+
+        sync_clicked = st.button("🔄 Exécuter la synchronisation AD", type="primary")
+
+        # Un dry run prépare un plan qui peut ensuite être appliqué tel quel, sans relire tout l'annuaire
+        plan_out = None
+        if sync_clicked and dryrun:
+            discard_sync_plan(st.session_state.get('azure_sync_plan'))
+            plan_out = new_sync_plan_file()
+            st.session_state['azure_sync_plan'] = plan_out
+
+        if sync_clicked and run_in_background:
+            job_id = enqueue_azure_sync(dryrun=dryrun, timeout_seconds=timeout_config, use_summary=use_summary,
+                                        plan_out=plan_out)
+            st.success(f"🧵 Synchronisation ajoutée à la file de tâches (tâche `{job_id[:8]}`)")
+            st.info("📋 Suivez les logs et le résumé dans l'onglet « ⏳ Tâches »")
+        elif sync_clicked:
             st.subheader("🔄 Synchronisation en cours...")
             
             # Indicateur de progression
@@ -1714,14 +1688,14 @@ def run():
             status_text.text("🚀 Initialisation de la synchronisation...")
             progress_bar.progress(10)
             
-            import time
             time.sleep(0.5)
             
-            status_text.text(f"📡 Exécution du script (timeout: {timeout_config}s)...")
+            status_text.text(f"📡 Exécution du script (arrêt après {timeout_config}s sans sortie)...")
             progress_bar.progress(20)
             
             # Utiliser la version avec résumé ou logs selon le choix
-            result = run_sync_with_live_logs(is_dryrun=dryrun, timeout_seconds=timeout_config, use_summary=use_summary)
+            result = run_sync_with_live_logs(is_dryrun=dryrun, timeout_seconds=timeout_config, use_summary=use_summary,
+                                             plan_out=plan_out)
             progress_bar.progress(90)
                 
             status_text.text("✅ Traitement terminé !")
@@ -1730,14 +1704,7 @@ def run():
             # Affichage des résultats avec logs visibles par défaut
             if result and result.returncode == 0:
                 st.success("✅ Synchronisation terminée avec succès")
-                
-                # Logs toujours visibles pour débugger les lenteurs
-                st.subheader("📋 Logs détaillés de synchronisation")
-                if result.stdout:
-                    st.code(result.stdout, language="text")
-                else:
-                    st.info("Aucun log de sortie disponible")
-                    
+
             elif result:
                 st.error("❌ Erreur lors de la synchronisation")
                 
@@ -1746,15 +1713,92 @@ def run():
                     st.error("**Erreurs:**")
                     st.code(result.stderr, language="text")
                     
-                st.subheader("📋 Logs de sortie")
+                st.subheader("📋 Logs de sortie (dernières lignes)")
                 if result.stdout:
-                    st.code(result.stdout, language="text")
+                    st.code('\n'.join(result.stdout.splitlines()[-100:]), language="text")
                 else:
                     st.info("Aucun log de sortie disponible")
                     
             else:
                 st.error("❌ Le processus n'a pas pu se terminer correctement")
-                st.warning(f"⏰ Timeout après {timeout_config} secondes - Le script prend trop de temps")
+
+        # Plans jamais appliqués ni abandonnés (session fermée, tâche en arrière-plan non consultée)
+        purge_sync_plans()
+        sync_plan_path = st.session_state.get('azure_sync_plan')
+        if sync_plan_path and not os.path.exists(sync_plan_path):
+            st.info("⌛ Le plan du dernier dry run a expiré : relancez un dry run")
+            del st.session_state['azure_sync_plan']
+        elif sync_plan_path:
+            st.subheader("📝 Plan du dernier dry run")
+            plan_overview = load_sync_plan_overview(sync_plan_path)
+            if plan_overview is None:
+                st.info("⏳ Plan pas encore disponible (dry run en cours ou en arrière-plan)")
+            else:
+                st.caption(f"Établi il y a {plan_overview['age'] / 60:.0f} min • highestCommittedUSN "
+                           f"{plan_overview['usn'] if plan_overview['usn'] is not None else 'inconnu'} • "
+                           + ("mots de passe relus dans l'annuaire à l'application" if plan_overview['counts']['hashnt']
+                              else "appliqué sans relecture de l'annuaire s'il n'a pas changé depuis"))
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Suppressions", plan_overview['counts']['delete'])
+                col2.metric("Envois d'objets", plan_overview['counts']['send'])
+                col3.metric("Mots de passe", plan_overview['counts']['hashnt'])
+                if plan_overview['actions']:
+                    st.dataframe(pd.DataFrame(plan_overview['actions']), use_container_width=True, hide_index=True)
+                else:
+                    st.success("✅ Rien à synchroniser")
+
+                apply_col, discard_col = st.columns(2)
+                apply_clicked = apply_col.button("✅ Appliquer ce plan", type="primary",
+                                                 disabled=not plan_overview['actions'], key="apply_sync_plan")
+                if discard_col.button("🗑️ Abandonner ce plan", key="discard_sync_plan"):
+                    discard_sync_plan(sync_plan_path)
+                    del st.session_state['azure_sync_plan']
+                    st.rerun()
+
+                if apply_clicked:
+                    # Le script supprime le plan après l'avoir appliqué
+                    del st.session_state['azure_sync_plan']
+                    if run_in_background:
+                        job_id = enqueue_azure_sync(dryrun=False, timeout_seconds=timeout_config, use_summary=use_summary,
+                                                    apply_plan=sync_plan_path)
+                        st.success(f"🧵 Application du plan ajoutée à la file de tâches (tâche `{job_id[:8]}`)")
+                    else:
+                        result = run_sync_with_live_logs(is_dryrun=False, timeout_seconds=timeout_config,
+                                                         use_summary=use_summary, apply_plan=sync_plan_path)
+                        if result and result.returncode == 0:
+                            st.success("✅ Plan appliqué")
+                        elif result:
+                            st.error("❌ Erreur lors de l'application du plan")
+                            st.code('\n'.join(result.stdout.splitlines()[-100:]), language="text")
+
+        with st.expander("📁 Journaux des synchronisations", expanded=False):
+            sync_logs = list_sync_logs()
+            if sync_logs:
+                selected_log = st.selectbox("Journal", sync_logs, format_func=os.path.basename, key="sync_log_file")
+                render_sync_log_viewer(selected_log, key="sync_log_viewer")
+            else:
+                st.info("Aucun journal de synchronisation")
+
+        with st.expander("🗂️ Exécutions récentes", expanded=False):
+            sync_runs = recent_sync_runs()
+            if sync_runs:
+                st.dataframe(pd.DataFrame([{
+                    "N°": run['id'],
+                    "Statut": run['status_label'],
+                    "Mode": run['mode'],
+                    "Dry run": "✅" if run['dry_run'] else "",
+                    "Début": run['started'],
+                    "Fin": run['finished'] or "",
+                    "PID": run['pid'],
+                } for run in sync_runs]), use_container_width=True, hide_index=True)
+                runs_with_summary = {run['id']: run for run in sync_runs if run.get('summary')}
+                if runs_with_summary:
+                    selected_run = st.selectbox("Résumé de l'exécution", list(runs_with_summary),
+                                                format_func=lambda run_id: f"N°{run_id} - {runs_with_summary[run_id]['started']}",
+                                                key="sync_run_summary")
+                    display_streamlit_summary(runs_with_summary[selected_run]['summary'])
+            else:
+                st.info("Aucune exécution enregistrée")
     # ========================= ONGLET 4: MODIFIER MOT DE PASSE =========================
     with tab4:
         st.header("Modifier le mot de passe d'un utilisateur")
@@ -1929,71 +1973,10 @@ def run():
                     
                     if confirm_raz and confirm_raz_text == "SUPPRIMER TOUS":
                         if st.button("🧹 SUPPRIMER TOUS LES ÉLÈVES", type="secondary"):
-                            progress_bar = st.progress(0)
-                            status_text = st.empty()
-                            results_raz = []
-                            
-                            # Utiliser la liste des vrais membres du groupe Eleves
-                            for idx, username in enumerate(eleves_members):
-                                status_text.text(f"Suppression de {username}... ({idx+1}/{eleves_count})")
-                                
-                                cmd_delete = f"sudo -S samba-tool user delete {username}"
-                                
-                                try:
-                                    with ssh_connection(config.SAMBA_SERVER, config.SAMBA_USER, config.SAMBA_PWD) as client:
-                                        if client:
-                                            output, error = execute_ssh_command(client, cmd_delete, config.SAMBA_PWD)
-                                            if error:
-                                                results_raz.append(f"❌ {username}: {error}")
-                                            else:
-                                                results_raz.append(f"✅ {username} supprimé de Samba")
-                                        else:
-                                            results_raz.append(f"❌ {username}: Connexion impossible")
-                                except Exception as e:
-                                    results_raz.append(f"❌ {username}: {str(e)}")
-                                
-                                progress_bar.progress((idx + 1) / eleves_count)
-                            
-                            # Nettoyer le fichier Excel seulement pour les utilisateurs réellement supprimés
-                            successfully_deleted = [r.split(": ")[0].replace("✅ ", "") for r in results_raz if "✅" in r]
-                            
-                            if successfully_deleted:
-                                try:
-                                    df_users = get_existing_users()  # Recharger le fichier Excel
-                                    if not df_users.empty and 'Login' in df_users.columns:
-                                        # Supprimer seulement les utilisateurs réellement supprimés de Samba
-                                        df_remaining = df_users[~df_users['Login'].isin(successfully_deleted)]
-                                        df_remaining.to_excel(PASSWORD_EXCEL_FILE, index=False)
-                                        st.info(f"📝 {len(successfully_deleted)} utilisateurs supprimés du fichier Excel")
-                                    else:
-                                        st.warning("⚠️ Impossible de nettoyer le fichier Excel (structure invalide)")
-                                except Exception as e:
-                                    st.warning(f"⚠️ Erreur lors du nettoyage Excel : {e}")
-                            
-                            status_text.text("RAZ terminée!")
-                            
-                            st.subheader("Résultats de la suppression:")
-                            success_count = sum(1 for r in results_raz if "✅" in r)
-                            error_count = sum(1 for r in results_raz if "❌" in r)
-                            
-                            col_res1, col_res2 = st.columns(2)
-                            with col_res1:
-                                st.metric("✅ Supprimés avec succès", success_count)
-                            with col_res2:
-                                st.metric("❌ Erreurs", error_count)
-                            
-                            # Détail des résultats
-                            with st.expander("Détails des opérations", expanded=False):
-                                for result in results_raz:
-                                    if "✅" in result:
-                                        st.success(result)
-                                    else:
-                                        st.error(result)
-                            
-                            if success_count > 0:
-                                st.success(f"✅ RAZ terminée - {success_count}/{eleves_count} comptes supprimés avec succès")
-                            else:
-                                st.error("❌ Aucun compte n'a pu être supprimé")
+                            # Suppression par lots exécutée en arrière-plan, reprenable en cas d'interruption
+                            job_id = enqueue_raz_eleves(eleves_members)
+                            st.success(f"🧵 Suppression de {eleves_count} comptes lancée en arrière-plan (tâche `{job_id[:8]}`)")
+                            st.info("📋 Suivez la progression dans l'onglet « ⏳ Tâches » ; une RAZ interrompue peut y être reprise")
             else:
                 st.info("Aucun utilisateur dans le groupe 'Eleves' à supprimer")
 
@@ -2107,8 +2090,6 @@ def run():
         # Chargement automatique des élèves IMFR au démarrage
         if 'imfr_data' not in st.session_state:
             try:
-                import pymysql
-                conn = pymysql.connect(**config.MYSQL_CONFIG)
                 query = """
                 SELECT
                     nom as 'Nom',
@@ -2117,8 +2098,8 @@ def run():
                 FROM eleves_imfr
                 ORDER BY classe, nom, prenom
                 """
-                df_imfr = pd.read_sql(query, conn)
-                conn.close()
+                with db_connection() as conn:
+                    df_imfr = pd.read_sql(query, conn)
 
                 if not df_imfr.empty:
                     st.session_state.imfr_data = df_imfr
@@ -2129,8 +2110,6 @@ def run():
         # Chargement automatique des utilisateurs SAMBA au démarrage
         if 'samba_data' not in st.session_state:
             try:
-                import pymysql
-                conn = pymysql.connect(**config.MYSQL_CONFIG)
                 query = """
                 SELECT
                     Nom as 'Nom',
@@ -2141,8 +2120,8 @@ def run():
                 WHERE Login IS NOT NULL AND Login != ''
                 ORDER BY Classe, Nom, Prénom
                 """
-                df_samba = pd.read_sql(query, conn)
-                conn.close()
+                with db_connection() as conn:
+                    df_samba = pd.read_sql(query, conn)
 
                 if not df_samba.empty:
                     st.session_state.samba_data = df_samba
@@ -2159,8 +2138,6 @@ def run():
             st.markdown("**💾 Base de données MySQL**")
             if st.button("🔄 Recharger IMFR depuis MySQL"):
                 try:
-                    import pymysql
-                    conn = pymysql.connect(**config.MYSQL_CONFIG)
                     query = """
                     SELECT
                         nom as 'Nom',
@@ -2169,8 +2146,8 @@ def run():
                     FROM eleves_imfr
                     ORDER BY classe, nom, prenom
                     """
-                    df_imfr = pd.read_sql(query, conn)
-                    conn.close()
+                    with db_connection() as conn:
+                        df_imfr = pd.read_sql(query, conn)
 
                     if not df_imfr.empty:
                         st.session_state.imfr_data = df_imfr
@@ -2202,34 +2179,20 @@ def run():
                         driver.quit()
 
                         if eleves_data_raw:
-                            # Sauvegarder dans MySQL
-                            import pymysql
-                            conn = pymysql.connect(**config.MYSQL_CONFIG)
-                            cursor = conn.cursor()
-
-                            # Créer la table si nécessaire
-                            create_table_query = """
-                            CREATE TABLE IF NOT EXISTS eleves_imfr (
-                                id INT AUTO_INCREMENT PRIMARY KEY,
-                                nom VARCHAR(100) NOT NULL,
-                                prenom VARCHAR(100) NOT NULL,
-                                classe VARCHAR(50),
-                                date_import TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                INDEX idx_nom_prenom (nom, prenom),
-                                INDEX idx_classe (classe)
-                            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-                            """
-                            cursor.execute(create_table_query)
-                            cursor.execute("TRUNCATE TABLE eleves_imfr")
-
-                            # Insérer les données
-                            insert_query = "INSERT INTO eleves_imfr (nom, prenom, classe) VALUES (%s, %s, %s)"
-                            for eleve in eleves_data_raw:
-                                cursor.execute(insert_query, (eleve['nom'], eleve['prenom'], eleve['classe']))
-
-                            conn.commit()
-                            cursor.close()
-                            conn.close()
+                            with import_lock():
+                                # Comparaison avec les empreintes du dernier import
+                                plan = detect_changes(eleves_data_raw)
+
+                                if is_unchanged(plan):
+                                    st.info("ℹ️ Aucun changement depuis le dernier import IMFR : MySQL déjà à jour")
+                                else:
+                                    # Sauvegarder dans MySQL (table temporaire puis bascule atomique)
+                                    replace_eleves(eleves_data_raw)
+
+                                    # Journaliser les changements (création, classe, sortie...)
+                                    save_changes(plan)
+                                    if not plan['baseline']:
+                                        st.info(f"📝 {len(plan['changes'])} changement(s) depuis le dernier import IMFR")
 
                             # Recharger dans la session
                             df_imfr = pd.DataFrame({
@@ -2248,176 +2211,39 @@ def run():
 
         with col_refresh3:
             st.markdown("**🔐 Mise à jour SAMBA**")
-            if st.button("🔄 Mettre à jour depuis SAMBA", help="Met à jour la table utilisateurs depuis SAMBA via samba-tool user list"):
-                with st.spinner("Récupération depuis SAMBA via SSH..."):
+            if st.button("🔄 Mettre à jour depuis SAMBA", help="Met à jour la table utilisateurs depuis SAMBA via une requête LDAP unique (ldbsearch)"):
+                # Inventaire et mise à jour MySQL exécutés en arrière-plan
+                st.session_state.samba_inventory_job = enqueue_samba_inventory()
+
+            inventory_job_id = st.session_state.get('samba_inventory_job')
+            inventory_job = get_job_manager().get_job(inventory_job_id) if inventory_job_id else None
+            if inventory_job and inventory_job['status'] in (STATUS_QUEUED, STATUS_RUNNING):
+                st.info(f"{inventory_job['status_label']} - {inventory_job['message'] or 'Récupération depuis SAMBA...'}")
+                if st.button("🔄 Actualiser", key="refresh_inventory_job"):
+                    st.rerun()
+            elif inventory_job and inventory_job['status'] == STATUS_SUCCEEDED:
+                if st.session_state.get('samba_inventory_loaded') != inventory_job_id:
                     try:
-                        # Se connecter au serveur SAMBA via SSH
-                        with ssh_connection(config.SAMBA_SERVER, config.SAMBA_USER, config.SAMBA_PWD) as client:
-                            if client:
-                                # Exécuter samba-tool user list
-                                cmd = "sudo -S samba-tool user list"
-                                output, error = execute_ssh_command(client, cmd, config.SAMBA_PWD)
-
-                                if output:
-                                    # Parser les utilisateurs
-                                    users = []
-                                    ignored_users = config.get_ignored_users()
-
-                                    # Liste de mots-clés à ignorer dans la sortie
-                                    ignore_keywords = [
-                                        'sudo', 'password', 'mot de passe', 'warning',
-                                        'note:', 'ldb_wrap', 'service', 'flagged',
-                                        'making it unavailable', 'path in service'
-                                    ]
-
-                                    for line in output.split('\n'):
-                                        username = line.strip()
-
-                                        # Ignorer les lignes vides ou trop courtes
-                                        if not username or len(username) < 3:
-                                            continue
-
-                                        # Ignorer les lignes avec des mots-clés système
-                                        if any(keyword.lower() in username.lower() for keyword in ignore_keywords):
-                                            continue
-
-                                        # Ignorer les lignes qui contiennent ':' (prompts système)
-                                        if ':' in username and not '.' in username:
-                                            continue
-
-                                        # Ignorer les utilisateurs dans la liste d'exclusion
-                                        if username.lower() not in [u.lower() for u in ignored_users]:
-                                            users.append(username)
-
-                                    st.info(f"📋 {len(users)} utilisateurs récupérés depuis SAMBA")
-
-                                    # Pour chaque utilisateur, récupérer les détails
-                                    users_details = []
-                                    progress_bar = st.progress(0)
-
-                                    for idx, username in enumerate(users):
-                                        # Récupérer les détails de l'utilisateur
-                                        cmd_details = f"sudo -S samba-tool user show {username}"
-                                        details_output, details_error = execute_ssh_command(client, cmd_details, config.SAMBA_PWD)
-
-                                        if details_output:
-                                            # Parser les détails (nom, prénom, etc.)
-                                            user_info = {
-                                                'Login': username,
-                                                'Nom': '',
-                                                'Prénom': '',
-                                                'Classe': '',
-                                                'Groupe': ''
-                                            }
-
-                                            # Parser les attributs LDAP
-                                            for line in details_output.split('\n'):
-                                                if ':' in line:
-                                                    key, value = line.split(':', 1)
-                                                    key = key.strip()
-                                                    value = value.strip()
-
-                                                    if key == 'sn':  # Nom
-                                                        user_info['Nom'] = value
-                                                    elif key == 'givenName':  # Prénom
-                                                        user_info['Prénom'] = value
-                                                    elif key == 'description' or key == 'comment':
-                                                        # Extraire classe si présente
-                                                        if value and not any(kw in value.lower() for kw in ['warning', 'note', 'sudo']):
-                                                            user_info['Classe'] = value
-                                                    elif key == 'memberOf':
-                                                        # Extraire le groupe principal (premier CN=)
-                                                        if 'CN=' in value:
-                                                            group = value.split('CN=')[1].split(',')[0]
-                                                            if group and not any(kw in group.lower() for kw in ['users', 'domain']):
-                                                                user_info['Groupe'] = group
-
-                                            # Si sn et givenName ne sont pas trouvés, extraire depuis le login
-                                            # Format attendu: prenom.nom
-                                            if not user_info['Nom'] and not user_info['Prénom']:
-                                                if '.' in username:
-                                                    parts = username.split('.')
-                                                    if len(parts) >= 2:
-                                                        user_info['Prénom'] = parts[0].capitalize()
-                                                        user_info['Nom'] = parts[1].upper()
-
-                                            users_details.append(user_info)
-
-                                        progress_bar.progress((idx + 1) / len(users))
-
-                                    progress_bar.empty()
-
-                                    if users_details:
-                                        # Mettre à jour la table utilisateurs dans MySQL
-                                        import pymysql
-                                        conn = pymysql.connect(**config.MYSQL_CONFIG)
-                                        cursor = conn.cursor()
-
-                                        # Marquer tous les utilisateurs existants comme non-actifs
-                                        update_query = """
-                                        UPDATE utilisateurs
-                                        SET Dernière_modification = NOW()
-                                        WHERE Login IN (SELECT Login FROM (SELECT Login FROM utilisateurs) AS temp)
-                                        """
-
-                                        # Insérer ou mettre à jour les utilisateurs
-                                        upsert_query = """
-                                        INSERT INTO utilisateurs (Login, Nom, Prénom, Classe, Groupe, Mot_de_passe, Dernière_modification)
-                                        VALUES (%s, %s, %s, %s, %s, '****', NOW())
-                                        ON DUPLICATE KEY UPDATE
-                                            Nom = VALUES(Nom),
-                                            Prénom = VALUES(Prénom),
-                                            Classe = VALUES(Classe),
-                                            Groupe = VALUES(Groupe),
-                                            Dernière_modification = NOW()
-                                        """
-
-                                        count_updated = 0
-                                        for user in users_details:
-                                            cursor.execute(upsert_query, (
-                                                user['Login'],
-                                                user['Nom'],
-                                                user['Prénom'],
-                                                user['Classe'],
-                                                user['Groupe']
-                                            ))
-                                            count_updated += 1
-
-                                        conn.commit()
-                                        cursor.close()
-                                        conn.close()
-
-                                        # Recharger les données pour l'affichage
-                                        conn = pymysql.connect(**config.MYSQL_CONFIG)
-                                        query = """
-                                        SELECT
-                                            Login,
-                                            Nom,
-                                            Prénom,
-                                            Classe,
-                                            Groupe
-                                        FROM utilisateurs
-                                        ORDER BY Nom, Prénom
-                                        """
-                                        df_samba = pd.read_sql(query, conn)
-                                        conn.close()
-
-                                        st.session_state.samba_data = df_samba
-                                        st.success(f"✅ {count_updated} utilisateurs synchronisés dans la table 'utilisateurs'")
-
-                                    else:
-                                        st.warning("⚠️ Aucun détail utilisateur récupéré")
-
-                                else:
-                                    st.error(f"❌ Erreur lors de l'exécution de samba-tool: {error}")
-
-                            else:
-                                st.error("❌ Impossible de se connecter au serveur SAMBA")
-
+                        # Recharger les données pour l'affichage
+                        query = """
+                        SELECT
+                            Login,
+                            Nom,
+                            Prénom,
+                            Classe,
+                            Groupe
+                        FROM utilisateurs
+                        ORDER BY Nom, Prénom
+                        """
+                        with db_connection() as conn:
+                            df_samba = pd.read_sql(query, conn)
+                        st.session_state.samba_data = df_samba
+                        st.session_state.samba_inventory_loaded = inventory_job_id
                     except Exception as e:
-                        st.error(f"❌ Erreur récupération SAMBA: {e}")
-                        import traceback
-                        st.error(f"Détails: {traceback.format_exc()}")
+                        st.error(f"❌ Erreur lors du rechargement des utilisateurs: {e}")
+                st.success(f"✅ {inventory_job['message']}")
+            elif inventory_job:
+                st.error(f"❌ {inventory_job['error'] or inventory_job['status_label']}")
 
         st.markdown("---")
 
@@ -2431,6 +2257,17 @@ def run():
                 df_imfr = st.session_state.imfr_data
                 st.markdown("**📘 Élèves IMFR**")
                 st.metric("Total élèves IMFR", len(df_imfr))
+
+                # Journal des changements IMFR (alimenté à chaque import)
+                try:
+                    df_changes = get_recent_changes(24)
+                    if df_changes.empty:
+                        st.caption("🕒 Aucun changement depuis hier")
+                    else:
+                        with st.expander(f"🕒 {len(df_changes)} changement(s) depuis hier"):
+                            st.dataframe(df_changes, hide_index=True, use_container_width=True)
+                except Exception as e:
+                    logger.warning(f"Journal IMFR indisponible: {e}")
                 nb_classes = df_imfr['Classe'].nunique() if 'Classe' in df_imfr.columns else 0
                 st.metric("Nombre de classes", nb_classes)
 
@@ -2468,48 +2305,20 @@ def run():
                     st.metric("Élèves dans IMFR", len(df_imfr))
                     st.metric("Utilisateurs dans SAMBA", len(df_samba))
                 
-                # Trouver les élèves manquants dans SAMBA
-                missing_in_samba = []
-                for _, imfr_student in df_imfr.iterrows():
-                    imfr_nom = str(imfr_student['Nom']).strip().upper()
-                    imfr_prenom = str(imfr_student['Prénom']).strip().title()
-                    
-                    # Chercher dans SAMBA
-                    found = False
-                    for _, samba_student in df_samba.iterrows():
-                        samba_nom = str(samba_student.get('Nom', '')).strip().upper()
-                        samba_prenom = str(samba_student.get('Prénom', '')).strip().title()
-                        
-                        if imfr_nom == samba_nom and imfr_prenom == samba_prenom:
-                            found = True
-                            break
-                    
-                    if not found:
-                        missing_in_samba.append(imfr_student)
-                
-                # Trouver les élèves en plus dans SAMBA
-                extra_in_samba = []
-                for _, samba_student in df_samba.iterrows():
-                    samba_nom = str(samba_student.get('Nom', '')).strip().upper()
-                    samba_prenom = str(samba_student.get('Prénom', '')).strip().title()
-                    
-                    # Chercher dans IMFR
-                    found = False
-                    for _, imfr_student in df_imfr.iterrows():
-                        imfr_nom = str(imfr_student['Nom']).strip().upper()
-                        imfr_prenom = str(imfr_student['Prénom']).strip().title()
-                        
-                        if samba_nom == imfr_nom and samba_prenom == imfr_prenom:
-                            found = True
-                            break
-                    
-                    if not found:
-                        extra_in_samba.append(samba_student)
+                # Rapprochement IMFR / SAMBA par clés normalisées (Nom, Prénom)
+                reconciliation = reconcile_students(df_imfr, df_samba)
+                missing_in_samba = reconciliation['missing'].to_dict('records')
+                extra_in_samba = reconciliation['extra'].to_dict('records')
                 
                 with col_comp2:
                     st.metric("Manquants dans SAMBA", len(missing_in_samba))
                     st.metric("En plus dans SAMBA", len(extra_in_samba))
                 
+                if not reconciliation['fuzzy'].empty:
+                    with st.expander(f"🔎 Correspondances possibles ({len(reconciliation['fuzzy'])})", expanded=False):
+                        st.markdown("*Ces élèves semblent déjà avoir un compte SAMBA (accents, ponctuation ou nom/prénom inversés)*")
+                        st.dataframe(reconciliation['fuzzy'], hide_index=True, use_container_width=True)
+                
                 st.markdown("---")
                 
                 # Section pour créer les élèves manquants
@@ -2594,69 +2403,59 @@ def run():
                             progress_bar = st.progress(0)
                             status_text = st.empty()
 
-                            for idx, student in enumerate(filtered_missing):
+                            # Préparation des comptes (identifiants, mots de passe, classes)
+                            # Logins réservés ensemble pour tout le lot
+                            usernames = allocate_usernames(
+                                [(str(student['Prénom']).strip(), str(student['Nom']).strip()) for student in filtered_missing]
+                            )
+                            prepared_users = []
+                            for student, username in zip(filtered_missing, usernames):
                                 nom = str(student['Nom']).strip()
                                 prenom = str(student['Prénom']).strip()
                                 classe = str(student['Classe']).strip()
                                 
-                                status_text.text(f"Création de {prenom} {nom}... ({idx+1}/{len(filtered_missing)})")
-                                
-                                # Générer username et password
-                                username = generate_username(prenom, nom)
+                                # Générer le mot de passe
                                 if generate_passwords:
                                     password = generate_password()
                                 else:
                                     password = f"{nom.lower()}{prenom.lower()[0]}{random.randint(10,99)}"
                                 
-                                # Créer l'utilisateur SAMBA (utiliser les fonctions existantes)
-                                try:
-                                    # Normaliser la classe
-                                    classe_normalized = normalize_class_name(classe) if classe else ""
-                                    
-                                    # Commandes de création SAMBA
-                                    user_commands = []
-                                    group_commands = []
-                                    
-                                    # Commande de création d'utilisateur
-                                    user_commands.append(
-                                        f"sudo -S samba-tool user create {username} '{password}' "
-                                        f"--given-name='{prenom}' --surname='{nom}' "
-                                        f"--description='{classe_normalized}'"
-                                    )
-                                    
-                                    # Commande d'ajout au groupe
-                                    group_commands.append(f"sudo -S samba-tool group addmembers {groupe_cible} {username}")
-                                    
-                                    # Exécuter les commandes
-                                    with ssh_connection(config.SAMBA_SERVER, config.SAMBA_USER, config.SAMBA_PWD) as client:
-                                        if client:
-                                            # Créer l'utilisateur
-                                            for cmd in user_commands:
-                                                output, error = execute_ssh_command(client, cmd, config.SAMBA_PWD)
-                                                if error:
-                                                    raise Exception(f"Erreur création utilisateur: {error}")
-                                            
-                                            # Ajouter au groupe
-                                            for cmd in group_commands:
-                                                output, error = execute_ssh_command(client, cmd, config.SAMBA_PWD)
-                                                if error and "is already a member" not in error.lower():
-                                                    st.warning(f"Avertissement groupe pour {username}: {error}")
-                                            
-                                            result = f"✅ {prenom} {nom} ({classe_normalized}) : Utilisateur créé avec succès"
-                                            creation_results.append(result)
-
-                                            # Sauvegarder dans la base de données si demandé
-                                            if send_to_db:
-                                                save_user_to_db(username, prenom, nom, password, classe_normalized, groupe_cible)
-                                        else:
-                                            raise Exception("Impossible de se connecter au serveur SAMBA")
-                                    
-                                except Exception as e:
-                                    result = f"❌ {prenom} {nom} : {str(e)}"
+                                # Normaliser la classe
+                                classe_normalized = normalize_class_name(classe) if classe else ""
+                                prepared_users.append({
+                                    'username': username, 'password': password, 'prenom': prenom, 'nom': nom,
+                                    'classe': classe_normalized, 'groupe': groupe_cible
+                                })
+                            
+                            def update_creation_progress(done, total):
+                                status_text.text(f"Création des comptes SAMBA... ({done}/{total} commandes)")
+                                progress_bar.progress(done / total)
+                            
+                            # Création de tous les comptes en un seul lot de commandes samba-tool
+                            try:
+                                outcomes = create_samba_users_batch(prepared_users, progress_callback=update_creation_progress)
+                            except Exception as e:
+                                outcomes = [(False, str(e), False)] * len(prepared_users)
+                            
+                            for user, (success, message, created) in zip(prepared_users, outcomes):
+                                prenom, nom, classe_normalized = user['prenom'], user['nom'], user['classe']
+                                if success and created:
+                                    result = f"✅ {prenom} {nom} ({classe_normalized}) : Utilisateur créé avec succès"
+                                    creation_results.append(result)
+
+                                    # Sauvegarder dans la base de données si demandé
+                                    if send_to_db:
+                                        save_user_to_db(user['username'], prenom, nom, user['password'], classe_normalized, groupe_cible)
+                                else:
+                                    result = f"❌ {prenom} {nom} : {message}"
                                     creation_results.append(result)
-                                
-                                progress_bar.progress((idx + 1) / len(filtered_missing))
                             
+                            # Logins des comptes non créés : de nouveau disponibles
+                            get_username_allocator("mysql").release(
+                                *(user['username'] for user, (success, _, _) in zip(prepared_users, outcomes) if not success)
+                            )
+                            
+                            progress_bar.progress(1.0)
                             status_text.text("Création terminée!")
                             
                             # Afficher les résultats
@@ -2777,6 +2576,33 @@ def run():
         # Section Groupes Entra ID réels
         st.subheader("👥 Groupes Entra ID (Azure AD)")
         with st.expander("Consulter les groupes dans Entra ID", expanded=False):
+            # Miroir local : état et synchronisation manuelle
+            col_mirror1, col_mirror2 = st.columns(2)
+            with col_mirror1:
+                sync_mirror = st.button("🔄 Synchroniser le miroir (delta)", key="sync_entra_mirror")
+            with col_mirror2:
+                full_mirror = st.button("♻️ Recharger entièrement le miroir", key="full_sync_entra_mirror")
+            if sync_mirror or full_mirror:
+                try:
+                    with st.spinner("📡 Synchronisation du miroir Entra ID..."):
+                        for resource in mirrored_resources():
+                            outcome = sync_entra_mirror(resource, full=full_mirror)
+                            st.success(f"✅ {resource}: {outcome['changes']} changement(s) "
+                                       f"({outcome['removed']} suppression(s)){' - chargement complet' if outcome['full'] else ''}")
+                except requests.RequestException as e:
+                    st.error(f"❌ Erreur de synchronisation du miroir : {e}")
+            elif 'users' in mirrored_resources():
+                try:
+                    ensure_entra_mirror_fresh("users")
+                except requests.RequestException as e:
+                    st.warning(f"⚠️ Miroir des utilisateurs indisponible : {e}")
+
+            for resource, mirror_status in get_mirror_status().items():
+                if resource in mirrored_resources() and mirror_status['last_sync']:
+                    last_sync = time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(mirror_status['last_sync']))
+                    st.caption(f"🗄️ Miroir {resource} : {mirror_status['count']} objet(s) - dernière synchronisation "
+                               f"{last_sync} ({mirror_status['last_changes']} changement(s))")
+
             with st.spinner("📡 Récupération des groupes depuis Entra ID..."):
                 entra_groups = get_entra_groups()
             
@@ -2836,31 +2662,64 @@ def run():
                 else:
                     st.warning("Aucun groupe ne correspond aux filtres sélectionnés")
                     
-                # Recherche de groupes spécifiques configurés
-                st.markdown("---")
-                st.markdown("**🔍 Vérification des groupes configurés :**")
-                
-                configured_groups = {
-                    config.LICENSE_GROUP_STUDENTS: config.LICENSE_GROUP_STUDENTS_ID,
-                    config.LICENSE_GROUP_TEACHERS: None,
-                    config.LICENSE_GROUP_OFFICE: None
-                }
-                
-                for group_name, expected_id in configured_groups.items():
-                    found_groups = [g for g in entra_groups.values() if g['displayName'] == group_name]
-                    
-                    if found_groups:
-                        group = found_groups[0]
-                        status = "✅ Trouvé"
-                        id_match = group['id'] == expected_id if expected_id else "Non défini"
-                        st.success(f"**{group_name}**: {status} - ID: `{group['id']}` - Type: {group['groupType']}")
-                    else:
-                        st.warning(f"**{group_name}**: ⚠️ Non trouvé dans Entra ID")
             else:
                 st.warning("⚠️ Impossible de récupérer les groupes depuis Entra ID")
                 st.info("Vérifiez les permissions Microsoft Graph : Group.Read.All ou Directory.Read.All")
         
         st.markdown("---")
+
+        # Vérification des groupes configurés : deux requêtes /$batch au lieu de la liste complète des groupes
+        st.subheader("🔍 Vérification des groupes configurés")
+        with st.expander("Vérifier les groupes de licences et des comptes dans Entra ID", expanded=False):
+            configured_groups = {
+                config.LICENSE_GROUP_STUDENTS: config.LICENSE_GROUP_STUDENTS_ID,
+                config.LICENSE_GROUP_TEACHERS: None,
+                config.LICENSE_GROUP_OFFICE: None
+            }
+
+            if st.button("🔍 Vérifier les groupes configurés", key="check_configured_groups"):
+                try:
+                    with st.spinner("📡 Vérification des groupes via Microsoft Graph ($batch)..."):
+                        report = check_configured_groups(configured_groups)
+                        available_licenses = get_available_licenses()
+
+                    for entry in report:
+                        if not entry['found']:
+                            st.warning(f"**{entry['name']}**: ⚠️ Non trouvé dans Entra ID")
+                            continue
+                        members = entry['members'] if entry['members'] is not None else "?"
+                        licenses = [available_licenses.get(sku_id, {}).get('displayName', sku_id) for sku_id in entry['sku_ids']]
+                        st.success(f"**{entry['name']}**: ✅ Trouvé - ID: `{entry['id']}` - Type: {entry['groupType']} - "
+                                   f"{members} membre(s)")
+                        if entry['id_match'] is False:
+                            st.warning(f"⚠️ L'identifiant configuré (`{entry['expected_id']}`) ne correspond pas")
+                        if entry['displayName'] and entry['displayName'] != entry['name']:
+                            st.info(f"ℹ️ Groupe renommé dans Entra ID : « {entry['displayName']} »")
+                        st.caption(f"Licences attribuées : {', '.join(licenses) if licenses else 'Aucune'}")
+                except requests.RequestException as e:
+                    st.error(f"❌ Erreur lors de la vérification des groupes : {e}")
+
+            st.markdown("**👤 Existence de comptes dans Entra ID :**")
+            upns_text = st.text_area("Identifiants (UPN), un par ligne :", key="check_entra_upns",
+                                     placeholder="prenom.nom@domaine.fr")
+            if st.button("🔍 Vérifier les comptes", key="check_entra_users"):
+                upns = [line for line in upns_text.splitlines() if line.strip()]
+                if not upns:
+                    st.warning("⚠️ Saisissez au moins un identifiant")
+                else:
+                    try:
+                        with st.spinner(f"📡 Vérification de {len(upns)} compte(s) via Microsoft Graph ($batch)..."):
+                            existence = users_exist(upns)
+                        df_existence = pd.DataFrame([{
+                            "UPN": upn,
+                            "Statut": "✅ Existe" if exists else ("❌ Introuvable" if exists is False else "⚠️ Erreur")
+                        } for upn, exists in existence.items()])
+                        st.dataframe(df_existence, hide_index=True, use_container_width=True)
+                        st.info(f"📊 {sum(1 for e in existence.values() if e)}/{len(existence)} compte(s) trouvé(s)")
+                    except requests.RequestException as e:
+                        st.error(f"❌ Erreur lors de la vérification des comptes : {e}")
+
+        st.markdown("---")
         
         col1, col2 = st.columns(2)
         
@@ -2875,4 +2734,131 @@ def run():
                 test_sync_command()
         
         st.markdown("---")
-        st.info("💡 **Astuce:** Utilisez l'onglet 'Mots de Passe' dans le menu principal pour une vue d'ensemble de tous les comptes utilisateurs.")
\ No newline at end of file
+        st.info("💡 **Astuce:** Utilisez l'onglet 'Mots de Passe' dans le menu principal pour une vue d'ensemble de tous les comptes utilisateurs.")
+    # ========================= ONGLET 9: TÂCHES =========================
+    with tab9:
+        st.header("File de tâches")
+        st.caption("Les traitements longs (import CSV, RAZ, inventaire SAMBA, synchronisation Azure AD) "
+                   "s'exécutent en arrière-plan et continuent même si la page est rechargée.")
+
+        job_manager = get_job_manager()
+
+        def sync_job_tail(job, spool, lines=200):
+            """Dernières lignes d'une synchronisation en cours : messages de la tâche puis sortie du script
+
+            Les positions de lecture sont gardées dans session_state : chaque
+            rafraîchissement ne lit que les lignes ajoutées depuis le précédent.
+            """
+            tail = st.session_state.setdefault(f"tail_log_{job['id']}",
+                                               {'log_id': 0, 'offset': 0, 'lines': deque(maxlen=lines)})
+            for log_id, _, _, message in job_manager.get_logs(job['id'], after_id=tail['log_id'], limit=lines):
+                tail['lines'].append(message)
+                tail['log_id'] = log_id
+            if spool:
+                new_lines, tail['offset'] = tail_sync_log(spool, tail['offset'], lines=lines)
+                tail['lines'].extend(new_lines)
+            return list(tail['lines'])
+
+        def sync_job_log(job, spool):
+            """Logs d'une synchronisation terminée, lus une seule fois pour la tâche affichée"""
+            cached = st.session_state.get("job_log_cache")
+            if cached is None or cached[0] != job['id']:
+                log_lines = [message for _, _, _, message in job_manager.get_logs(job['id'], limit=5000)]
+                if spool and os.path.exists(spool):
+                    log_lines += [record['line'] for record in read_sync_log(spool, limit=5000)[0]]
+                cached = st.session_state["job_log_cache"] = (job['id'], log_lines)
+            return cached[1]
+
+        def render_job_details(job):
+            """Affiche la progression, les actions et les logs d'une tâche"""
+            if job['progress_total']:
+                st.progress(min(job['progress_done'] / job['progress_total'], 1.0))
+            if job['message']:
+                st.write(f"**{job['status_label']}** - {job['message']}")
+            else:
+                st.write(f"**{job['status_label']}**")
+            if job['error']:
+                st.error(f"❌ {job['error']}")
+
+            item_counts = job_manager.count_items(job['id'])
+            if item_counts:
+                st.caption(" • ".join(f"{status}: {count}" for status, count in sorted(item_counts.items())))
+
+            col_job1, col_job2 = st.columns(2)
+            with col_job1:
+                if job['status'] in (STATUS_QUEUED, STATUS_RUNNING):
+                    if st.button("⛔ Annuler la tâche", key=f"cancel_job_{job['id']}"):
+                        job_manager.cancel(job['id'])
+                        st.warning("⛔ Annulation demandée (effective à la fin du lot en cours)")
+            with col_job2:
+                if job['resumable']:
+                    if st.button("▶️ Reprendre la tâche", key=f"resume_job_{job['id']}",
+                                 help="Relance la tâche en ignorant les éléments déjà traités"):
+                        if job_manager.resume(job['id']):
+                            st.success("▶️ Tâche remise en file")
+
+            if job['type'] == JOB_AZURE_SYNC:
+                spool = (job['params'] or {}).get('log_file')
+                if job['status'] in (STATUS_QUEUED, STATUS_RUNNING):
+                    st.subheader("📋 Logs de synchronisation")
+                    st.code('\n'.join(sync_job_tail(job, spool)), language="text")
+                    return
+                st.session_state.pop(f"tail_log_{job['id']}", None)
+
+                summary = (job['result'] or {}).get('summary') if job['status'] == STATUS_SUCCEEDED else None
+                if summary is None and job['status'] == STATUS_SUCCEEDED:
+                    # Résumé non enregistré : relu une fois dans la sortie du script
+                    log_lines = sync_job_log(job, spool)
+                    summary_start = next((i for i, line in enumerate(log_lines) if SYNC_SUMMARY_MARKER in line), -1)
+                    if summary_start >= 0:
+                        summary = summary_from_lines(log_lines[summary_start:])
+                if summary is not None:
+                    display_streamlit_summary(summary)
+                # Un expander exécute son contenu même replié : les journaux ne sont lus qu'à la demande
+                if st.checkbox("🔍 Voir les logs de la tâche", value=summary is None, key=f"show_job_log_{job['id']}"):
+                    log_lines = sync_job_log(job, spool)
+                    if summary is not None:
+                        summary_start = next((i for i, line in enumerate(log_lines) if SYNC_SUMMARY_MARKER in line), -1)
+                        st.code('\n'.join(log_lines[:summary_start] if summary_start >= 0 else log_lines), language="json")
+                    else:
+                        st.code('\n'.join(log_lines[-200:]), language="text")
+                log_file = (job['result'] or {}).get('log_file')
+                if log_file and os.path.exists(log_file):
+                    if st.checkbox("📁 Journal complet (filtrable)", key=f"show_job_spool_{job['id']}"):
+                        render_sync_log_viewer(log_file, key=f"job_log_{job['id']}")
+            else:
+                logs = job_manager.get_logs(job['id'])
+                with st.expander(f"📋 Logs ({len(logs)} dernières lignes)", expanded=job['status'] != STATUS_SUCCEEDED):
+                    st.code('\n'.join(f"{created_at} [{level}] {message}" for _, created_at, level, message in logs),
+                            language="text")
+
+        def render_jobs_panel():
+            jobs = job_manager.list_jobs(limit=getattr(config, 'JOBS_HISTORY_LIMIT', 50))
+            if not jobs:
+                st.info("Aucune tâche pour le moment")
+                return
+
+            df_jobs = pd.DataFrame([{
+                "Créée": job['created_at'],
+                "Tâche": job['label'] or get_handler_label(job['type']),
+                "Statut": job['status_label'],
+                "Progression": f"{job['progress_done']}/{job['progress_total']}" if job['progress_total'] else "",
+                "Terminée": job['finished_at'] or "",
+                "Message": job['error'] or job['message'] or "",
+            } for job in jobs])
+            st.dataframe(df_jobs, hide_index=True, use_container_width=True)
+
+            job_labels = {job['id']: f"{job['created_at']} - {job['label']} ({job['status_label']})" for job in jobs}
+            selected_job_id = st.selectbox("Détail de la tâche", list(job_labels), format_func=job_labels.get,
+                                           key="selected_job")
+            job = job_manager.get_job(selected_job_id)
+            if job:
+                render_job_details(job)
+
+        auto_refresh = st.checkbox("🔁 Actualisation automatique (toutes les 2 secondes)", value=True, key="jobs_auto_refresh")
+        if auto_refresh and hasattr(st, "fragment"):
+            # Seul ce panneau est réexécuté, pas le reste de la page
+            st.fragment(run_every=2)(render_jobs_panel)()
+        else:
+            st.button("🔄 Actualiser", key="refresh_jobs")
+            render_jobs_panel()
@@ -0,0 +1,136 @@
+"""
+Benchmark des écritures en masse (modules.db_pool.bulk_upsert) sur MySQL
+
+    python bench/bench_bulk_upsert.py                  # serveur de config.MYSQL_CONFIG
+    python bench/bench_bulk_upsert.py --host 127.0.0.1 --user root --password secret --database test
+
+Serveur jetable pour la mesure :
+
+    docker run --rm -d -p 3306:3306 -e MARIADB_ROOT_PASSWORD=secret -e MARIADB_DATABASE=test mariadb:11
+
+Nécessite un vrai serveur MySQL/MariaDB : ON DUPLICATE KEY UPDATE et les
+lignes affectées n'ont pas d'équivalent local. Une table de travail
+(`--table`, structure de la table utilisateurs) est créée puis supprimée.
+
+La table est d'abord remplie avec `--rows` comptes, puis on écrit `--rows`
+lignes dont `--new` comptes nouveaux, `--changed` comptes modifiés (classe)
+et le reste identique, comme un rafraîchissement de l'inventaire SAMBA :
+une fois ligne par ligne (un INSERT ... ON DUPLICATE KEY UPDATE par compte),
+une fois par bulk_upsert. La table est remise dans son état initial avant
+chaque mesure.
+"""
+import argparse
+import time
+
+import common
+
+import pymysql
+
+from modules.db_pool import _quote, bulk_upsert
+
+COLUMNS = ["Login", "Nom", "Prénom", "Classe", "Groupe", "Mot_de_passe"]
+UPDATE_COLUMNS = COLUMNS[1:]
+TOUCH_COLUMN = "Dernière_modification"
+
+
+def create_table(cursor, table):
+    cursor.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+    cursor.execute(f"""
+    CREATE TABLE {_quote(table)} (
+        Login VARCHAR(100) NOT NULL PRIMARY KEY,
+        Nom VARCHAR(100),
+        `Prénom` VARCHAR(100),
+        Classe VARCHAR(50),
+        Groupe VARCHAR(50),
+        Mot_de_passe VARCHAR(100),
+        `{TOUCH_COLUMN}` DATETIME
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+
+def make_rows(count, new, changed):
+    """(lignes initiales, lignes à écrire) : `new` comptes nouveaux, `changed` comptes modifiés"""
+    names = common.fake_names(count + new)
+    accounts = [(f"eleve.{i}", nom, prenom, f"Classe {i % 40}", "Eleves", "Motdepasse1!")
+                for i, (nom, prenom) in enumerate(names)]
+    initial = accounts[:count]
+    rows = [row[:3] + (f"Classe {(i + 1) % 40}",) + row[4:] if i < changed else row
+            for i, row in enumerate(initial[new:])] + accounts[count:]
+    return initial, rows
+
+
+def reset(conn, table, initial):
+    cursor = conn.cursor()
+    cursor.execute(f"TRUNCATE TABLE {_quote(table)}")
+    bulk_upsert(conn, table, COLUMNS, initial, constants={TOUCH_COLUMN: "NOW()"})
+    conn.commit()
+    cursor.close()
+
+
+def row_by_row(conn, table, rows):
+    """Ancienne écriture : un INSERT ... ON DUPLICATE KEY UPDATE par compte"""
+    same = " AND ".join(f"{_quote(c)} <=> VALUES({_quote(c)})" for c in UPDATE_COLUMNS)
+    sql = (f"INSERT INTO {_quote(table)} ({', '.join(_quote(c) for c in COLUMNS + [TOUCH_COLUMN])}) "
+           f"VALUES ({', '.join(['%s'] * len(COLUMNS))}, NOW()) ON DUPLICATE KEY UPDATE "
+           f"{_quote(TOUCH_COLUMN)} = IF({same}, {_quote(TOUCH_COLUMN)}, NOW()), "
+           + ", ".join(f"{_quote(c)} = VALUES({_quote(c)})" for c in UPDATE_COLUMNS))
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    cursor = conn.cursor()
+    for row in rows:
+        affected = cursor.execute(sql, row)
+        counts[{1: "inserted", 2: "updated"}.get(affected, "unchanged")] += 1
+    conn.commit()
+    cursor.close()
+    return counts
+
+
+def bulk(conn, table, rows, chunk_size):
+    counts = bulk_upsert(conn, table, COLUMNS, rows, key_columns=["Login"], update_columns=UPDATE_COLUMNS,
+                         constants={TOUCH_COLUMN: "NOW()"}, touch_column=TOUCH_COLUMN, chunk_size=chunk_size)
+    conn.commit()
+    return counts
+
+
+def measure(conn, table, initial, function, *args):
+    reset(conn, table, initial)
+    start = time.perf_counter()
+    counts = function(conn, table, *args)
+    return time.perf_counter() - start, counts
+
+
+def main():
+    mysql = dict(common.config.MYSQL_CONFIG)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--new", type=int, default=500)
+    parser.add_argument("--changed", type=int, default=2500)
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--table", default="bench_bulk_upsert")
+    for option in ("host", "port", "user", "password", "database"):
+        parser.add_argument(f"--{option}", type=int if option == "port" else str, default=mysql.get(option))
+    args = parser.parse_args()
+    mysql.update({option: getattr(args, option) for option in ("host", "port", "user", "password", "database")})
+
+    initial, rows = make_rows(args.rows, args.new, args.changed)
+    conn = pymysql.connect(**mysql)
+    try:
+        cursor = conn.cursor()
+        create_table(cursor, args.table)
+        results = [("ligne par ligne", measure(conn, args.table, initial, row_by_row, rows))]
+        for chunk_size in args.chunk_size:
+            results.append((f"bulk_upsert ({chunk_size} lignes)",
+                            measure(conn, args.table, initial, bulk, rows, chunk_size)))
+        cursor.execute(f"DROP TABLE {_quote(args.table)}")
+    finally:
+        conn.close()
+
+    reference = results[0][1][0]
+    common.print_table(
+        ["", "durée", "lignes/s", "gain", "insérées", "modifiées", "inchangées"],
+        [[label, f"{elapsed:.2f} s", f"{len(rows) / elapsed:.0f}", f"x{reference / elapsed:.1f}",
+          counts["inserted"], counts["updated"], counts["unchanged"]]
+         for label, (elapsed, counts) in results])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark d'un cycle de run_sync.py sans aucun changement dans l'annuaire
+
+    python bench/bench_noop_cycle.py                   # 20 000 objets
+    python bench/bench_noop_cycle.py --objects 50000
+
+Après un premier cycle qui remplit la base d'état, compare deux façons de
+détecter les changements : décodage JSON du dernier envoi et comparaison des
+dictionnaires (ce que fait SyncState.changed), et empreinte sha256 de l'objet
+courant comparée à une empreinte enregistrée (content_hash). Mesure ensuite un
+cycle complet où rien n'a changé et vérifie qu'aucun objet n'est envoyé.
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import common
+import sync_harness
+
+
+def directory(users, groups):
+    """Contenu de l'annuaire simulé, tel que run_sync.py le compare à la base d'état"""
+    smb = sync_harness.FakeSambaInfo()
+    smb.generate_all_dict()
+    return {'user': smb.dict_all_users_samba, 'group': smb.dict_all_group_samba}
+
+
+def dict_compare(state, samba):
+    """json.loads du dernier envoi puis comparaison des dictionnaires"""
+    changed = 0
+    for object_type, objects in samba.items():
+        for entry, data in objects.items():
+            row = state.get(entry, object_type)
+            changed += row is None or json.loads(row['last_data_send']) != data
+    return changed
+
+
+def hash_compare(content_hash, hashes, samba):
+    """Empreinte de l'objet courant comparée à l'empreinte du dernier envoi"""
+    return sum(hashes[entry] != content_hash(data)
+               for objects in samba.values() for entry, data in objects.items())
+
+
+def timed_cycle(run_sync):
+    start = time.perf_counter()
+    sync_harness.cycle(run_sync)
+    elapsed = time.perf_counter() - start
+    azure = sync_harness.fake_azure()
+    assert azure.sent == 0 and azure.hashes_sent == 0, "un cycle sans changement ne doit rien envoyer"
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--objects", type=int, default=20000)
+    args = parser.parse_args()
+
+    groups = args.objects // 40
+    users = args.objects - groups
+    run_sync = sync_harness.load_run_sync(tempfile.mkdtemp(prefix="bench_noop_cycle_"), users, groups)
+
+    start = time.perf_counter()
+    sync_harness.cycle(run_sync)
+    print(f"Base d'état : {run_sync.AzureObject.select().count()} objets "
+          f"(premier cycle, tout envoyé : {time.perf_counter() - start:.1f} s)\n")
+
+    samba = directory(users, groups)
+    state = run_sync.SyncState()
+    loads, changed_loads = common.timed(dict_compare, state, samba)
+    hashes = {entry: run_sync.content_hash(data) for objects in samba.values() for entry, data in objects.items()}
+    hashed, changed_hash = common.timed(hash_compare, run_sync.content_hash, hashes, samba)
+    assert changed_loads == changed_hash == 0
+    assert not any(state.changed(entry, object_type, data)
+                   for object_type, objects in samba.items() for entry, data in objects.items())
+    common.print_table(["détection des changements", f"{args.objects} objets"], [
+        ["json.loads + comparaison", f"{loads:.2f} s"],
+        ["empreinte sha256", f"{hashed:.2f} s"],
+    ])
+
+    elapsed = timed_cycle(run_sync)
+    print(f"\nCycle run_sync sans changement ({args.objects} objets) : {elapsed:.2f} s, 0 objet envoyé")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark du rapprochement IMFR / SAMBA (modules.reconciliation)
+
+    python bench/bench_reconciliation.py                 # 1k à 50k x 50k
+    python bench/bench_reconciliation.py --baseline 500  # + ancienne double boucle iterrows
+
+Pour chaque taille N, la source compte N élèves et SAMBA N comptes : 90 %
+communs, le reste en élèves manquants / comptes en trop, dont une partie
+ne diffère que par les accents ou l'ordre nom/prénom (candidats approchés).
+"""
+import argparse
+
+import common
+
+import pandas as pd
+
+from modules.reconciliation import reconcile_students
+
+
+def make_frames(size, seed=0):
+    names = common.fake_names(size * 2, seed)
+    shared = int(size * 0.9)
+    source = names[:size]
+    samba = names[:shared] + names[size:size + (size - shared)]
+    # Quelques comptes en trop qui sont des élèves manquants écrits autrement
+    for i, (nom, prenom) in enumerate(source[shared:shared + (size - shared) // 4]):
+        samba[shared + i] = (prenom, nom) if i % 2 else (nom.replace("é", "e").upper(), prenom)
+    df_source = pd.DataFrame({'Nom': [n for n, _ in source], 'Prénom': [p for _, p in source],
+                              'Classe': [f"C{i % 40}" for i in range(len(source))]})
+    df_samba = pd.DataFrame({'Nom': [n for n, _ in samba], 'Prénom': [p for _, p in samba],
+                             'Login': [f"user{i}" for i in range(len(samba))]})
+    return df_source, df_samba
+
+
+def nested_loops(df_source, df_samba):
+    """Ancienne comparaison : double boucle iterrows, O(N x M)"""
+    missing = []
+    for _, eleve in df_source.iterrows():
+        found = False
+        for _, user in df_samba.iterrows():
+            if (str(eleve['Nom']).strip().upper() == str(user['Nom']).strip().upper()
+                    and str(eleve['Prénom']).strip().title() == str(user['Prénom']).strip().title()):
+                found = True
+                break
+        if not found:
+            missing.append(eleve)
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000, 50000])
+    parser.add_argument("--baseline", type=int, default=0,
+                        help="taille de l'ancienne double boucle à mesurer (0 = ignorée)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        df_source, df_samba = make_frames(size)
+        seconds, result = common.timed(reconcile_students, df_source, df_samba, repeat=args.repeat)
+        rows.append([f"{size} x {size}", f"{seconds * 1000:.0f} ms", len(result['missing']),
+                     len(result['extra']), len(result['matched']), len(result['fuzzy'])])
+    common.print_table(["taille", "reconcile_students", "manquants", "en trop", "communs", "approchés"], rows)
+
+    if args.baseline:
+        df_source, df_samba = make_frames(args.baseline)
+        old, missing = common.timed(nested_loops, df_source, df_samba, repeat=1)
+        new, result = common.timed(reconcile_students, df_source, df_samba, fuzzy=False, repeat=args.repeat)
+        assert len(missing) == len(result['missing'])
+        print(f"\n{args.baseline} x {args.baseline} : double boucle {old * 1000:.0f} ms, "
+              f"rapprochement {new * 1000:.1f} ms (x{old / new:.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark des créations de comptes par lots (modules.samba_batch)
+
+    python bench/bench_samba_batch.py                          # 300 élèves, concurrence 1 à 8
+    python bench/bench_samba_batch.py --users 600 --latency 0.2
+
+Les lots passent par le vrai chemin SSH (pool, dépôt du script, `sudo -S
+bash`) vers le serveur SSH local de tests/ssh_stub_server.py, qui exécute
+les scripts avec de faux `sudo` et `samba-tool`. Le faux samba-tool attend
+`--latency` secondes par appel (samba-tool réel : 0,3 à 1 s) et refuse un
+compte déjà créé. Chaque élève donne une création et un ajout au groupe
+Eleves, comme un import CSV.
+"""
+import argparse
+import logging
+import os
+import stat
+import tempfile
+import time
+from contextlib import contextmanager
+
+import common
+from ssh_stub_server import StubSSHServer
+
+from modules import samba_batch
+from modules.ssh_pool import SSHConnectionPool
+
+FAKE_SUDO = """#!/bin/bash
+while [ $# -gt 0 ]; do case "$1" in -S) shift;; -p) shift 2;; *) break;; esac; done
+read -r password
+[ "$password" = "$FAKE_SUDO_PASSWORD" ] || { echo "sudo: mot de passe incorrect" >&2; exit 1; }
+exec "$@"
+"""
+
+FAKE_SAMBA_TOOL = """#!/bin/bash
+sleep "$FAKE_SAMBA_LATENCY"
+if [ "$1 $2" = "user create" ]; then
+    if ! mkdir "$FAKE_SAMBA_DIR/$3" 2>/dev/null; then
+        echo "ERROR(ldb): Failed to add user '$3': entry already exists" >&2
+        exit 255
+    fi
+    echo "User '$3' added successfully"
+elif [ "$1 $2" = "group addmembers" ]; then
+    echo "Added members to group $3"
+fi
+"""
+
+
+def write_script(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        f.write(content)
+    os.chmod(path, stat.S_IRWXU)
+
+
+def make_operations(count):
+    operations = []
+    for i in range(count):
+        create_index = len(operations)
+        operations.append(samba_batch.op_create_user(f"eleve.bench{i}", "Motdepasse1!", "Eleve", f"Bench{i}",
+                                                     description="BENCH"))
+        operations.append(samba_batch.op_add_members("Eleves", f"eleve.bench{i}", requires=create_index))
+    return operations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 3, 4, 8])
+    parser.add_argument("--batch-size", type=int, default=samba_batch.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--latency", type=float, default=0.05, help="durée (s) d'un appel au faux samba-tool")
+    args = parser.parse_args()
+    logging.getLogger("paramiko").setLevel(logging.WARNING)
+
+    workdir = tempfile.mkdtemp(prefix="bench_samba_")
+    bindir = os.path.join(workdir, "bin")
+    os.mkdir(bindir)
+    write_script(bindir, "sudo", FAKE_SUDO)
+    write_script(bindir, "samba-tool", FAKE_SAMBA_TOOL)
+    env = dict(os.environ, PATH=f"{bindir}:{os.environ['PATH']}", FAKE_SUDO_PASSWORD="secret",
+               FAKE_SAMBA_LATENCY=str(args.latency))
+
+    operations = make_operations(args.users)
+    rows = []
+    with StubSSHServer(password="secret", shell_env=env) as server:
+        for concurrency in args.concurrency:
+            # Annuaire vide et pool neuf pour chaque mesure
+            env["FAKE_SAMBA_DIR"] = tempfile.mkdtemp(dir=workdir)
+            pool = SSHConnectionPool(max_size=concurrency)
+
+            @contextmanager
+            def ssh_connection(server_name, username, password):
+                with pool.connection("127.0.0.1", username, password, port=server.port) as client:
+                    yield client
+
+            samba_batch.ssh_connection = ssh_connection
+            samba_batch.config.SAMBA_USER, samba_batch.config.SAMBA_PWD = server.username, server.password
+
+            start = time.perf_counter()
+            results = samba_batch.run_samba_batch(operations, batch_size=args.batch_size, concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+            pool.close_all()
+
+            failed = sum(not samba_batch.is_success(result) for result in results)
+            rows.append([concurrency, len(operations), f"{elapsed:.2f} s", f"{len(operations) / elapsed:.0f}",
+                         pool.get_stats()['misses'], failed])
+
+    common.print_table(["concurrence", "opérations", "durée", "op/s", "connexions SSH", "échecs"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark de la couche d'état de run_sync.py (table AzureObject)
+
+    python bench/bench_sync_state.py                   # 20 000 objets
+    python bench/bench_sync_state.py --objects 50000 --changed 0.2
+
+Sur une base d'état de `--objects` objets, compare l'ancien accès (un SELECT
+par objet, puis un UPDATE par objet modifié hors transaction, base en mode
+de journal par défaut) à SyncState (toutes les lignes lues une fois,
+écritures groupées dans une seule transaction, base en WAL), puis mesure
+un cycle complet de run_sync.py où `--changed` des utilisateurs ont changé. L'annuaire et Azure AD sont simulés (sync_harness).
+"""
+import argparse
+import datetime
+import json
+import tempfile
+import time
+from contextlib import contextmanager
+
+import common
+import sync_harness
+
+
+@contextmanager
+def former_pragmas(db):
+    """Mode de journal par défaut de SQLite, utilisé avant le passage en WAL"""
+    db.execute_sql("PRAGMA journal_mode=delete")
+    db.execute_sql("PRAGMA synchronous=full")
+    try:
+        yield
+    finally:
+        db.execute_sql("PRAGMA journal_mode=wal")
+        db.execute_sql("PRAGMA synchronous=normal")
+
+
+def old_lookups(run_sync, entries):
+    """Ancien accès : une requête par objet"""
+    AzureObject = run_sync.AzureObject
+    found = 0
+    for entry, object_type in entries:
+        row = AzureObject.select(AzureObject.last_data_send).where(
+            AzureObject.sourceanchor == entry, AzureObject.object_type == object_type).first()
+        found += row is not None
+    return found
+
+
+def new_lookups(run_sync, entries):
+    state = run_sync.SyncState()
+    return sum(state.get(entry, object_type) is not None for entry, object_type in entries)
+
+
+def old_writes(run_sync, changes):
+    """Ancienne écriture : un UPDATE par objet, chacun dans sa propre transaction"""
+    AzureObject = run_sync.AzureObject
+    for entry, data in changes:
+        AzureObject.update(last_data_send=json.dumps(data), last_data_send_date=datetime.datetime.now()).where(
+            AzureObject.sourceanchor == entry).execute()
+
+
+def new_writes(run_sync, changes):
+    state = run_sync.SyncState()
+    for entry, data in changes:
+        state.record_send(entry, 'user', data)
+    state.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--objects", type=int, default=20000)
+    parser.add_argument("--changed", type=float, default=0.1, help="part des utilisateurs modifiés")
+    args = parser.parse_args()
+
+    groups = args.objects // 40
+    users = args.objects - groups
+    run_sync = sync_harness.load_run_sync(tempfile.mkdtemp(prefix="bench_sync_state_"), users, groups)
+
+    start = time.perf_counter()
+    sync_harness.cycle(run_sync)
+    initial = time.perf_counter() - start
+    print(f"Base d'état : {run_sync.AzureObject.select().count()} objets "
+          f"(premier cycle, tout envoyé : {initial:.1f} s)\n")
+
+    entries = [(f"u{i}", 'user') for i in range(users)] + [(f"g{g}", 'group') for g in range(groups)]
+    changed = [i for i in range(0, users, max(1, round(1 / args.changed)))] if args.changed else []
+    state = run_sync.SyncState()
+    changes = [(f"u{i}", dict(state.last_data(f"u{i}", 'user'), department="Bench")) for i in changed]
+
+    rows = []
+    with former_pragmas(run_sync.db):
+        old, found_old = common.timed(old_lookups, run_sync, entries, repeat=1)
+    new, found_new = common.timed(new_lookups, run_sync, entries, repeat=1)
+    assert found_old == found_new == len(entries)
+    rows.append([f"lecture de {len(entries)} objets", f"{old:.2f} s", f"{new:.2f} s", f"x{old / new:.0f}"])
+    with former_pragmas(run_sync.db):
+        old, _ = common.timed(old_writes, run_sync, changes, repeat=1)
+    new, _ = common.timed(new_writes, run_sync, changes, repeat=1)
+    rows.append([f"écriture de {len(changes)} objets", f"{old:.2f} s", f"{new:.2f} s", f"x{old / new:.0f}"])
+    common.print_table(["", "requête par objet", "SyncState", "gain"], rows)
+
+    sync_harness.FakeSambaInfo.modified = changed
+    start = time.perf_counter()
+    sync_harness.cycle(run_sync)
+    elapsed = time.perf_counter() - start
+    print(f"\nCycle run_sync avec {len(changed)} utilisateurs modifiés : {elapsed:.2f} s, "
+          f"{sync_harness.fake_azure().sent} objets envoyés")
+
+
+if __name__ == "__main__":
+    main()
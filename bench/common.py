@@ -0,0 +1,49 @@
+"""
+Outils communs des benchmarks
+
+Importé en premier par chaque script de bench/ : rend les modules de
+l'application importables (`from modules.xxx import ...`) et charge `config`
+depuis config.py.example quand /home/streamlit/config.py est absent, comme
+les tests (tests/bootstrap.py).
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+import bootstrap  # noqa: E402
+
+ROOT = bootstrap.ROOT
+config = bootstrap.config
+
+SYLLABLES = ["ma", "lo", "ri", "an", "be", "ne", "du", "pon", "mar", "tin", "le", "goff", "ro", "sa", "li", "é", "è", "va"]
+
+
+def fake_names(count, seed=0):
+    """`count` couples (nom, prénom) distincts et reproductibles"""
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        nom = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        prenom = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+        names.add((nom, prenom))
+    return sorted(names)
+
+
+def timed(function, *args, repeat=3, **kwargs):
+    """(meilleur temps en secondes, résultat du dernier appel)"""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in [headers] + rows:
+        print("  ".join(str(value).rjust(width) for value, width in zip(row, widths)))
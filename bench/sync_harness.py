@@ -0,0 +1,149 @@
+"""
+Exécution de run_sync.py hors d'un contrôleur de domaine, pour les benchmarks
+
+run_sync.py lit l'annuaire et pousse vers Azure AD par la bibliothèque
+`libsync` (paquet de synchronisation AD installé sur le serveur SAMBA). Ici, un
+faux `libsync` fournit un annuaire synthétique de `users` utilisateurs et
+`groups` groupes et un Azure AD qui ne fait que compter les envois. La base
+d'état SQLite, le verrou et la table sync_run sont les vrais.
+
+    run_sync = load_run_sync(workdir, users=20000, groups=500)
+    cycle(run_sync)                       # premier cycle : tout est envoyé
+    fake_azure().sent                     # nombre d'objets envoyés
+"""
+import importlib.util
+import logging
+import os
+import sys
+import types
+
+import common
+
+RUN_SYNC_PATH = os.path.join(common.ROOT, "apps", "run_sync.py")
+
+_azure = None
+
+AZURE_CONF = """[common]
+dbpath={dbpath}
+dry_run=false
+hash_synchronization=true
+sync_device=false
+proxy=
+SourceAnchorAttr=objectGUID
+write_msDSConsistencyGuid_if_empty=false
+use_msDSConsistencyGuid_if_exist=false
+do_delete=false
+logfile=
+"""
+
+
+class FakeSambaInfo:
+    """Annuaire synthétique : utilisateurs u0..uN, groupes de 40 membres, un hash NT par utilisateur"""
+
+    users = 0
+    groups = 0
+    # Utilisateurs dont le contenu change au prochain cycle (changement de classe par exemple)
+    modified = ()
+
+    def __init__(self, **kwargs):
+        self.samdb_loc = None
+        self.domaine = "example.lan"
+
+    def generate_all_dict(self):
+        modified = set(self.modified)
+        self.dict_all_users_samba = {
+            f"u{i}": {
+                "SourceAnchor": f"u{i}",
+                "onPremisesSamAccountName": f"eleve.{i}",
+                "userPrincipalName": f"eleve.{i}@example.org",
+                "displayName": f"Eleve {i}",
+                "givenName": "Eleve",
+                "surname": str(i),
+                "department": f"Classe {(i + 1) % 40 if i in modified else i % 40}",
+                "accountEnabled": True,
+                "proxyAddresses": [f"SMTP:eleve.{i}@example.org"],
+            }
+            for i in range(self.users)
+        }
+        self.dict_all_group_samba = {
+            f"g{g}": {
+                "SourceAnchor": f"g{g}",
+                "displayName": f"Groupe {g}",
+                "groupMembers": [f"u{i}" for i in range(g * 40, min(self.users, g * 40 + 40))],
+            }
+            for g in range(self.groups)
+        }
+        self.dict_all_device_samba = {}
+        self.dict_id_hash = {entry: entry.encode("ascii").ljust(16, b"\0") for entry in self.dict_all_users_samba}
+
+
+class FakeAdConnect:
+    """Azure AD qui accepte tout et compte les envois"""
+
+    def __init__(self):
+        global _azure
+        _azure = self
+        self.az = None
+        self.dict_az_user = {}
+        self.dict_az_group = {}
+        self.dict_az_devices = {}
+        self.sent = 0
+        self.hashes_sent = 0
+
+    def connect(self):
+        pass
+
+    def enable_ad_sync(self):
+        pass
+
+    def enable_password_hash_sync(self):
+        pass
+
+    def generate_all_dict(self):
+        pass
+
+    def send_obj_to_az(self, obj):
+        self.sent += 1
+
+    def send_hashnt(self, hashnt, account):
+        self.hashes_sent += 1
+
+
+def fake_azure():
+    """Faux Azure AD du dernier cycle"""
+    return _azure
+
+
+def _fake_libsync():
+    module = types.ModuleType("libsync")
+    module.AdConnect = FakeAdConnect
+    module.SambaInfo = FakeSambaInfo
+    module.logger = logging.getLogger("libsync")
+    module.logging = logging
+    module.write_log_json_data = lambda *args, **kwargs: None
+    module.generate_password = lambda *args, **kwargs: "Motdepasse1!"
+    return module
+
+
+def load_run_sync(workdir, users, groups=0):
+    """Importe run_sync.py avec une base d'état dans `workdir` et le faux libsync"""
+    FakeSambaInfo.users, FakeSambaInfo.groups, FakeSambaInfo.modified = users, groups, ()
+    conf = os.path.join(workdir, "azure.conf")
+    with open(conf, "w") as f:
+        f.write(AZURE_CONF.format(dbpath=os.path.join(workdir, "azure_objects.db")))
+    sys.modules["libsync"] = _fake_libsync()
+    sys.argv = [RUN_SYNC_PATH, "--conf", conf]
+    spec = importlib.util.spec_from_file_location("run_sync", RUN_SYNC_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def cycle(run_sync, force=False):
+    """Un cycle complet de synchronisation, comme la boucle principale de run_sync.py"""
+    run_sync.run_lock.acquire(wait=True)
+    try:
+        run_sync.run_sync(force=force)
+        run_sync.finish_run()
+    finally:
+        run_sync.run_lock.release()
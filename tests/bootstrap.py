@@ -0,0 +1,39 @@
+"""
+Chargement des modules du portail hors du serveur, pour les tests et les benchmarks
+
+Importé par tests/conftest.py et bench/common.py : rend les modules de
+l'application importables comme dans l'application (`from modules.xxx import
+...`) et, sans /home/streamlit/config.py, charge le module `config` depuis
+config.py.example en y ajoutant les réglages lus à l'import des modules qui
+n'y figurent pas.
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+from importlib.machinery import SourceFileLoader
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS_DIR = os.path.join(ROOT, "tests")
+
+for path in (TESTS_DIR, os.path.join(ROOT, "apps", "gestion_utilisateurs"), os.path.join(ROOT, "apps")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Réglages absents de config.py.example lus à l'import de modules.utils
+EXAMPLE_DEFAULTS = {
+    "PASSWORD_EXCEL_FILE": os.path.join(tempfile.gettempdir(), "portail_mots_de_passe.xlsx"),
+    "CLASS_MAPPING": {},
+}
+
+try:
+    import config  # noqa: F401
+except ImportError:
+    loader = SourceFileLoader("config", os.path.join(ROOT, "config.py.example"))
+    spec = importlib.util.spec_from_loader("config", loader)
+    config = importlib.util.module_from_spec(spec)
+    loader.exec_module(config)
+    for name, value in EXAMPLE_DEFAULTS.items():
+        if not hasattr(config, name):
+            setattr(config, name, value)
+    sys.modules["config"] = config
@@ -0,0 +1,13 @@
+"""
+Configuration commune des tests
+
+Les modules de `apps/gestion_utilisateurs/modules` sont importés comme dans
+l'application (`from modules.xxx import ...`) ; sans /home/streamlit/config.py,
+le module `config` est chargé depuis config.py.example (voir bootstrap.py).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bootstrap  # noqa: E402,F401
@@ -0,0 +1,191 @@
+"""
+Faux serveur Microsoft Graph local pour tester le client Graph
+
+    with FakeGraphServer() as graph:
+        graph.add_users(25)
+        client = GraphClient("tenant", "client", "secret", base_url=graph.base_url,
+                             token_provider=lambda: ("jeton", 3600))
+
+Collections `users` et `groups` paginées par `@odata.nextLink` (`page_size`
+éléments par page, ou `$top`), lecture d'un objet par identifiant, membres
+d'un groupe et `POST /$batch`. `throttle(n)` fait répondre 429 (avec
+Retry-After) aux n prochaines requêtes ou sous-requêtes, `revoke(jeton)` fait
+répondre 401 aux requêtes portant ce jeton. `requests` garde (méthode, chemin,
+jeton) de chaque requête HTTP reçue et `connections` le nombre de connexions
+TCP ouvertes (keep-alive).
+"""
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+API_VERSION = "v1.0"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.graph.lock:
+            self.server.graph.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _token(self):
+        authorization = self.headers.get("Authorization", "")
+        return authorization[len("Bearer "):] if authorization.startswith("Bearer ") else ""
+
+    def _send(self, status, body=None, headers=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        graph = self.server.graph
+        body = None
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = json.loads(self.rfile.read(length))
+        with graph.lock:
+            graph.requests.append((method, self.path, self._token()))
+        if self._token() in graph.revoked or not self._token():
+            self._send(401, {"error": {"code": "InvalidAuthenticationToken", "message": "Access token has expired"}})
+            return
+        status, payload, headers = graph.dispatch(method, self.path, body)
+        self._send(status, payload, headers)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+class FakeGraphServer:
+    """Serveur HTTP sur 127.0.0.1 imitant les points d'accès Graph utilisés par le portail"""
+
+    def __init__(self, page_size=100, retry_after=0):
+        self.page_size = page_size
+        self.retry_after = retry_after
+        self.objects = {"users": [], "groups": []}
+        self.members = {}  # id de groupe -> [utilisateurs]
+        self.requests = []
+        self.revoked = set()
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._throttled = 0
+        self._server = None
+
+    # ------------------------------------------------------------------ données
+
+    def add_users(self, count, prefix="eleve"):
+        users = [{"id": str(uuid.uuid4()), "userPrincipalName": f"{prefix}{i}@example.org",
+                  "displayName": f"{prefix.capitalize()} {i}"} for i in range(count)]
+        self.objects["users"].extend(users)
+        return users
+
+    def add_group(self, name, members=()):
+        group = {"id": str(uuid.uuid4()), "displayName": name, "groupTypes": [],
+                 "securityEnabled": True, "mailEnabled": False}
+        self.objects["groups"].append(group)
+        self.members[group["id"]] = list(members)
+        return group
+
+    def throttle(self, count):
+        with self.lock:
+            self._throttled += count
+
+    def revoke(self, token):
+        self.revoked.add(token)
+
+    # ------------------------------------------------------------------ réponses
+
+    def _take_throttle(self):
+        with self.lock:
+            if self._throttled:
+                self._throttled -= 1
+                return True
+            return False
+
+    def _page(self, path, items, query):
+        top = int(query.get("$top", [self.page_size])[0])
+        skip = int(query.get("$skiptoken", [0])[0])
+        page = {"value": items[skip:skip + top]}
+        if skip + top < len(items):
+            params = {key: values[0] for key, values in query.items() if key != "$skiptoken"}
+            params["$skiptoken"] = skip + top
+            page["@odata.nextLink"] = f"{self.origin}/{API_VERSION}{path}?{urlencode(params)}"
+        return page
+
+    def dispatch(self, method, raw_path, body=None):
+        """(statut, corps, en-têtes) d'une requête ou sous-requête"""
+        url = urlsplit(raw_path)
+        path = url.path[len(API_VERSION) + 1:] if url.path.startswith(f"/{API_VERSION}/") else url.path
+        segments = [segment for segment in path.split("/") if segment]
+        query = parse_qs(url.query)
+
+        if method == "POST" and segments == ["$batch"]:
+            responses = []
+            for item in body["requests"]:
+                status, payload, headers = self.dispatch(item["method"], item["url"], item.get("body"))
+                responses.append({"id": item["id"], "status": status, "headers": headers, "body": payload})
+            return 200, {"responses": responses}, {}
+
+        # Le throttling porte sur les requêtes simples et les sous-requêtes d'un /$batch
+        if self._take_throttle():
+            return 429, {"error": {"code": "TooManyRequests", "message": "Throttled"}}, \
+                {"Retry-After": str(self.retry_after)}
+
+        if method == "GET" and segments and segments[0] in self.objects:
+            items = self.objects[segments[0]]
+            if len(segments) == 1:
+                if "$filter" in query:
+                    # Seul filtre géré : displayName eq 'nom'
+                    name = query["$filter"][0].split("eq", 1)[1].strip().strip("'")
+                    items = [item for item in items if item.get("displayName") == name]
+                return 200, self._page(path, items, query), {}
+            found = next((item for item in items if item["id"] == segments[1]), None)
+            if found is None:
+                return 404, {"error": {"code": "Request_ResourceNotFound",
+                                       "message": f"Resource '{segments[1]}' does not exist"}}, {}
+            if len(segments) == 2:
+                return 200, found, {}
+            if segments[2] == "members" and segments[0] == "groups":
+                return 200, self._page(path, self.members.get(found["id"], []), query), {}
+
+        return 400, {"error": {"code": "BadRequest", "message": f"Unsupported {method} {url.path}"}}, {}
+
+    # ------------------------------------------------------------------ serveur
+
+    @property
+    def origin(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def base_url(self):
+        return f"{self.origin}/{API_VERSION}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.graph = self
+        threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
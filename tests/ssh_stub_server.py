@@ -0,0 +1,198 @@
+"""
+Serveur SSH local (paramiko) pour tester le pool SSH sans serveur SAMBA
+
+    with StubSSHServer(handler=lambda command: ("ok", "", 0)) as server:
+        pool.acquire("127.0.0.1", server.username, server.password, port=server.port)
+
+Authentification par mot de passe seulement ; chaque commande `exec` est
+passée à `handler(command)` qui retourne (stdout, stderr, code de sortie).
+Pour une commande `sudo -S`, la première ligne de stdin (mot de passe) est
+lue et gardée dans `sudo_passwords`. `connections` compte les poignées de
+main SSH authentifiées.
+
+Avec `shell_env`, les commandes sont exécutées par un bash local avec cet
+environnement (PATH vers de faux `sudo` / `samba-tool` par exemple) : stdin
+est transmis et stdout renvoyé au fil de l'eau, comme sur le serveur SAMBA.
+"""
+import socket
+import subprocess
+import threading
+import time
+
+import paramiko
+
+
+def echo_handler(command):
+    return command, "", 0
+
+
+class _Interface(paramiko.ServerInterface):
+    def __init__(self, server):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if username == self.server.username and password == self.server.password:
+            with self.server._lock:
+                self.server.connections += 1
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.server._run, args=(channel, command.decode("utf-8")), daemon=True).start()
+        return True
+
+
+class StubSSHServer:
+    """Serveur SSH sur 127.0.0.1 (port choisi par le système), à arrêter avec stop()"""
+
+    def __init__(self, username="admin", password="secret", handler=echo_handler, delay=0.0, shell_env=None):
+        self.username = username
+        self.password = password
+        self.handler = handler
+        self.delay = delay
+        self.shell_env = shell_env
+        self.port = None
+        self.connections = 0
+        self.commands = []
+        self.sudo_passwords = []
+        self._host_key = paramiko.RSAKey.generate(2048)
+        self._lock = threading.Lock()
+        self._transports = []
+        self._channels = set()
+        self._socket = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.listen(16)
+        self._socket.settimeout(0.2)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                sock, _ = self._socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def _serve(self, sock):
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self._host_key)
+        try:
+            transport.start_server(server=_Interface(self))
+        except (paramiko.SSHException, EOFError, OSError):
+            transport.close()
+            return
+        with self._lock:
+            self._transports.append(transport)
+        # Les canaux sont servis par check_channel_exec_request ; une référence est
+        # gardée jusqu'à la fin de la commande (un Channel libéré est fermé)
+        while transport.is_active() and not self._stopped.is_set():
+            channel = transport.accept(0.2)
+            if channel is not None:
+                with self._lock:
+                    self._channels.add(channel)
+
+    def _run(self, channel, command):
+        with self._lock:
+            self.commands.append(command)
+        # paramiko répond à la requête exec après ce rappel : laisser passer la
+        # réponse avant de fermer le canal, sinon exec_command échoue côté client
+        time.sleep(0.05)
+        if self.shell_env is not None:
+            self._run_shell(channel, command)
+            return
+        try:
+            if "sudo -S" in command:
+                line = b""
+                while not line.endswith(b"\n"):
+                    chunk = channel.recv(1)
+                    if not chunk:
+                        break
+                    line += chunk
+                with self._lock:
+                    self.sudo_passwords.append(line.decode("utf-8").rstrip("\n"))
+            if self.delay:
+                self._stopped.wait(self.delay)
+            out, err, status = self.handler(command)
+            if out:
+                channel.sendall(out.encode("utf-8"))
+            if err:
+                channel.sendall_stderr(err.encode("utf-8"))
+            channel.send_exit_status(status)
+        finally:
+            channel.close()
+            with self._lock:
+                self._channels.discard(channel)
+
+    def _run_shell(self, channel, command):
+        process = subprocess.Popen(["bash", "-c", command], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=self.shell_env)
+
+        def forward_stdin():
+            try:
+                while True:
+                    data = channel.recv(32768)
+                    if not data:
+                        break
+                    process.stdin.write(data)
+                    process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+
+        def forward_stderr():
+            for data in iter(lambda: process.stderr.read1(32768), b""):
+                channel.sendall_stderr(data)
+
+        threads = [threading.Thread(target=forward_stdin, daemon=True),
+                   threading.Thread(target=forward_stderr, daemon=True)]
+        for thread in threads:
+            thread.start()
+        try:
+            for data in iter(lambda: process.stdout.read1(32768), b""):
+                channel.sendall(data)
+            threads[1].join()
+            channel.send_exit_status(process.wait())
+        finally:
+            channel.close()
+            with self._lock:
+                self._channels.discard(channel)
+
+    def drop_connections(self):
+        """Coupe toutes les connexions ouvertes (serveur redémarré, réseau coupé...)"""
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for transport in transports:
+            transport.close()
+
+    def stop(self):
+        self._stopped.set()
+        if self._socket is not None:
+            self._socket.close()
+        self.drop_connections()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,190 @@
+"""
+Tests du module MySQL partagé (modules.db_pool)
+
+Le pool est exercé avec sqlite3 (`connect=`) : même cycle de prêt, de
+vérification et de recyclage qu'avec pymysql. bulk_upsert est vérifié avec un
+curseur qui enregistre les requêtes et rejoue, tranche par tranche, le
+COUNT(*) des clés existantes et le nombre de lignes affectées renvoyé par
+MySQL (1 par insertion, 2 par mise à jour, 0 si la ligne est inchangée).
+"""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("pymysql")
+
+from modules.db_pool import MySQLPool, PoolTimeoutError, bulk_upsert  # noqa: E402
+
+
+@pytest.fixture
+def make_pool(tmp_path):
+    pools = []
+
+    def make(**kwargs):
+        kwargs.setdefault("timeout", 5)
+        pool = MySQLPool({"database": str(tmp_path / "pool.db"), "check_same_thread": False},
+                         connect=sqlite3.connect, **kwargs)
+        pools.append(pool)
+        return pool
+    yield make
+    for pool in pools:
+        pool.close_all()
+
+
+def test_connections_bounded_and_reused(make_pool):
+    pool = make_pool(max_size=2)
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        for _ in range(5):
+            with pool.connection() as conn:
+                conn.cursor().execute("SELECT 1")
+                time.sleep(0.005)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = pool.get_stats()
+    assert stats["checkouts"] == 40
+    assert stats["created"] <= 2
+    assert stats["reused"] == 40 - stats["created"]
+    assert stats["queries"]["SELECT"]["calls"] == 40
+
+
+def test_checkout_times_out_when_pool_is_full(make_pool):
+    pool = make_pool(max_size=1, timeout=0.1)
+    with pool.connection():
+        with pytest.raises(PoolTimeoutError):
+            with pool.connection():
+                pass
+    with pool.connection() as conn:
+        conn.cursor().execute("SELECT 1")
+
+
+def test_dead_connection_replaced_after_ping(make_pool):
+    pool = make_pool(ping_interval=0)
+    with pool.connection() as conn:
+        first = conn._conn
+    first.close()
+    with pool.connection() as conn:
+        assert conn._conn is not first
+        conn.cursor().execute("SELECT 1")
+    stats = pool.get_stats()
+    assert stats["ping_failures"] == 1 and stats["created"] == 2
+
+
+def test_old_connection_recycled(make_pool):
+    pool = make_pool(recycle=0)
+    with pool.connection() as conn:
+        first = conn._conn
+    time.sleep(0.01)
+    with pool.connection() as conn:
+        assert conn._conn is not first
+    assert pool.get_stats()["recycled"] == 1
+
+
+def test_uncommitted_work_rolled_back_on_release(make_pool):
+    pool = make_pool()
+    with pool.connection() as conn:
+        conn.cursor().execute("CREATE TABLE comptes (login TEXT)")
+        conn.commit()
+    with pool.connection() as conn:
+        conn.cursor().execute("INSERT INTO comptes VALUES ('a.dupont')")
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM comptes")
+        assert cursor.fetchone()[0] == 0
+    assert pool.get_stats()["created"] == 1
+
+
+def test_broken_connection_discarded_on_release(make_pool):
+    pool = make_pool()
+    with pool.connection() as conn:
+        first = conn._conn
+        first.close()
+    with pool.connection() as conn:
+        assert conn._conn is not first
+    stats = pool.get_stats()
+    assert stats["discarded"] == 1 and stats["idle"] == 1
+
+
+class RecordingCursor:
+    """`chunks` : (lignes déjà présentes, rowcount de l'INSERT) pour chaque tranche"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.statements = []
+        self.rowcount = -1
+        self._existing = None
+
+    def execute(self, query, args=()):
+        self.statements.append((query.split(" ", 1)[0], len(args)))
+        if query.startswith("SELECT COUNT(*)"):
+            self._existing = self.chunks[0][0]
+        else:
+            self.rowcount = self.chunks.pop(0)[1]
+
+    def fetchone(self):
+        return (self._existing,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+
+def upsert(cursor, rows, **kwargs):
+    kwargs.setdefault("key_columns", ["Login"])
+    kwargs.setdefault("update_columns", ["Classe"])
+    return bulk_upsert(FakeConnection(cursor), "utilisateurs", ["Login", "Classe"], rows, **kwargs)
+
+
+ROWS = [(f"eleve{i}", "4A") for i in range(10)]
+
+
+@pytest.mark.parametrize("chunks, chunk_size, expected", [
+    # 10 nouveaux
+    ([(0, 10)], None, {"inserted": 10, "updated": 0, "unchanged": 0}),
+    # 10 existants dont 3 modifiés : 3 x 2 lignes affectées
+    ([(10, 6)], None, {"inserted": 0, "updated": 3, "unchanged": 7}),
+    # 4 nouveaux, 3 modifiés, 3 identiques : 4 + 3 x 2
+    ([(6, 10)], None, {"inserted": 4, "updated": 3, "unchanged": 3}),
+    # Même import en tranches de 4, 4 et 2 lignes
+    ([(4, 2), (2, 6), (0, 2)], 4, {"inserted": 4, "updated": 3, "unchanged": 3}),
+])
+def test_counts_from_affected_rows(chunks, chunk_size, expected):
+    cursor = RecordingCursor(chunks)
+    assert upsert(cursor, ROWS, chunk_size=chunk_size) == expected
+    assert not cursor.chunks
+
+
+def test_count_query_precedes_each_insert():
+    cursor = RecordingCursor([(1, 3), (0, 1)])
+    upsert(cursor, ROWS[:3], chunk_size=2)
+    # Paramètres : une clé par ligne pour le COUNT, deux colonnes par ligne pour l'INSERT
+    assert cursor.statements == [("SELECT", 2), ("INSERT", 4), ("SELECT", 1), ("INSERT", 2)]
+
+
+def test_duplicate_keys_keep_last_row():
+    cursor = RecordingCursor([(0, 2)])
+    counts = upsert(cursor, [("eleve1", "4A"), ("eleve2", "4A"), ("eleve1", "3B")])
+    assert counts == {"inserted": 2, "updated": 0, "unchanged": 0}
+    assert cursor.statements == [("SELECT", 2), ("INSERT", 4)]
+
+
+def test_plain_insert_skips_count_query():
+    cursor = RecordingCursor([(None, 10)])
+    counts = upsert(cursor, ROWS, key_columns=(), update_columns=())
+    assert counts == {"inserted": 10, "updated": 0, "unchanged": 0}
+    assert cursor.statements == [("INSERT", 20)]
@@ -0,0 +1,134 @@
+"""
+Tests du client Graph partagé contre le faux serveur de fake_graph_server
+"""
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("msal")
+
+from fake_graph_server import FakeGraphServer  # noqa: E402
+from modules.graph_client import GraphClient, GraphError, endpoint_name  # noqa: E402
+
+
+class Tokens:
+    """Fournisseur de jetons comptant ses appels : jeton-1, jeton-2, ..."""
+
+    def __init__(self, expires_in=3600):
+        self.expires_in = expires_in
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return f"jeton-{self.calls}", self.expires_in
+
+
+@pytest.fixture
+def graph():
+    with FakeGraphServer(page_size=10, retry_after=0.01) as server:
+        yield server
+
+
+@pytest.fixture
+def tokens():
+    return Tokens()
+
+
+@pytest.fixture
+def client(graph, tokens):
+    client = GraphClient("tenant", "client", "secret", base_url=graph.base_url, max_retries=3,
+                         token_provider=tokens)
+    yield client
+    client.close()
+
+
+def test_token_reused_until_expiry(graph, client, tokens):
+    graph.add_users(3)
+    for _ in range(3):
+        client.get("/users")
+    assert tokens.calls == 1
+    assert {token for _, _, token in graph.requests} == {"jeton-1"}
+    stats = client.get_stats()
+    assert stats['token_requests'] == 1 and stats['token_cache_hits'] == 2
+
+
+def test_token_refreshed_near_expiry(graph, tokens):
+    # Validité inférieure à la marge de renouvellement : nouveau jeton à chaque requête
+    tokens.expires_in = 60
+    client = GraphClient("tenant", "client", "secret", base_url=graph.base_url, token_provider=tokens)
+    client.get("/users")
+    client.get("/users")
+    assert tokens.calls == 2
+
+
+def test_connection_kept_alive(graph, client):
+    graph.add_users(3)
+    for _ in range(5):
+        client.get("/users")
+    assert graph.connections == 1
+
+
+def test_pagination_follows_next_link(graph, client):
+    users = graph.add_users(25)
+    assert client.get_all("/users") == users
+    assert len(graph.requests) == 3
+    assert [len(page) for page in client.iter_pages("/users", params={"$top": 20})] == [20, 5]
+
+
+def test_throttling_retried_after_retry_after(graph, client):
+    graph.add_users(2)
+    graph.throttle(2)
+    assert len(client.get_all("/users")) == 2
+    stats = client.get_stats()
+    assert stats['throttled'] == 2 and stats['retries'] == 2
+
+
+def test_throttling_gives_up_after_max_retries(graph, client):
+    graph.throttle(10)
+    with pytest.raises(GraphError) as error:
+        client.get("/users")
+    assert error.value.status_code == 429
+    assert len(graph.requests) == 4
+
+
+def test_revoked_token_refreshed_once(graph, client, tokens):
+    graph.add_users(1)
+    client.get("/users")
+    graph.revoke("jeton-1")
+    assert len(client.get("/users")["value"]) == 1
+    assert tokens.calls == 2
+    graph.revoke("jeton-2")
+    graph.revoke("jeton-3")
+    with pytest.raises(GraphError) as error:
+        client.get("/users")
+    assert error.value.status_code == 401
+
+
+def test_not_found_raises_graph_error(graph, client):
+    with pytest.raises(GraphError) as error:
+        client.get("/groups/00000000-0000-0000-0000-000000000000")
+    assert error.value.status_code == 404
+    assert "does not exist" in str(error.value)
+
+
+def test_batch_chunks_and_retries_throttled_subrequests(graph, client):
+    groups = [graph.add_group(f"Classe {i}") for i in range(45)]
+    sub_requests = [{"url": f"/groups/{group['id']}"} for group in groups]
+    sub_requests.append({"url": "/groups/00000000-0000-0000-0000-000000000000"})
+    graph.throttle(3)
+    results = client.batch(sub_requests)
+    assert [result["body"]["displayName"] for result in results[:45]] == [group["displayName"] for group in groups]
+    assert results[45]["status"] == 404
+    posts = [path for method, path, _ in graph.requests if method == "POST"]
+    # 46 sous-requêtes : 3 appels, puis un appel pour les 3 sous-requêtes limitées
+    assert len(posts) == 4
+    assert client.get_stats()['throttled'] == 3
+
+
+def test_endpoint_metrics_mask_identifiers(graph, client):
+    group = graph.add_group("Eleves")
+    client.get(f"/groups/{group['id']}")
+    client.get_all(f"/groups/{group['id']}/members")
+    endpoints = client.get_stats()['endpoints']
+    assert set(endpoints) == {"GET /groups/{id}", "GET /groups/{id}/members"}
+    assert endpoints["GET /groups/{id}"]['calls'] == 1
+    assert endpoint_name("GET", f"{graph.base_url}/users?$top=5") == "GET /users"
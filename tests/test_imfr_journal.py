@@ -0,0 +1,110 @@
+"""
+Tests de la bascule de eleves_imfr (modules.imfr_journal)
+
+La connexion MySQL est remplacée par un curseur qui enregistre les requêtes.
+"""
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("pymysql")
+pytest.importorskip("pandas")
+
+from modules import imfr_journal  # noqa: E402
+
+
+class RecordingCursor:
+    """Curseur qui enregistre les requêtes ; `tables` : tables existantes, `lock` : réponse de GET_LOCK"""
+
+    def __init__(self, tables, lock=1):
+        self.tables = set(tables)
+        self.lock = lock
+        self.statements = []
+        self._result = None
+
+    def execute(self, query, args=None):
+        query = " ".join(query.split())
+        self.statements.append(query)
+        if "information_schema.TABLES" in query:
+            self._result = (int(args[0] in self.tables),)
+        elif "GET_LOCK" in query:
+            self._result = (self.lock,)
+        elif "RELEASE_LOCK" in query:
+            self._result = (1,)
+        else:
+            self._result = None
+
+    def fetchone(self):
+        return self._result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def recording_db(monkeypatch):
+    def install(tables=(), lock=1):
+        cursor = RecordingCursor(tables, lock)
+
+        @contextmanager
+        def db_connection():
+            yield FakeConnection(cursor)
+
+        monkeypatch.setattr(imfr_journal, "db_connection", db_connection)
+        monkeypatch.setattr(imfr_journal, "bulk_upsert",
+                            lambda conn, table, columns, rows, **kwargs: {"inserted": len(rows)})
+        return cursor
+    return install
+
+
+def schema_changes(cursor):
+    return [query for query in cursor.statements if query.startswith(("RENAME", "DROP"))]
+
+
+ELEVES = [{"nom": "DUPONT", "prenom": "Alice", "classe": "4A"}]
+
+
+def test_rotation_keeps_previous_snapshot_in_one_rename(recording_db):
+    cursor = recording_db({"eleves_imfr", "eleves_imfr_prev"})
+    assert imfr_journal.replace_eleves(ELEVES) == 1
+    assert schema_changes(cursor) == [
+        "DROP TABLE IF EXISTS eleves_imfr_new",
+        "DROP TABLE IF EXISTS eleves_imfr_old",
+        "RENAME TABLE eleves_imfr_prev TO eleves_imfr_old, eleves_imfr TO eleves_imfr_prev, "
+        "eleves_imfr_new TO eleves_imfr",
+        "DROP TABLE IF EXISTS eleves_imfr_old",
+    ]
+
+
+def test_first_rotation_without_previous_snapshot(recording_db):
+    cursor = recording_db({"eleves_imfr"})
+    imfr_journal.replace_eleves(ELEVES)
+    assert "RENAME TABLE eleves_imfr TO eleves_imfr_prev, eleves_imfr_new TO eleves_imfr" in cursor.statements
+
+
+def test_import_lock_released_when_import_fails(recording_db):
+    cursor = recording_db()
+    with pytest.raises(ValueError):
+        with imfr_journal.import_lock():
+            cursor.execute("SELECT cle FROM eleves_imfr_empreintes")
+            raise ValueError("import interrompu")
+    assert cursor.statements[0] == "SELECT GET_LOCK(%s, %s)"
+    assert cursor.statements[-1] == "SELECT RELEASE_LOCK(%s)"
+
+
+def test_import_lock_busy(recording_db):
+    recording_db(lock=0)
+    with pytest.raises(RuntimeError, match="Un autre import IMFR"):
+        with imfr_journal.import_lock():
+            pass
@@ -0,0 +1,114 @@
+"""
+Tests des gestionnaires de tâches (modules.job_handlers)
+
+La RAZ du groupe Eleves est exécutée avec un faux lot samba-tool et une
+connexion MySQL qui enregistre les suppressions de la table utilisateurs.
+"""
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("paramiko")
+pytest.importorskip("streamlit")
+pytest.importorskip("pymysql")
+
+from modules import job_handlers  # noqa: E402
+
+
+class FakeContext:
+    """Contexte de tâche en mémoire ; `done` : éléments d'une exécution précédente"""
+
+    def __init__(self, done=None):
+        self.done = dict(done or {})
+        self.marked = []
+        self.logs = []
+
+    def completed_items(self):
+        return dict(self.done)
+
+    def mark_items(self, items):
+        self.marked += items
+
+    def log(self, message, level="INFO"):
+        self.logs.append((level, message))
+
+    def progress(self, done, total, message=None):
+        pass
+
+    def check_cancelled(self):
+        pass
+
+
+class RecordingCursor:
+    def __init__(self, deleted):
+        self.deleted = deleted
+
+    def executemany(self, query, args):
+        assert query == "DELETE FROM utilisateurs WHERE Login = %s"
+        self.deleted += [login for (login,) in args]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, deleted):
+        self.deleted = deleted
+        self.commits = 0
+
+    def cursor(self):
+        return RecordingCursor(self.deleted)
+
+    def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def raz(monkeypatch):
+    """Lance raz_eleves_job : `statuses` donne le statut samba-tool de chaque login"""
+    deleted = []
+    batches = []
+
+    @contextmanager
+    def db_connection():
+        yield FakeConnection(deleted)
+
+    def run(usernames, statuses, done=None, chunk_size=50):
+        def run_samba_batch(operations):
+            batches.append([op["target"] for op in operations])
+            return [{"operation": op, "status": statuses[op["target"]], "error": f"{statuses[op['target']]} !"}
+                    for op in operations]
+
+        monkeypatch.setattr(job_handlers, "run_samba_batch", run_samba_batch)
+        monkeypatch.setattr(job_handlers, "db_connection", db_connection)
+        monkeypatch.setattr(job_handlers.config, "JOBS_CHUNK_SIZE", chunk_size, raising=False)
+        ctx = FakeContext(done)
+        return job_handlers.raz_eleves_job(ctx, {"usernames": usernames}), ctx
+    run.deleted = deleted
+    run.batches = batches
+    return run
+
+
+def test_only_samba_deletions_leave_the_table(raz):
+    statuses = {"a.dupont": "ok", "b.martin": "error", "c.durand": "ok", "d.petit": "exists"}
+    result, ctx = raz(list(statuses), statuses, chunk_size=2)
+    assert raz.deleted == ["a.dupont", "c.durand"]
+    assert result["deleted"] == 2 and result["errors"] == 2
+    assert [(login, status) for login, status, _ in ctx.marked] == [
+        ("a.dupont", "ok"), ("b.martin", "error"), ("c.durand", "ok"), ("d.petit", "error"),
+    ]
+
+
+def test_unreachable_accounts_stay_in_the_table(raz):
+    statuses = {"a.dupont": "ok", "b.martin": "unreachable"}
+    with pytest.raises(RuntimeError, match="1 compte"):
+        raz(list(statuses), statuses)
+    assert raz.deleted == ["a.dupont"]
+
+
+def test_resume_skips_accounts_already_deleted(raz):
+    statuses = {"a.dupont": "ok", "b.martin": "ok"}
+    result, _ = raz(list(statuses), statuses, done={"a.dupont": ("ok", None)})
+    assert raz.batches == [["b.martin"]]
+    assert raz.deleted == ["b.martin"]
+    assert result["deleted"] == 2
@@ -0,0 +1,201 @@
+"""
+Tests de l'exécution groupée samba-tool (modules.samba_batch)
+
+L'analyse des marqueurs est vérifiée sur des flux capturés, et le script
+généré est exécuté par le bash local avec un faux samba-tool dans le PATH.
+Pour la reprise des lots, la connexion SSH est remplacée par un faux lot qui
+rejoue un flux de marqueurs et peut couper la connexion en cours de lecture.
+"""
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("paramiko")
+pytest.importorskip("streamlit")
+
+from modules import samba_batch  # noqa: E402
+from modules.samba_batch import (  # noqa: E402
+    build_batch_script, op_add_members, op_create_user, parse_batch_output, run_samba_batch
+)
+
+TOKEN = "__TEST__"
+
+
+def marker_stream(idx, rc=0, out="", err="", started=True, ended=True):
+    """Lignes produites par run_op pour une opération"""
+    lines = [f"{TOKEN} START {idx}"] if started else []
+    if ended:
+        lines += [f"{TOKEN} BEGIN {idx} {rc}", out, f"{TOKEN} STDERR {idx}", err, f"{TOKEN} END {idx}"]
+    return lines
+
+
+class FakeBatches:
+    """Remplace execute_samba_batch : `scenario(indices)` retourne (lignes, exception levée après les lignes)"""
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.calls = []
+
+    def __call__(self, client, operations, sudo_password, on_result=None, indexes=None, on_start=None, **kwargs):
+        self.calls.append(list(indexes))
+        lines, error = self.scenario(list(indexes))
+
+        def stream():
+            yield from lines
+            if error is not None:
+                raise error
+
+        ops_by_index = dict(zip(indexes, operations))
+        return samba_batch.parse_batch_output(stream(), TOKEN, ops_by_index, on_result, on_start)
+
+
+@pytest.fixture
+def fake_ssh(monkeypatch):
+    @contextmanager
+    def ssh_connection(server, username, password):
+        yield object()
+
+    monkeypatch.setattr(samba_batch, "ssh_connection", ssh_connection)
+    monkeypatch.setattr(samba_batch.config, "SAMBA_RETRY_BACKOFF", 0, raising=False)
+
+    def install(scenario):
+        fake = FakeBatches(scenario)
+        monkeypatch.setattr(samba_batch, "execute_samba_batch", fake)
+        return fake
+    return install
+
+
+EXISTS = "ERROR(ldb): Failed to add user: entry already exists"
+MEMBER = "ERROR: Failed to add members ['a.dupont'] to group 'Eleves': a.dupont is already a member of Eleves"
+
+OPERATIONS = {
+    0: op_create_user("a.dupont", "x"),
+    1: op_add_members("Eleves", "a.dupont", requires=0),
+}
+
+
+@pytest.mark.parametrize("lines, expected", [
+    # Sortie et erreurs séparées, lignes vides des marqueurs retirées
+    (marker_stream(0, out="User 'a.dupont' added successfully", err="warning: weak password"),
+     {0: ("ok", "User 'a.dupont' added successfully", "warning: weak password")}),
+    (marker_stream(0, rc=255, err=EXISTS), {0: ("exists", "", EXISTS)}),
+    (marker_stream(1, rc=255, err=MEMBER), {1: ("already_member", "", MEMBER)}),
+    (marker_stream(0, rc=1, out="ligne 1\nligne 2", err="ERROR: LDAP indisponible"),
+     {0: ("error", "ligne 1\nligne 2", "ERROR: LDAP indisponible")}),
+    # requires en échec : l'opération dépendante est marquée SKIP sans START
+    (marker_stream(0, rc=1, err="ERROR: refus") + [f"{TOKEN} SKIP 1"],
+     {0: ("error", "", "ERROR: refus"), 1: ("skipped", "", "Non exécutée (opération préalable en échec)")}),
+    # Lignes hors marqueurs (bannière, fin de ligne \r) ignorées
+    (["Last login: hier"] + [line + "\r\n" for line in marker_stream(0, out="ok")], {0: ("ok", "ok", "")}),
+    # Commencée mais sans END : aucun résultat
+    (marker_stream(0) + marker_stream(1, ended=False), {0: ("ok", "", "")}),
+])
+def test_parse_batch_output(lines, expected):
+    started = []
+    reported = []
+    results = parse_batch_output(lines, TOKEN, OPERATIONS, lambda idx, result: reported.append(idx), started.append)
+    assert {idx: (r["status"], r["output"], r["error"]) for idx, r in results.items()} == expected
+    assert reported == list(expected)
+    assert started == [int(line.split()[2]) for line in lines if line.startswith(f"{TOKEN} START")]
+
+
+FAKE_SAMBA_TOOL = r"""#!/bin/bash
+{ printf '%s\x1f' "$@"; echo; } >> "$SAMBA_TOOL_LOG"
+case "$1 $2 $3" in
+  "user create deja.la") echo "ERROR(ldb): Failed to add user 'deja.la': entry already exists" >&2; exit 255 ;;
+  "user create casse") echo "sortie partielle"; echo "ERROR: LDAP indisponible" >&2; exit 1 ;;
+  "group addmembers Profs") echo "ERROR: b.prof is already a member of Profs" >&2; exit 255 ;;
+esac
+echo "$1 $2 $3 : ok"
+"""
+
+
+@pytest.mark.skipif(shutil.which("bash") is None, reason="bash absent")
+def test_batch_script_under_bash(tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    samba_tool = bin_dir / "samba-tool"
+    samba_tool.write_text(FAKE_SAMBA_TOOL)
+    samba_tool.chmod(0o755)
+    log = tmp_path / "samba-tool.log"
+
+    password = "p@ss word'$(id)`x`"
+    operations = [
+        op_create_user("a.dupont", password, given_name="Alice", surname="Dupont"),
+        op_add_members("Eleves", "a.dupont", requires=10),
+        op_create_user("deja.la", "x"),
+        op_add_members("Eleves", "deja.la", requires=12),
+        op_add_members("Profs", "b.prof"),
+        op_create_user("casse", "x"),
+    ]
+    # Indices globaux d'un lot qui ne commence pas à 0 : `requires` les désigne
+    indexed_ops = list(zip(range(10, 16), operations))
+    script = tmp_path / "batch.sh"
+    script.write_text(build_batch_script(indexed_ops, TOKEN))
+
+    env = {**os.environ, "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}", "SAMBA_TOOL_LOG": str(log)}
+    run = subprocess.run(["bash", str(script)], env=env, capture_output=True, text=True, timeout=30)
+    assert run.returncode == 0, run.stderr
+
+    results = parse_batch_output(run.stdout.splitlines(), TOKEN, dict(indexed_ops))
+    assert {idx: result["status"] for idx, result in results.items()} == {
+        10: "ok", 11: "ok", 12: "exists", 13: "skipped", 14: "already_member", 15: "error",
+    }
+    assert results[10]["output"] == "user create a.dupont : ok"
+    assert results[15]["output"] == "sortie partielle"
+    assert results[15]["error"] == "ERROR: LDAP indisponible"
+
+    # Arguments transmis tels quels (pas d'expansion du mot de passe), opération SKIP non lancée
+    calls = [line.split("\x1f")[:-1] for line in log.read_text().splitlines()]
+    assert calls[0] == ["user", "create", "a.dupont", password, "--given-name=Alice", "--surname=Dupont"]
+    assert [call[:3] for call in calls[1:]] == [
+        ["group", "addmembers", "Eleves"], ["user", "create", "deja.la"],
+        ["group", "addmembers", "Profs"], ["user", "create", "casse"],
+    ]
+
+
+def test_drop_between_ops_keeps_plain_exists(fake_ssh):
+    # Coupure après la première création : la seconde n'a pas commencé, son compte existait déjà
+    def scenario(indexes):
+        if indexes == [0, 1]:
+            return marker_stream(0), EOFError("connexion perdue")
+        return marker_stream(1, rc=255, err=EXISTS), None
+
+    fake = fake_ssh(scenario)
+    results = run_samba_batch([op_create_user("a.dupont", "x"), op_create_user("b.martin", "y")], concurrency=1)
+    assert fake.calls == [[0, 1], [1]]
+    assert results[0]["status"] == "ok"
+    assert results[1]["status"] == "exists" and not results[1].get("retried")
+
+
+def test_drop_during_op_marks_it_retried(fake_ssh):
+    # Coupure pendant la seconde création : elle a pu aboutir avant la coupure
+    def scenario(indexes):
+        if indexes == [0, 1, 2]:
+            return marker_stream(0) + marker_stream(1, ended=False), EOFError("connexion perdue")
+        return marker_stream(1, rc=255, err=EXISTS) + marker_stream(2, rc=255, err=EXISTS), None
+
+    fake_ssh(scenario)
+    operations = [op_create_user("a.dupont", "x"), op_create_user("b.martin", "y"), op_create_user("c.durand", "z")]
+    results = run_samba_batch(operations, concurrency=1)
+    assert results[1]["status"] == "exists" and results[1]["retried"]
+    assert results[2]["status"] == "exists" and not results[2].get("retried")
+
+
+def test_unexpected_error_stays_in_its_chunk(fake_ssh):
+    def scenario(indexes):
+        if indexes[0] == 2:
+            raise OSError("Dépôt du script impossible : disque plein")
+        return sum((marker_stream(idx) for idx in indexes), []), None
+
+    fake_ssh(scenario)
+    operations = []
+    for name in ("a.dupont", "b.martin", "c.durand"):
+        operations.append(op_create_user(name, "x"))
+        operations.append(op_add_members("Eleves", name, requires=len(operations) - 1))
+    results = run_samba_batch(operations, batch_size=2, concurrency=3)
+    assert [result["status"] for result in results] == ["ok", "ok", "error", "error", "ok", "ok"]
+    assert "disque plein" in results[2]["error"]
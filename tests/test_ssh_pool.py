@@ -0,0 +1,101 @@
+"""
+Tests du pool SSH contre le serveur SSH local de ssh_stub_server
+"""
+import threading
+import time
+
+import pytest
+
+paramiko = pytest.importorskip("paramiko")
+
+from modules.ssh_pool import SSHConnectionPool  # noqa: E402
+from ssh_stub_server import StubSSHServer  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def server():
+    with StubSSHServer() as stub:
+        yield stub
+
+
+@pytest.fixture
+def pool():
+    pool = SSHConnectionPool(max_size=2, connect_timeout=5, checkout_timeout=10)
+    yield pool
+    pool.close_all()
+
+
+def run(pool, server, command):
+    with pool.connection("127.0.0.1", server.username, server.password, port=server.port) as client:
+        _, stdout, _ = client.exec_command(command, timeout=5)
+        return stdout.read().decode("utf-8")
+
+
+def wait_closed(client, timeout=5):
+    deadline = time.monotonic() + timeout
+    while client.get_transport().is_active() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def test_connection_reused_between_commands(server, pool):
+    before = server.connections
+    assert [run(pool, server, f"echo {i}") for i in range(5)] == [f"echo {i}" for i in range(5)]
+    assert server.connections - before == 1
+    stats = pool.get_stats()
+    assert (stats['misses'], stats['hits'], stats['idle'], stats['in_use']) == (1, 4, 1, 0)
+
+
+def test_concurrent_checkouts_bounded_by_max_size(server):
+    server.delay = 0.2
+    pool = SSHConnectionPool(max_size=2, connect_timeout=5, checkout_timeout=10)
+    before = server.connections
+    try:
+        threads = [threading.Thread(target=run, args=(pool, server, "sleep")) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.delay = 0.0
+        pool.close_all()
+    assert server.connections - before == 2
+    stats = pool.get_stats()
+    assert stats['misses'] == 2 and stats['hits'] == 4 and stats['waits'] > 0
+
+
+def test_dead_connection_is_replaced(server, pool):
+    run(pool, server, "first")
+    client = pool._idle[("127.0.0.1", server.port, server.username)][0][0]
+    server.drop_connections()
+    wait_closed(client)
+    assert run(pool, server, "second") == "second"
+    stats = pool.get_stats()
+    assert stats['discarded'] == 1 and stats['misses'] == 2
+
+
+def test_idle_connections_evicted(server):
+    pool = SSHConnectionPool(max_size=2, idle_timeout=0, connect_timeout=5)
+    try:
+        run(pool, server, "first")
+        time.sleep(0.01)
+        run(pool, server, "second")
+        stats = pool.get_stats()
+        assert stats['evicted'] == 1 and stats['misses'] == 2
+    finally:
+        pool.close_all()
+
+
+def test_failed_command_discards_connection(server, pool):
+    with pytest.raises(RuntimeError):
+        with pool.connection("127.0.0.1", server.username, server.password, port=server.port):
+            raise RuntimeError("commande interrompue")
+    stats = pool.get_stats()
+    assert stats['discarded'] == 1 and stats['idle'] == 0 and stats['in_use'] == 0
+
+
+def test_bad_password_releases_slot(server, pool):
+    with pytest.raises(paramiko.AuthenticationException):
+        pool.acquire("127.0.0.1", server.username, "mauvais", port=server.port)
+    stats = pool.get_stats()
+    assert stats['connect_errors'] == 1 and stats['in_use'] == 0
+    assert run(pool, server, "ok") == "ok"